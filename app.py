@@ -1,16 +1,105 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response
+from flask import Flask, render_template, stream_template, get_flashed_messages, request, redirect, url_for, flash, session, make_response, g, jsonify
 from weasyprint import HTML, CSS
 import user_manager 
 import data_manager 
 import db_setup
+import assets
+import backup_manager
+import compression
+import import_manager
+import maintenance_manager
+import metrics_manager
+import pagination
+import profiler
+import session_store
+import hashlib
+import io
+import math
 import os
 import json
+import time
 from datetime import datetime, timedelta
 from functools import wraps # Pour la sécurité Admin
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24) 
+# Clé stable entre redémarrages et partagée par les processus ; sessions stockées côté serveur
+app.config['SECRET_KEY'] = session_store.load_secret_key()
+app.session_interface = session_store.ServerSideSessionInterface()
+
+# Rôle relu avant les autres hooks (profilage réservé aux admins)
+@app.before_request
+def refresh_user_role():
+    """Le rôle en session suit celui de la base (à CACHE_TTL près) ; compte supprimé : déconnexion."""
+    user = session.get('user')
+    if not user:
+        return
+    role = session_store.current_role(user['id'], user['role'])
+    if role is None:
+        session.clear()
+    elif role != user['role']:
+        session['user'] = dict(user, role=role)
+
+# Ressources statiques empreintées (voir assets.py) : {{ asset_url('style.css') }}
+app.register_blueprint(assets.blueprint)
+app.jinja_env.globals['asset_url'] = assets.asset_url
+# Construits à chaque démarrage (y compris sous un serveur WSGI) : seuls les fichiers modifiés sont recopiés
+assets.build()
+
+# Compression Brotli/gzip des réponses dynamiques, ETag et 304 pour JSON et PDF
+compression.init_app(app)
+
+# Profilage d'une requête à la demande, réservé aux admins : ?_profile=1 ou en-tête X-Profile
+profiler.init_app(app)
+
+# --- INSTRUMENTATION : DURÉE DES REQUÊTES ---
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    endpoint, method, status = request.endpoint, request.method, response.status_code
+
+    def record():
+        metrics_manager.record_request(endpoint, method, status, time.perf_counter() - start)
+
+    if response.is_streamed:
+        # Template en flux : le rendu a lieu pendant l'envoi du corps, mesuré jusqu'à sa fin
+        response.call_on_close(record)
+    else:
+        record()
+    return response
+
+# --- RENDU EN FLUX DES LISTES ---
+# Taille (caractères) des morceaux envoyés : Jinja produit un fragment par bout de texte ou expression
+STREAM_CHUNK_SIZE = 4096
+
+def _chunked(fragments, size=STREAM_CHUNK_SIZE):
+    buffer, length = [], 0
+    try:
+        for fragment in fragments:
+            buffer.append(fragment)
+            length += len(fragment)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        fragments.close()
+
+def render_streamed(template, **context):
+    """
+    Rendu du template envoyé au fil de l'eau : l'en-tête de la page part avant que les listes
+    (itérateurs data_manager.iter_*) ne soient lues. La session est enregistrée avant le premier
+    octet : les messages flash sont donc retirés ici, le template les relit depuis la requête.
+    """
+    get_flashed_messages(with_categories=True)
+    return _chunked(stream_template(template, **context))
 
 # --- SÉCURITÉ : DÉCORATEUR POUR ADMIN ---
 def admin_required(f):
@@ -52,6 +141,7 @@ def login():
         
         if user:
             # Stocke les infos utilisateur (id, username, role) dans la session
+            session.regenerate()
             session['user'] = user 
             flash(f"Connexion réussie ! Bienvenue {user['username']}.", 'success')
             return redirect(url_for('reception'))
@@ -93,6 +183,15 @@ def reception():
         todays_arrivals=todays_arrivals_list
     )
 
+@app.route('/recherche/clients')
+@login_required
+def search_guests():
+    """Recherche à la frappe (JSON) : séjours, réservations et commandes transférées d'un client."""
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'sejours': [], 'reservations': [], 'commandes': []})
+    return jsonify(data_manager.search_guests(query))
+
 @app.route('/checkin/nouveau', methods=['GET'])
 @login_required
 def show_checkin_form():
@@ -130,9 +229,11 @@ def reservations_page():
         if not all([chambre_id, client_nom, date_debut, date_fin]):
             flash("Tous les champs sont requis pour la réservation.", 'error')
         else:
-            success = data_manager.create_reservation(chambre_id, client_nom, date_debut, date_fin)
-            if success:
+            result = data_manager.create_reservation(chambre_id, client_nom, date_debut, date_fin)
+            if result == data_manager.BOOKING_OK:
                 flash("Réservation créée avec succès !", 'success')
+            elif result == data_manager.BOOKING_CONFLICT:
+                flash("Cette chambre est déjà réservée ou occupée sur cette période.", 'error')
             else:
                 flash("Erreur lors de la création de la réservation.", 'error')
         return redirect(url_for('reservations_page'))
@@ -141,18 +242,95 @@ def reservations_page():
     start_date_default = datetime.now().strftime('%Y-%m-%d')
     end_date_default = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
 
-    available_rooms = data_manager.get_available_rooms_for_period(start_date_default, end_date_default)
-    all_reservations = data_manager.get_all_reservations()
+    available_rooms = data_manager.iter_available_rooms_for_period(start_date_default, end_date_default)
+    room_types = data_manager.get_room_types()
+    quotes = data_manager.quote_stays([(room_type, start_date_default, end_date_default) for room_type in room_types])
+
+    # Liste paginée et filtrée côté serveur
+    filters = {
+        'room_type': request.args.get('type') or None,
+        'date_from': request.args.get('du') or None,
+        'date_to': request.args.get('au') or None,
+        'sort': request.args.get('tri', 'date'),
+    }
+    reservations = data_manager.iter_reservations_page(
+        cursor=request.args.get('apres'), limit=request.args.get('n'), **filters
+    )
 
-    return render_template(
+    return render_streamed(
         'reservations.html',
         user=session['user'],
         available_rooms=available_rooms,
-        reservations=all_reservations,
+        reservations=reservations,
+        filters=filters,
+        room_types=room_types,
+        quotes=quotes,
         start_date_default=start_date_default,
         end_date_default=end_date_default
     )
 
+@app.route('/reservations/tarifs')
+@login_required
+def quote_stays_route():
+    """Devis (JSON) de chaque type de chambre pour les dates saisies, calculé en une seule requête."""
+    date_debut = request.args.get('du', '')
+    date_fin = request.args.get('au', '')
+    try:
+        datetime.strptime(date_debut, '%Y-%m-%d')
+        datetime.strptime(date_fin, '%Y-%m-%d')
+    except ValueError:
+        return jsonify([])
+    return jsonify(data_manager.quote_stays([(room_type, date_debut, date_fin)
+                                             for room_type in data_manager.get_room_types()]))
+
+@app.route('/reservations/groupe', methods=['GET', 'POST'])
+@login_required
+def group_booking_page():
+    """Réservation de groupe : plusieurs chambres de plusieurs types pour les mêmes dates."""
+    room_types = data_manager.get_room_types()
+    form = {
+        'client_nom': request.form.get('client_nom', ''),
+        'date_debut': request.form.get('date_debut') or datetime.now().strftime('%Y-%m-%d'),
+        'date_fin': request.form.get('date_fin') or (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'),
+        'partiel': request.form.get('partiel') == '1',
+    }
+    room_mix = {}
+    for room_type, count in zip(request.form.getlist('type_chambre'), request.form.getlist('nombre')):
+        try:
+            room_mix[room_type] = max(int(count or 0), 0)
+        except ValueError:
+            room_mix[room_type] = 0
+
+    plan = None
+    if request.method == 'POST':
+        if form['date_fin'] <= form['date_debut'] or not any(room_mix.values()):
+            flash("Indiquez des dates valides et au moins une chambre.", 'error')
+        elif request.form.get('action') == 'reserver':
+            if not form['client_nom']:
+                flash("Le nom du groupe est requis pour réserver.", 'error')
+            else:
+                plan = data_manager.create_group_booking(room_mix, form['client_nom'], form['date_debut'],
+                                                         form['date_fin'], allow_partial=form['partiel'])
+                booked = sum(len(rooms) for rooms in plan['allocation'].values())
+                if plan['statut'] == data_manager.BOOKING_OK:
+                    flash(f"{booked} chambre(s) réservée(s) pour {form['client_nom']}.", 'success')
+                    return redirect(url_for('reservations_page'))
+                if plan['statut'] == data_manager.BOOKING_CONFLICT:
+                    flash("Pas assez de chambres libres : aucune réservation n'a été créée.", 'error')
+                else:
+                    flash("Erreur lors de la réservation de groupe.", 'error')
+        else:
+            plan = data_manager.plan_group_booking(room_mix, form['date_debut'], form['date_fin'])
+
+    return render_template(
+        'reservation_groupe.html',
+        user=session['user'],
+        room_types=room_types,
+        room_mix=room_mix,
+        form=form,
+        plan=plan
+    )
+
 @app.route('/reservations/annuler/<int:reservation_id>')
 @login_required
 def cancel_reservation_route(reservation_id):
@@ -176,25 +354,37 @@ def create_checkin():
         flash("Tous les champs sont requis.", 'error')
         return redirect(url_for('show_checkin_form'))
 
-    success = data_manager.create_new_stay(room_id, client_name, checkout_date)
+    result = data_manager.create_new_stay(room_id, client_name, checkout_date)
     
-    if success:
+    if result == data_manager.BOOKING_OK:
         flash(f"Check-in de {client_name} effectué avec succès !", 'success')
+    elif result == data_manager.BOOKING_CONFLICT:
+        flash("Cette chambre est déjà occupée ou réservée par un autre client jusqu'à cette date.", 'error')
     else:
         flash("Erreur lors de la création du séjour.", 'error')
 
     return redirect(url_for('reception'))
 
-@app.route('/facture/<int:stay_id>', methods=['GET'])
-@login_required
-def show_billing(stay_id):
-    """Affiche la page de facturation détaillée pour un séjour."""
-    stay_details = data_manager.get_stay_details(stay_id)
-    if not stay_details:
-        flash("Erreur : Séjour non trouvé ou déjà clôturé.", 'error')
-        return redirect(url_for('reception'))
-    
-    ordered_items = data_manager.get_stay_ordered_items(stay_id)
+def render_pdf(html_out, filename):
+    """
+    Réponse PDF affichée dans le navigateur. L'ETag est l'empreinte du HTML source (état du folio,
+    du ticket ou du service) : un client qui a déjà ce document reçoit un 304 sans rendu WeasyPrint.
+    """
+    etag = hashlib.sha256(html_out.encode('utf-8')).hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        metrics_manager.increment('hotelpos_http_not_modified_total', {'mimetype': 'application/pdf'})
+        response = make_response('', 304)
+    else:
+        # Créer le PDF en mémoire
+        response = make_response(HTML(string=html_out).write_pdf())
+        response.headers['Content-Type'] = 'application/pdf'
+        response.headers['Content-Disposition'] = f'inline; filename={filename}'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def compute_invoice(stay_details):
+    """Calcule les nuits facturées et les montants d'un séjour (check-out maintenant)."""
     # Le solde actuel contient déjà le coût des services transférés
     cost_services = stay_details['solde_actuel'] 
 
@@ -210,79 +400,82 @@ def show_billing(stay_id):
     if num_nights == 0:
         num_nights = 1
     
-    cost_room_stay = num_nights * stay_details['prix_nuit']
+    # Prix de chaque nuit selon le calendrier tarifaire (week-end, saison...), à défaut prix_nuit
+    cost_room_stay = data_manager.get_stay_room_cost(stay_details['type_chambre'], stay_details['prix_nuit'],
+                                                     checkin_dt.strftime('%Y-%m-%d'), num_nights)
     
     # Le total est l'hébergement + les services déjà transférés (solde_actuel)
-    total_bill = cost_room_stay + cost_services
+    return {
+        'checkin_date': checkin_dt,
+        'checkout_date': checkout_dt_now,
+        'num_nights': num_nights,
+        'cost_room_stay': cost_room_stay,
+        'average_rate': cost_room_stay / num_nights,
+        'cost_services': cost_services,
+        'total_bill': cost_room_stay + cost_services,
+    }
+
+@app.route('/facture/<int:stay_id>', methods=['GET'])
+@login_required
+def show_billing(stay_id):
+    """Affiche la page de facturation d'un séjour : consommations regroupées, détail à la demande."""
+    stay_details = data_manager.get_stay_details(stay_id)
+    if not stay_details:
+        flash("Erreur : Séjour non trouvé ou déjà clôturé.", 'error')
+        return redirect(url_for('reception'))
+
+    group_by = request.args.get('regroupement', 'produit')
+    if group_by not in data_manager.FOLIO_GROUPINGS:
+        group_by = 'produit'
 
     return render_template(
         'facture.html',
         user=session['user'],
         stay=stay_details,
-        ordered_items=ordered_items,
-        checkin_date=checkin_dt,
-        checkout_date=checkout_dt_now,
-        num_nights=num_nights,
-        cost_room_stay=cost_room_stay,
-        cost_services=cost_services,
-        total_bill=total_bill
+        folio=data_manager.get_stay_folio_summary(stay_id, group_by),
+        group_by=group_by,
+        **compute_invoice(stay_details)
     )
 
+@app.route('/facture/<int:stay_id>/detail')
+@login_required
+def billing_detail(stay_id):
+    """Détail des consommations (JSON), page par page : ?apres=<curseur>&n=<taille>."""
+    page = data_manager.get_stay_folio_page(stay_id, request.args.get('apres'),
+                                            request.args.get('n', pagination.PAGE_SIZE))
+    return jsonify(page)
+
 @app.route('/facture/pdf/<int:stay_id>', methods=['GET'])
 @login_required
 def generate_invoice_pdf(stay_id):
-    """Génère la facture en PDF pour un séjour."""
+    """Génère la facture récapitulative en PDF (?annexe=1 : détail des consommations en annexe)."""
     stay_details = data_manager.get_stay_details(stay_id)
     if not stay_details:
         flash("Erreur : Séjour non trouvé.", 'error')
         return redirect(url_for('reception'))
 
-    ordered_items = data_manager.get_stay_ordered_items(stay_id)
-    cost_services = stay_details['solde_actuel']
-
-    checkin_dt = datetime.strptime(stay_details['date_checkin'], '%Y-%m-%d %H:%M:%S')
-    checkout_dt_now = datetime.now()
-
-    duration = checkout_dt_now - checkin_dt
-    num_nights = duration.days
-
-    if duration.seconds > 3600:
-        num_nights += 1
-    if num_nights == 0:
-        num_nights = 1
-
-    cost_room_stay = num_nights * stay_details['prix_nuit']
-    total_bill = cost_room_stay + cost_services
+    with_annex = request.args.get('annexe') == '1'
 
     # Rendre le template HTML avec les données
     html_out = render_template(
         'facture_pdf_a4.html',
         stay=stay_details,
-        ordered_items=ordered_items,
-        checkin_date=checkin_dt,
-        checkout_date=checkout_dt_now,
-        num_nights=num_nights,
-        cost_room_stay=cost_room_stay,
-        cost_services=cost_services,
-        total_bill=total_bill
+        folio=data_manager.get_stay_folio_summary(stay_id, 'produit'),
+        annex_items=data_manager.get_stay_ordered_items(stay_id) if with_annex else None,
+        **compute_invoice(stay_details)
     )
 
-    # Créer le PDF en mémoire
-    pdf = HTML(string=html_out).write_pdf()
-
-    # Créer une réponse HTTP avec le PDF
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'inline; filename=Facture_{stay_details["client_nom"]}.pdf'
-
-    return response
+    return render_pdf(html_out, f'Facture_{stay_details["client_nom"]}.pdf')
 
 @app.route('/checkout/confirmer/<int:stay_id>', methods=['POST'])
 @login_required
 def confirm_checkout(stay_id):
     """Traite la confirmation du check-out et marque le séjour comme 'Clos'."""
-    total_bill_paid = request.form['total_bill']
-    
+    total_bill_paid = _parse_amount(request.form.get('total_bill'))
+    if total_bill_paid is None or not math.isfinite(total_bill_paid) or total_bill_paid < 0:
+        flash("Montant de la facture finale invalide.", 'error')
+        return redirect(url_for('show_billing', stay_id=stay_id))
+
     success = data_manager.perform_checkout(stay_id, total_bill_paid)
     
     if success:
@@ -302,12 +495,14 @@ def pos_interface():
     """Affiche l'interface principale du POS."""
     products = data_manager.get_all_products()
     active_stays = data_manager.get_active_stays()
+    shift_id = data_manager.get_open_shift_id(session['user']['id'])
     
     return render_template(
         'pos.html',
         user=session['user'],
         products=products,
-        active_stays=active_stays
+        active_stays=active_stays,
+        shift=data_manager.get_shift_report(shift_id) if shift_id else None
     )
 
 @app.route('/pos/submit', methods=['POST'])
@@ -360,6 +555,12 @@ def submit_pos_order():
     
     return redirect(url_for('pos_interface'))
 
+def render_ticket_pdf(template, filename, **context):
+    """Rend un ticket 80 mm (template HTML) en PDF affiché dans le navigateur."""
+    # Rendre le template HTML avec les données
+    html_out = render_template(template, datetime=datetime, **context)
+    return render_pdf(html_out, filename)
+
 @app.route('/pos/ticket/<int:order_id>')
 @login_required
 def generate_pos_ticket_pdf(order_id):
@@ -370,22 +571,52 @@ def generate_pos_ticket_pdf(order_id):
         flash("Commande non trouvée.", 'error')
         return redirect(url_for('pos_interface'))
 
-    # Rendre le template HTML avec les données
-    html_out = render_template(
-        'ticket_pos_80mm.html',
-        order_details=order_details,
-        datetime=datetime # Fournir le module datetime au template
-    )
+    return render_ticket_pdf('ticket_pos_80mm.html', f'Ticket_{order_id}.pdf', order_details=order_details)
 
-    # Créer le PDF en mémoire
-    pdf = HTML(string=html_out).write_pdf()
+# --- Services de caisse (rapport Z) ---
 
-    # Créer une réponse HTTP
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'inline; filename=Ticket_{order_id}.pdf'
+def _parse_amount(value):
+    """Montant saisi dans un formulaire ('12 500', '12500,5'), ou None si vide ou invalide."""
+    try:
+        return float((value or '').replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return None
 
-    return response
+@app.route('/pos/service/ouvrir', methods=['POST'])
+@login_required
+def open_shift_route():
+    """Ouvre le service de caisse du caissier connecté avec son fond de caisse."""
+    if data_manager.open_shift(session['user']['id'], _parse_amount(request.form.get('fond_initial')) or 0) is None:
+        flash("Erreur lors de l'ouverture du service de caisse.", 'error')
+    else:
+        flash("Service de caisse ouvert.", 'success')
+    return redirect(url_for('pos_interface'))
+
+@app.route('/pos/service/cloturer', methods=['POST'])
+@login_required
+def close_shift_route():
+    """Clôture le service du caissier connecté et affiche son rapport Z."""
+    shift_id = data_manager.get_open_shift_id(session['user']['id'])
+    if not shift_id or not data_manager.close_shift(shift_id, _parse_amount(request.form.get('especes_comptees'))):
+        flash("Aucun service de caisse ouvert.", 'error')
+        return redirect(url_for('pos_interface'))
+    z_link = url_for('shift_z_report_pdf', shift_id=shift_id)
+    flash(f"""
+        Service N°{shift_id} clôturé.
+        <a href='{z_link}' target='_blank' class='print-ticket-link'>Imprimer le rapport Z</a>
+    """, 'success')
+    return redirect(url_for('pos_interface'))
+
+@app.route('/pos/service/<int:shift_id>/z')
+@login_required
+def shift_z_report_pdf(shift_id):
+    """Rapport Z d'un service en PDF (ticket 80 mm) : le caissier pour son service, l'admin pour tous."""
+    report = data_manager.get_shift_report(shift_id)
+    if not report or (report['service']['utilisateur_id'] != session['user']['id']
+                      and session['user']['role'] != 'Admin'):
+        flash("Service de caisse non trouvé.", 'error')
+        return redirect(url_for('pos_interface'))
+    return render_ticket_pdf('ticket_z_80mm.html', f'Rapport_Z_{shift_id}.pdf', report=report)
 
 # ----------------------------------------------------------------------
 # --- MODULE : ADMINISTRATION ---
@@ -395,16 +626,29 @@ def generate_pos_ticket_pdf(order_id):
 @admin_required # Sécurité ! Seul un admin peut voir cette page
 def admin_dashboard():
     """Affiche le panneau d'administration pour gérer chambres, produits et utilisateurs."""
-    all_rooms = data_manager.get_all_rooms()
-    all_products = data_manager.get_all_products()
-    all_users = user_manager.get_all_users() # Récupère les utilisateurs
+    # Chaque liste est paginée indépendamment (pagination par clé)
+    filters = {
+        'room_type': request.args.get('type_chambre') or None,
+        'categorie': request.args.get('categorie') or None,
+        'role': request.args.get('role') or None,
+    }
+    rooms_page = data_manager.iter_rooms_page(request.args.get('chambres_apres'), room_type=filters['room_type'])
+    products_page = data_manager.iter_products_page(request.args.get('produits_apres'), categorie=filters['categorie'])
+    users_page = user_manager.get_users_page(request.args.get('utilisateurs_apres'), role=filters['role'])
     
-    return render_template(
+    return render_streamed(
         'admin.html',
         user=session['user'],
-        all_rooms=all_rooms,
-        all_products=all_products,
-        all_users=all_users # Passe les utilisateurs au template
+        rooms_page=rooms_page,
+        products_page=products_page,
+        users_page=users_page,
+        filters=filters,
+        room_types=data_manager.get_room_types(),
+        categories=data_manager.get_product_categories(),
+        backups=backup_manager.list_backups()[:5],
+        backup_running=backup_manager.is_backup_running(),
+        rates=data_manager.get_upcoming_rates(),
+        shifts=data_manager.get_recent_shifts(10)
     )
 
 # --- Routes Chambres ---
@@ -589,6 +833,7 @@ def reporting_page():
     end_date_default = today.strftime('%Y-%m-%d')
 
     report_data = None
+    occupancy_data = None
 
     if request.method == 'POST':
         start_date = request.form.get('start_date')
@@ -598,26 +843,192 @@ def reporting_page():
             flash("Veuillez sélectionner une date de début et de fin.", 'error')
         else:
             report_data = data_manager.get_sales_report(start_date, end_date)
+            occupancy_data = data_manager.get_occupancy_report(start_date, end_date)
 
     return render_template(
         'reporting.html',
         user=session['user'],
         start_date=start_date_default if request.method == 'GET' else start_date,
         end_date=end_date_default if request.method == 'GET' else end_date,
-        report=report_data
+        report=report_data,
+        occupancy=occupancy_data
     )
 
+@app.route('/admin/reporting/series')
+@admin_required
+def reporting_series():
+    """Séries JSON pour les graphiques : ?du=&au=&pas=heure|jour|semaine|mois&par=mode|categorie."""
+    today = datetime.now()
+    start_date = request.args.get('du') or (today - timedelta(days=29)).strftime('%Y-%m-%d')
+    end_date = request.args.get('au') or today.strftime('%Y-%m-%d')
+    series = data_manager.get_revenue_series(start_date, end_date,
+                                             request.args.get('pas', 'jour'),
+                                             request.args.get('par', 'mode'))
+    if series is None:
+        return jsonify({'erreur': "Paramètres de période, de pas ou de ventilation invalides."}), 400
+    return jsonify(series)
+
+# --- Routes Calendrier Tarifaire ---
+
+@app.route('/admin/tarifs', methods=['POST'])
+@admin_required
+def admin_set_rate():
+    """Fixe le prix d'un type de chambre sur une période (tous les jours ou les week-ends seulement)."""
+    type_chambre = request.form.get('type_chambre')
+    date_debut = request.form.get('date_debut')
+    date_fin = request.form.get('date_fin')
+    try:
+        prix = float(request.form.get('prix', ''))
+    except ValueError:
+        prix = None
+    if not all([type_chambre, date_debut, date_fin]) or prix is None:
+        flash("Type, période et prix sont requis.", 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    weekdays = data_manager.WEEKEND_NIGHTS if request.form.get('jours') == 'weekend' else None
+    nights = data_manager.set_rate(type_chambre, date_debut, date_fin, prix, weekdays,
+                                   request.form.get('libelle') or None)
+    if nights is None:
+        flash("Erreur : période ou prix invalide.", 'error')
+    else:
+        flash(f"Tarif appliqué à {nights} nuit(s) ({type_chambre}).", 'success')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/tarifs/supprimer', methods=['POST'])
+@admin_required
+def admin_clear_rates():
+    """Rétablit le prix de base d'un type de chambre sur les nuits d'une ligne du calendrier."""
+    try:
+        last_night = datetime.strptime(request.form.get('derniere_nuit', ''), '%Y-%m-%d')
+        prix = float(request.form.get('prix', ''))
+    except ValueError:
+        flash("Erreur : tarif à supprimer invalide.", 'error')
+        return redirect(url_for('admin_dashboard'))
+    nights = data_manager.clear_rates(request.form.get('type_chambre'), request.form.get('date_debut'),
+                                      (last_night + timedelta(days=1)).strftime('%Y-%m-%d'), prix)
+    if nights is None:
+        flash("Erreur lors de la suppression des tarifs.", 'error')
+    else:
+        flash(f"{nights} nuit(s) revenue(s) au prix de base.", 'success')
+    return redirect(url_for('admin_dashboard'))
+
+# --- Route Import CSV ---
+
+@app.route('/admin/import', methods=['POST'])
+@admin_required
+def admin_import():
+    """Importe un fichier CSV (chambres, produits ou réservations) et rapporte les lignes rejetées."""
+    kind = request.form.get('type_import')
+    upload = request.files.get('fichier')
+    if kind not in import_manager.IMPORTERS or not upload or not upload.filename:
+        flash("Veuillez choisir un type d'import et un fichier CSV.", 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    # Lecture en flux : le fichier n'est jamais chargé entièrement en mémoire
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    result = import_manager.import_csv(kind, lines,
+                                       all_or_nothing=request.form.get('tout_ou_rien') == '1',
+                                       dry_run=request.form.get('simulation') == '1')
+    if result is None:
+        flash("Erreur : fichier illisible (CSV en UTF-8 attendu).", 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    if result['annule']:
+        flash(f"Import annulé : {result['importees']} ligne(s) valide(s), {result['nb_erreurs']} erreur(s). "
+              "Aucune donnée n'a été modifiée.", 'error' if result['nb_erreurs'] else 'success')
+    else:
+        flash(f"{result['importees']} ligne(s) importée(s), {result['nb_erreurs']} ligne(s) rejetée(s).",
+              'success' if not result['nb_erreurs'] else 'error')
+    for line, message in result['erreurs'][:20]:
+        flash(f"Ligne {line} : {message}", 'error')
+    if result['nb_erreurs'] > 20:
+        flash(f"... et {result['nb_erreurs'] - 20} autre(s) erreur(s).", 'error')
+    return redirect(url_for('admin_dashboard'))
+
+# --- Route Sauvegarde ---
+
+@app.route('/admin/sauvegarde', methods=['POST'])
+@admin_required
+def admin_backup():
+    """Lance une sauvegarde à chaud en arrière-plan (copie progressive puis vérification)."""
+    if backup_manager.start_backup_in_background():
+        flash("Sauvegarde lancée. Elle apparaîtra dans la liste une fois vérifiée.", 'success')
+    else:
+        flash("Une sauvegarde est déjà en cours.", 'error')
+    return redirect(url_for('admin_dashboard'))
+
+# --- Route Métriques ---
+
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Expose les histogrammes de durée (routes et requêtes SQL) au format Prometheus."""
+    response = make_response(metrics_manager.render_prometheus())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+# --- Routes Profils ---
+
+@app.route('/admin/profils')
+@admin_required
+def admin_profiles():
+    """Liste les requêtes profilées (?_profile=1), les plus récentes en premier."""
+    return render_template('profils.html', user=session['user'], profiles=profiler.list_profiles(),
+                           profile=None)
+
+@app.route('/admin/profils/<nom>')
+@admin_required
+def admin_profile(nom):
+    """Affiche le flame graph d'une requête profilée et son temps par catégorie."""
+    profile = profiler.load_profile(nom)
+    if profile is None:
+        flash("Profil introuvable.", 'error')
+        return redirect(url_for('admin_profiles'))
+    return render_template('profils.html', user=session['user'], profiles=None, profile=profile,
+                           rects=profiler.flame_graph(profile))
+
+@app.route('/admin/profils/<nom>.txt')
+@admin_required
+def admin_profile_download(nom):
+    """Télécharge les piles au format replié (flamegraph.pl, speedscope)."""
+    profile = profiler.load_profile(nom)
+    if profile is None:
+        flash("Profil introuvable.", 'error')
+        return redirect(url_for('admin_profiles'))
+    response = make_response(profiler.collapsed_stacks(profile))
+    response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+    response.headers['Content-Disposition'] = f'attachment; filename=profil_{nom}.txt'
+    return response
+
 # ----------------------------------------------------------------------
 # --- DÉMARRAGE DE L'APPLICATION ---
 # ----------------------------------------------------------------------
 
+def start_background_services():
+    """
+    Démarre les threads de fond du processus qui sert les requêtes : écritures regroupées par
+    un rédacteur unique (désactivable : HOTEL_POS_WRITE_QUEUE=0) et maintenance SQLite
+    quotidienne en heures creuses (désactivable : HOTEL_POS_MAINTENANCE=0). À appeler une fois par
+    processus serveur, jamais à l'import : scripts et processus de rechargement n'en ont pas
+    besoin. Sous un serveur WSGI, depuis son hook de démarrage d'un worker (gunicorn :
+    post_worker_init) ; chaque worker a alors son rédacteur, SQLite sérialise les lots entre eux.
+    """
+    if os.environ.get('HOTEL_POS_WRITE_QUEUE', '1') == '1':
+        data_manager.start_write_queue()
+    if os.environ.get('HOTEL_POS_MAINTENANCE', '1') == '1':
+        maintenance_manager.start_scheduler()
+
 if __name__ == '__main__':
     # S'assure que la base de données et les tables sont créées au démarrage
     db_setup.create_database()
 
     # Vérifie et crée l'utilisateur 'admin' si nécessaire
     user_manager.check_for_admin_and_setup()
-    
+
+    # Le rechargeur (debug) relance ce script dans un processus enfant : seul celui-ci sert les requêtes
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+
     # Lance le serveur web
     print("Serveur démarré. Ouvrez http://127.0.0.1:5000/ dans votre navigateur.")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,163 @@
+# archive_manager.py
+"""
+Archivage chaud/froid : déplace les séjours clos et les commandes historiques plus
+anciens que l'horizon configuré vers la base d'archives (data_manager.ARCHIVE_DATABASE_NAME),
+y compris les ventes directes des bases POS par point de vente.
+
+    python archive_manager.py [--jours 365]
+"""
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import data_manager
+
+# Horizon par défaut : tout ce qui est clos depuis plus d'un an part en archive
+ARCHIVE_HORIZON_DAYS = 365
+
+def ensure_archive_schema(conn):
+    """Recrée dans la base 'archive' les tables archivées et leurs index, à l'identique de 'main'."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive.archive_meta (
+            cle TEXT PRIMARY KEY,
+            valeur TEXT NOT NULL
+        )
+    """)
+    data_manager.copy_table_schema(conn, 'archive', data_manager.ARCHIVED_TABLES)
+
+def archive_closed_stays(horizon_days=ARCHIVE_HORIZON_DAYS):
+    """
+    Déplace vers l'archive les séjours clos avant l'horizon, leurs commandes transférées,
+    les ventes directes antérieures à l'horizon, ainsi que leurs lignes et paiements, puis
+    les ventes directes des bases POS par point de vente (voir archive_pos_shard).
+    Retourne le nombre de lignes déplacées par table, ou None en cas d'erreur.
+    """
+    cutoff = (datetime.now() - timedelta(days=horizon_days)).strftime('%Y-%m-%d 00:00:00')
+
+    conn = data_manager.get_db_connection()
+    conn.isolation_level = None  # Transactions gérées explicitement
+    cursor = conn.cursor()
+    moved = {}
+    try:
+        cursor.execute("ATTACH DATABASE ? AS archive", (data_manager.ARCHIVE_DATABASE_NAME,))
+        cursor.execute("BEGIN IMMEDIATE")
+        ensure_archive_schema(conn)
+
+        cursor.execute("CREATE TEMP TABLE archive_sejours (id INTEGER PRIMARY KEY)")
+        cursor.execute("""
+            INSERT INTO archive_sejours
+            SELECT id FROM main.sejours WHERE statut = 'Clos' AND date_checkout_reelle < ?
+        """, (cutoff,))
+        cursor.execute("CREATE TEMP TABLE archive_commandes (id INTEGER PRIMARY KEY)")
+        cursor.execute("""
+            INSERT INTO archive_commandes
+            SELECT cv.id FROM main.commandes_ventes cv JOIN archive_sejours a ON cv.stay_id = a.id
+            UNION
+            SELECT id FROM main.commandes_ventes
+            WHERE statut_paiement = 'Payé' AND stay_id IS NULL AND date_heure < ?
+        """, (cutoff,))
+
+        # Copie puis suppression : INSERT OR REPLACE rend une reprise après incident idempotente
+        copies = [
+            ('sejours', "id IN (SELECT id FROM archive_sejours)"),
+            ('commandes_ventes', "id IN (SELECT id FROM archive_commandes)"),
+            ('lignes_commande', "commande_id IN (SELECT id FROM archive_commandes)"),
+            ('paiements', "commande_id IN (SELECT id FROM archive_commandes)"),
+        ]
+        for table, condition in copies:
+            cursor.execute(f"INSERT OR REPLACE INTO archive.{table} SELECT * FROM main.{table} WHERE {condition}")
+        for table, condition in reversed(copies):
+            cursor.execute(f"DELETE FROM main.{table} WHERE {condition}")
+            moved[table] = cursor.rowcount
+
+        # Le trigger de suppression a retiré ces séjours de l'index de recherche : ils y sont remis,
+        # la recherche de clients (data_manager.search_guests) couvre aussi l'archive
+        cursor.execute("""
+            INSERT INTO main.recherche_clients (rowid, client_nom)
+            SELECT id * 2, client_nom FROM archive.sejours WHERE id IN (SELECT id FROM archive_sejours)
+        """)
+
+        current_limit = data_manager.get_archive_limit(conn)
+        if current_limit is None or cutoff > current_limit:
+            cursor.execute("INSERT OR REPLACE INTO archive.archive_meta (cle, valeur) VALUES ('limite', ?)", (cutoff,))
+
+        cursor.execute("COMMIT")
+        shard_files = _pos_shard_files(conn)
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        print(f"Erreur lors de l'archivage : {e}")
+        return None
+    finally:
+        conn.close()
+
+    for path in shard_files:
+        shard_moved = archive_pos_shard(path, cutoff)
+        if shard_moved is None:
+            return None
+        for table, count in shard_moved.items():
+            moved[table] = moved.get(table, 0) + count
+    return moved
+
+def _pos_shard_files(conn):
+    try:
+        rows = conn.execute("SELECT fichier FROM main.points_de_vente ORDER BY id").fetchall()
+    except sqlite3.Error:
+        return []  # Base antérieure aux points de vente
+    return [row['fichier'] for row in rows if os.path.exists(row['fichier'])]
+
+def archive_pos_shard(path, cutoff):
+    """
+    Déplace vers l'archive les ventes directes d'une base POS (data_manager.get_pos_shard)
+    antérieures à `cutoff`, avec leurs lignes et paiements. Une base à la fois : le nombre de
+    bases attachées à une connexion est limité. Les identifiants des points de vente sont
+    disjoints, les lignes gardent donc le leur dans l'archive. Le schéma de l'archive est déjà
+    créé par archive_closed_stays. Retourne le nombre de lignes déplacées par table, ou None.
+    """
+    conn = data_manager.get_db_connection(path)
+    conn.isolation_level = None  # Transactions gérées explicitement
+    cursor = conn.cursor()
+    moved = {}
+    try:
+        cursor.execute("ATTACH DATABASE ? AS archive", (data_manager.ARCHIVE_DATABASE_NAME,))
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("CREATE TEMP TABLE archive_commandes (id INTEGER PRIMARY KEY)")
+        cursor.execute("""
+            INSERT INTO archive_commandes
+            SELECT id FROM main.commandes_ventes
+            WHERE statut_paiement = 'Payé' AND stay_id IS NULL AND date_heure < ?
+        """, (cutoff,))
+
+        copies = [
+            ('commandes_ventes', "id IN (SELECT id FROM archive_commandes)"),
+            ('lignes_commande', "commande_id IN (SELECT id FROM archive_commandes)"),
+            ('paiements', "commande_id IN (SELECT id FROM archive_commandes)"),
+        ]
+        for table, condition in copies:
+            cursor.execute(f"INSERT OR REPLACE INTO archive.{table} SELECT * FROM main.{table} WHERE {condition}")
+        for table, condition in reversed(copies):
+            cursor.execute(f"DELETE FROM main.{table} WHERE {condition}")
+            moved[table] = cursor.rowcount
+
+        cursor.execute("COMMIT")
+        return moved
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        print(f"Erreur lors de l'archivage de la base POS {path} : {e}")
+        return None
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive les séjours clos et commandes historiques.")
+    parser.add_argument('--jours', type=int, default=ARCHIVE_HORIZON_DAYS,
+                        help="Horizon en jours : seules les données plus anciennes sont archivées.")
+    args = parser.parse_args()
+
+    result = archive_closed_stays(args.jours)
+    if result is None:
+        raise SystemExit(1)
+    for table, count in result.items():
+        print(f"{table} : {count} ligne(s) archivée(s)")
@@ -0,0 +1,167 @@
+# assets.py
+"""
+Ressources statiques : bibliothèques tierces hébergées localement, noms empreintés
+(hash du contenu) et variantes précompressées gzip / Brotli.
+
+    python assets.py vendor   # télécharge les bibliothèques tierces dans static/vendor/
+    python assets.py build    # génère static/build/ (fichiers empreintés, .gz, .br, manifest.json)
+
+Les deux étapes font partie de l'installation (python db_setup.py) ; build() est aussi exécuté
+à l'import de app.py, y compris sous un serveur WSGI.
+
+Les fichiers de static/build/ ne changent jamais de contenu sous un même nom : ils sont
+servis par /assets/ avec un cache navigateur d'un an ('immutable').
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import urllib.request
+
+import brotli
+from flask import Blueprint, abort, request, send_from_directory, url_for
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'build')
+MANIFEST_PATH = os.path.join(BUILD_DIR, 'manifest.json')
+
+# Bibliothèques tierces : chemin local (sous static/) -> source officielle (version figée)
+VENDOR_ASSETS = {
+    'vendor/chart.umd.min.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js',
+}
+
+# Seuls ces types valent la peine d'être précompressés
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+# --- CONSTRUCTION ---
+def vendor(missing_only=False):
+    """
+    Télécharge les bibliothèques tierces (seulement celles absentes si `missing_only`).
+    Retourne False si l'une d'elles a échoué.
+    """
+    ok = True
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(STATIC_DIR, path)
+        if missing_only and os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response, open(target + '.tmp', 'wb') as f:
+                shutil.copyfileobj(response, f)
+            os.replace(target + '.tmp', target)
+            print(f"{path} : téléchargé depuis {url}")
+        except OSError as e:
+            print(f"Erreur lors du téléchargement de {url} : {e}")
+            ok = False
+    return ok
+
+def _write_atomic(path, content):
+    # Plusieurs processus peuvent construire en même temps : un fichier n'apparaît que complet
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+def _fingerprinted_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    base, ext = os.path.splitext(path)
+    return f"{base}.{digest}{ext}"
+
+def build():
+    """
+    Copie chaque fichier de static/ (hors build/) sous un nom empreinté, avec ses variantes
+    .gz et .br, puis écrit le manifeste {chemin d'origine: chemin empreinté}.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(STATIC_DIR):
+        if os.path.abspath(root) == BUILD_DIR:
+            dirs[:] = []
+            continue
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != BUILD_DIR]
+        for name in files:
+            if name.endswith('.tmp'):
+                continue
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, STATIC_DIR).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            built = _fingerprinted_name(path, content)
+            manifest[path] = built
+
+            target = os.path.join(BUILD_DIR, built)
+            if os.path.exists(target):
+                continue  # Même contenu, déjà construit
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if path.endswith(COMPRESSIBLE_EXTENSIONS):
+                # Variantes d'abord : le fichier empreinté signale une construction complète
+                _write_atomic(target + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+                _write_atomic(target + '.br', brotli.compress(content, quality=11))
+            _write_atomic(target, content)
+
+    missing = [path for path in VENDOR_ASSETS if path not in manifest]
+    if missing:
+        print(f"Avertissement : {', '.join(missing)} absent(s), servi(s) depuis le CDN : lancer 'python assets.py vendor'.")
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    _write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    _manifest.clear()
+    return manifest
+
+# --- UTILISATION DANS L'APPLICATION ---
+_manifest = {}
+
+def _load_manifest():
+    if not _manifest and os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            _manifest.update(json.load(f))
+    return _manifest
+
+def asset_url(path):
+    """
+    URL d'une ressource pour les templates : version empreintée si elle a été construite,
+    sinon le fichier de static/, et pour une bibliothèque tierce non encore téléchargée,
+    sa source d'origine (le site reste fonctionnel avant `python assets.py vendor`).
+    """
+    built = _load_manifest().get(path)
+    if built:
+        return url_for('assets.serve', filename=built)
+    if path in VENDOR_ASSETS and not os.path.exists(os.path.join(STATIC_DIR, path)):
+        return VENDOR_ASSETS[path]
+    return url_for('static', filename=path)
+
+blueprint = Blueprint('assets', __name__)
+
+@blueprint.route('/assets/<path:filename>')
+def serve(filename):
+    """Sert un fichier empreinté, dans la meilleure variante précompressée acceptée."""
+    if filename.endswith(('.gz', '.br')) or filename == 'manifest.json':
+        abort(404)
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(BUILD_DIR, filename + suffix)):
+            response = send_from_directory(BUILD_DIR, filename + suffix, mimetype=_mimetype(filename))
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(BUILD_DIR, filename)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+    return response
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ressources statiques HotelPOS.")
+    parser.add_argument('command', choices=['vendor', 'build'])
+    args = parser.parse_args()
+
+    if args.command == 'vendor':
+        sys.exit(0 if vendor() else 1)
+    result = build()
+    print(f"{len(result)} ressource(s) construite(s) dans {BUILD_DIR}")
@@ -0,0 +1,181 @@
+# backup_manager.py
+"""
+Sauvegardes à chaud par l'API de sauvegarde en ligne de SQLite : les pages sont copiées
+par petits lots, avec une pause entre deux lots, sans jamais bloquer les caisses.
+Chaque sauvegarde est vérifiée (PRAGMA integrity_check) avant d'être conservée ;
+seules les BACKUP_RETENTION plus récentes sont gardées.
+
+    python backup_manager.py sauvegarder [--garder 14]
+    python backup_manager.py lister
+    python backup_manager.py verifier <dossier>
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import data_manager
+import metrics_manager
+
+BACKUP_DIR = 'sauvegardes'
+BACKUP_RETENTION = 14
+
+# Pages copiées par étape, puis pause (secondes) pour laisser passer les écritures
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+# Reprises tolérées (base modifiée pendant la copie) avant de copier en une seule étape
+MAX_RESTARTS = 3
+
+_backup_lock = threading.Lock()
+
+class _TooManyRestarts(Exception):
+    pass
+
+def _copy_database(source_path, target_path, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """
+    Copie en ligne `source_path` vers `target_path`. Chaque étape ne tient qu'un verrou
+    de lecture ; si la base est modifiée entre deux étapes, SQLite reprend la copie
+    pour que le résultat reste cohérent. Si les écritures la font reprendre trop souvent,
+    la copie est refaite en une seule étape : en mode WAL, la lecture ne bloque pas les écritures.
+    """
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = data_manager.get_db_connection(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            source.backup(target, pages=-1)
+        # La copie hérite du mode WAL de la source : un fichier unique est plus simple à restaurer
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+def check_integrity(path):
+    """Retourne la liste des problèmes signalés par PRAGMA integrity_check (vide si intègre)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    problems = [row[0] for row in rows]
+    return [] if problems == ['ok'] else problems
+
+def create_backup(target_dir=BACKUP_DIR, keep=BACKUP_RETENTION, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """
+    Sauvegarde toutes les bases dans un nouveau dossier horodaté de `target_dir`, vérifie
+    chaque copie puis supprime les sauvegardes les plus anciennes au-delà de `keep`.
+    Retourne le chemin du dossier, ou None si la sauvegarde a échoué (rien n'est conservé).
+    """
+    if not _backup_lock.acquire(blocking=False):
+        print("Une sauvegarde est déjà en cours.")
+        return None
+    name = datetime.now().strftime('%Y%m%d-%H%M%S')
+    final_dir = os.path.join(target_dir, name)
+    work_dir = final_dir + '.tmp'
+    start = time.perf_counter()
+    try:
+        os.makedirs(work_dir, exist_ok=True)
+        for database in data_manager.list_database_files():
+            target = os.path.join(work_dir, os.path.basename(database))
+            _copy_database(database, target, pages, pause)
+            problems = check_integrity(target)
+            if problems:
+                print(f"Erreur : la copie de {database} n'est pas intègre : {problems[:5]}")
+                shutil.rmtree(work_dir, ignore_errors=True)
+                return None
+        os.replace(work_dir, final_dir)  # Un dossier sans suffixe .tmp est complet et vérifié
+    except (sqlite3.Error, OSError) as e:
+        print(f"Erreur lors de la sauvegarde : {e}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return None
+    finally:
+        _backup_lock.release()
+
+    metrics_manager.observe('hotelpos_backup_duration_seconds', time.perf_counter() - start)
+    rotate_backups(target_dir, keep)
+    return final_dir
+
+def list_backups(target_dir=BACKUP_DIR):
+    """Sauvegardes complètes, de la plus récente à la plus ancienne : [{nom, chemin, taille, fichiers}]."""
+    if not os.path.isdir(target_dir):
+        return []
+    backups = []
+    for name in sorted(os.listdir(target_dir), reverse=True):
+        path = os.path.join(target_dir, name)
+        if name.endswith('.tmp') or not os.path.isdir(path):
+            continue
+        files = sorted(os.listdir(path))
+        backups.append({
+            'nom': name,
+            'chemin': path,
+            'taille': sum(os.path.getsize(os.path.join(path, f)) for f in files),
+            'fichiers': files,
+        })
+    return backups
+
+def rotate_backups(target_dir=BACKUP_DIR, keep=BACKUP_RETENTION):
+    """Supprime les sauvegardes au-delà des `keep` plus récentes. Retourne les noms supprimés."""
+    removed = []
+    for backup in list_backups(target_dir)[keep:]:
+        shutil.rmtree(backup['chemin'], ignore_errors=True)
+        removed.append(backup['nom'])
+    return removed
+
+def start_backup_in_background(target_dir=BACKUP_DIR, keep=BACKUP_RETENTION):
+    """Lance une sauvegarde dans un thread (déclenchement depuis l'administration). False si déjà en cours."""
+    if _backup_lock.locked():
+        return False
+    threading.Thread(target=create_backup, args=(target_dir, keep), name='hotelpos-backup', daemon=True).start()
+    return True
+
+def is_backup_running():
+    return _backup_lock.locked()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sauvegardes à chaud des bases HotelPOS.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    backup_parser = subparsers.add_parser('sauvegarder', help="Crée une sauvegarde vérifiée.")
+    backup_parser.add_argument('--dossier', default=BACKUP_DIR)
+    backup_parser.add_argument('--garder', type=int, default=BACKUP_RETENTION,
+                               help="Nombre de sauvegardes conservées.")
+    backup_parser.add_argument('--pages', type=int, default=PAGES_PER_STEP,
+                               help="Pages copiées par étape.")
+    list_parser = subparsers.add_parser('lister', help="Liste les sauvegardes conservées.")
+    list_parser.add_argument('--dossier', default=BACKUP_DIR)
+    check_parser = subparsers.add_parser('verifier', help="Vérifie l'intégrité d'une sauvegarde.")
+    check_parser.add_argument('chemin')
+    args = parser.parse_args()
+
+    if args.command == 'sauvegarder':
+        result = create_backup(args.dossier, args.garder, args.pages)
+        if result is None:
+            raise SystemExit(1)
+        print(f"Sauvegarde créée et vérifiée : {result}")
+    elif args.command == 'lister':
+        for backup in list_backups(args.dossier):
+            print(f"{backup['nom']}  {backup['taille'] / 1024:.0f} Ko  {', '.join(backup['fichiers'])}")
+    else:
+        paths = [args.chemin]
+        if os.path.isdir(args.chemin):
+            paths = [os.path.join(args.chemin, f) for f in sorted(os.listdir(args.chemin))]
+        failed = False
+        for path in paths:
+            problems = check_integrity(path)
+            print(f"{path} : {'OK' if not problems else '; '.join(problems[:5])}")
+            failed = failed or bool(problems)
+        raise SystemExit(1 if failed else 0)
@@ -0,0 +1,141 @@
+# compression.py
+"""
+Compression dynamique (Brotli / gzip) et GET conditionnel des réponses de l'application.
+
+    compression.init_app(app)
+
+Les réponses JSON reçoivent un ETag fort (empreinte du contenu) : un client qui renvoie
+If-None-Match obtient un 304 sans corps, avant même toute compression. Les PDF, déjà
+compressés, ne sont pas recompressés ; leur ETag est posé avant le rendu (app.render_pdf).
+Les pages en flux (templates rendus au fil de l'eau) sont compressées morceau par morceau,
+chacun vidé aussitôt pour que le navigateur puisse l'afficher.
+"""
+import gzip
+import hashlib
+import time
+import zlib
+
+import brotli
+from flask import request
+
+import metrics_manager
+
+# Réglages par défaut, modifiables par app.config (COMPRESS_*) : niveaux bas = CPU borné
+DEFAULTS = {
+    'COMPRESS_MIN_SIZE': 1024,
+    'COMPRESS_BROTLI_QUALITY': 4,
+    'COMPRESS_GZIP_LEVEL': 6,
+}
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+                          'application/javascript', 'image/svg+xml'}
+ETAG_MIMETYPES = {'application/json'}
+
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1.0)
+
+def _encoders(app):
+    return {
+        'br': lambda data: brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY']),
+        # mtime=0 : en-tête gzip sans horodatage, même contenu -> mêmes octets (ETag fort)
+        'gzip': lambda data: gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0),
+    }
+
+def _stream_encoder(app, encoding):
+    """(compresser un morceau, finir le flux) pour un encodage, chaque morceau vidé aussitôt."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    compressor = zlib.compressobj(app.config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 31)  # 31 : en-tête gzip
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+def _compress_stream(app, chunks, encoding, stats):
+    """Compresse le flux ; cumule dans `stats` le temps de compression et les tailles."""
+    encode, finish = _stream_encoder(app, encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                start = time.perf_counter()
+                compressed = encode(chunk)
+                stats['seconds'] += time.perf_counter() - start
+                stats['in'] += len(chunk)
+                stats['out'] += len(compressed)
+                yield compressed
+        compressed = finish()
+        stats['out'] += len(compressed)
+        yield compressed
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _record(encoding, mimetype, seconds, size, compressed_size):
+    metrics_manager.observe('hotelpos_compression_seconds', seconds,
+                            {'encoding': encoding, 'mimetype': mimetype})
+    metrics_manager.observe('hotelpos_compression_ratio', compressed_size / size,
+                            {'encoding': encoding, 'mimetype': mimetype}, buckets=RATIO_BUCKETS)
+    metrics_manager.increment('hotelpos_compressed_bytes_total', {'encoding': encoding}, compressed_size)
+    metrics_manager.increment('hotelpos_uncompressed_bytes_total', {'encoding': encoding}, size)
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    encoders = _encoders(app)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.is_streamed and not response.direct_passthrough and response.status_code == 200
+                and 'Content-Encoding' not in response.headers and response.mimetype == 'text/html'):
+            # Page en flux : taille inconnue, compressée au fil de l'envoi
+            encoding = request.accept_encodings.best_match(list(encoders))
+            response.vary.add('Accept-Encoding')
+            if encoding:
+                stats = {'seconds': 0.0, 'in': 0, 'out': 0}
+                response.response = _compress_stream(app, response.response, encoding, stats)
+                response.headers['Content-Encoding'] = encoding
+                response.headers.pop('Content-Length', None)
+                mimetype = response.mimetype
+
+                def record():
+                    # Métriques connues seulement une fois le corps envoyé
+                    if stats['in']:
+                        _record(encoding, mimetype, stats['seconds'], stats['in'], stats['out'])
+
+                response.call_on_close(record)
+            return response
+
+        # Fichiers envoyés tels quels, autres flux, réponses déjà encodées ou vides : rien à faire
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        data = response.get_data()
+        encoding = None
+        if len(data) >= app.config['COMPRESS_MIN_SIZE']:
+            encoding = request.accept_encodings.best_match(list(encoders))
+            response.vary.add('Accept-Encoding')
+
+        if response.mimetype in ETAG_MIMETYPES and 'ETag' not in response.headers:
+            # ETag fort par représentation : l'encodage fait partie de la valeur
+            etag = hashlib.sha256(data).hexdigest()[:32] + (f"-{encoding}" if encoding else '')
+            response.set_etag(etag)
+            if 'Cache-Control' not in response.headers:
+                response.headers['Cache-Control'] = 'private, no-cache'
+            if request.if_none_match.contains(etag):
+                metrics_manager.increment('hotelpos_http_not_modified_total', {'mimetype': response.mimetype})
+                response.status_code = 304
+                response.set_data(b'')
+                response.headers.pop('Content-Length', None)
+                response.headers.pop('Content-Disposition', None)
+                return response
+
+        if encoding is None:
+            return response
+
+        start = time.perf_counter()
+        compressed = encoders[encoding](data)
+        _record(encoding, response.mimetype, time.perf_counter() - start, len(data), len(compressed))
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -1,14 +1,397 @@
 # data_manager.py
 import sqlite3
-from datetime import datetime
+import json
+import os
+import re
+import unicodedata
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime, timedelta
+import db_setup
+import metrics_manager
+import pagination
+import write_queue
 
 DATABASE_NAME = 'hotel_pos.db'
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
+# Base d'archives (données froides) : séjours clos et commandes historiques
+ARCHIVE_DATABASE_NAME = 'hotel_pos_archive.db'
+ARCHIVED_TABLES = ('sejours', 'commandes_ventes', 'lignes_commande', 'paiements')
+
+# Bases POS par point de vente (HOTEL_POS_SHARDING=1) : chaque point de vente écrit ses ventes
+# directes dans son propre fichier, donc sans attendre le verrou d'écriture des autres.
+POS_SHARDING = os.environ.get('HOTEL_POS_SHARDING') == '1'
+POS_SHARDED_TABLES = ('commandes_ventes', 'lignes_commande', 'paiements', 'journal_mouvements',
+                      'services_caisse_totaux')
+# Les identifiants du point de vente N commencent à N * POS_SHARD_ID_SPAN (0 = base principale)
+POS_SHARD_ID_SPAN = 1000000000
+
+# Rapports sur une copie de la base principale rafraîchie au plus toutes les N secondes
+# (HOTEL_POS_REPORTING_SNAPSHOT=N) ; par défaut, lecture seule directe sur la base en WAL
+REPORTING_SNAPSHOT_MAX_AGE = int(os.environ.get('HOTEL_POS_REPORTING_SNAPSHOT', '0'))
+REPORTING_SNAPSHOT_NAME = 'hotel_pos_rapports.db'
+
+def get_db_connection(database=None):
+    conn = sqlite3.connect(database or DATABASE_NAME, factory=metrics_manager.InstrumentedConnection)
     conn.row_factory = sqlite3.Row 
     return conn
 
+def _read_only_uri(path):
+    return f"file:{os.path.abspath(path)}?mode=ro"
+
+def get_read_only_connection(database=None):
+    """
+    Connexion en lecture seule (URI mode=ro) : en WAL, elle ne prend jamais le verrou
+    d'écriture et ne peut pas retarder un commit. Les bases attachées doivent l'être
+    avec _read_only_uri().
+    """
+    conn = sqlite3.connect(_read_only_uri(database or DATABASE_NAME), uri=True,
+                           factory=metrics_manager.InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    conn.isolation_level = None  # Transactions de lecture gérées explicitement
+    return conn
+
+def _stream_rows(query, params=()):
+    """
+    Lignes d'une requête lues une à une pendant le parcours (templates en flux) : la requête
+    ne s'exécute qu'à la première ligne demandée, et la connexion en lecture seule est fermée
+    en fin de parcours ou dès que le générateur est abandonné.
+    """
+    conn = get_read_only_connection()
+    try:
+        yield from conn.execute(query, params)
+    finally:
+        conn.close()
+
+# --- UNITÉ DE TRAVAIL (TRANSACTION PARTAGÉE) ---
+_unit_of_work = threading.local()
+
+@contextmanager
+def unit_of_work(database=None):
+    """
+    Transaction partagée par toutes les fonctions de data_manager appelées dans le bloc,
+    sur une seule connexion (par thread et par fichier, `database` = base principale par défaut) :
+
+        with data_manager.unit_of_work():
+            data_manager.cancel_reservation(12)
+            data_manager.create_reservation(4, 'Client', '2025-01-10', '2025-01-12')
+
+    Le bloc le plus externe ouvre BEGIN IMMEDIATE et valide une seule fois (COMMIT) ;
+    les blocs imbriqués deviennent des SAVEPOINT, annulés seuls en cas d'exception.
+    Les écritures du journal des mouvements (record_movement) sont insérées en un lot juste
+    avant le COMMIT. Les lectures get_* gardent leur propre connexion et ne voient que les
+    données validées.
+    """
+    if not hasattr(_unit_of_work, 'states'):
+        _unit_of_work.states = {}
+    key = database or DATABASE_NAME
+    state = _unit_of_work.states.get(key)
+    if state is None:
+        conn = get_db_connection(database)
+        conn.isolation_level = None  # Transactions gérées explicitement
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        _unit_of_work.states[key] = state = {'conn': conn, 'depth': 0, 'journal': []}
+        try:
+            yield conn
+            _flush_journal(conn, state['journal'])
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            del _unit_of_work.states[key]
+            conn.close()
+    else:
+        conn = state['conn']
+        state['depth'] += 1
+        savepoint = f"uow_{state['depth']}"
+        journal_mark = len(state['journal'])
+        conn.execute(f"SAVEPOINT {savepoint}")
+        try:
+            yield conn
+            conn.execute(f"RELEASE {savepoint}")
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+            del state['journal'][journal_mark:]  # Mouvements annulés avec le SAVEPOINT
+            raise
+        finally:
+            state['depth'] -= 1
+
+# --- JOURNAL DES MOUVEMENTS (AJOUT SEUL) ---
+# Voir ledger_manager pour le rejeu. 'solde_initial' est réservé à la reprise (db_setup)
+MOVEMENT_TYPES = ('vente', 'transfert', 'reglement', 'statut_chambre', 'solde_initial')
+
+def record_movement(mouvement, sejour_id=None, chambre_id=None, commande_id=None, montant=None,
+                    valeur=None, utilisateur_id=None, database=None):
+    """
+    Ajoute un mouvement au journal de l'unité de travail ouverte sur `database` (base principale
+    par défaut). Il n'est écrit qu'au COMMIT, dans la même transaction que la mise à jour
+    qu'il décrit : pas de mouvement sans mise à jour, ni l'inverse.
+    """
+    state = getattr(_unit_of_work, 'states', {}).get(database or DATABASE_NAME)
+    if state is None:
+        raise RuntimeError("record_movement() doit être appelé dans une unité de travail")
+    state['journal'].append((datetime.now().strftime('%Y-%m-%d %H:%M:%S'), mouvement, sejour_id,
+                             chambre_id, commande_id, montant, valeur, utilisateur_id))
+
+def _flush_journal(conn, entries):
+    if entries:
+        conn.executemany("""
+            INSERT INTO journal_mouvements (date_heure, mouvement, sejour_id, chambre_id, commande_id,
+                                            montant, valeur, utilisateur_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, entries)
+
+# --- FILE D'ÉCRITURE (GROUP COMMIT) ---
+_write_queue = None
+
+def start_write_queue():
+    """
+    Active la file d'écriture : les fonctions @queued_write appelées depuis n'importe quel
+    thread sont exécutées par un rédacteur unique, regroupées en transactions communes.
+    """
+    global _write_queue
+    if _write_queue is None:
+        _write_queue = write_queue.WriteQueue(unit_of_work)
+    return _write_queue
+
+def stop_write_queue():
+    global _write_queue
+    if _write_queue is not None:
+        _write_queue.stop()
+        _write_queue = None
+
+def writer_thread_id():
+    """Identifiant du thread rédacteur, None si la file n'est pas active."""
+    writer = _write_queue
+    return writer.thread_id if writer is not None else None
+
+def run_write(func, *args, on_error=False, **kwargs):
+    """
+    Exécute une écriture sur la base principale via la file si elle est active. Exécution
+    directe depuis le rédacteur lui-même ou dans une unité de travail déjà ouverte par ce thread
+    (elle détient le verrou d'écriture : attendre le rédacteur bloquerait les deux).
+    Passée par la file, une erreur SQLite (lot non validé) est affichée et `on_error` retourné,
+    comme les fonctions d'écriture le font elles-mêmes.
+    """
+    writer = _write_queue
+    if writer is None or writer.is_writer_thread() or getattr(_unit_of_work, 'states', None):
+        return func(*args, **kwargs)
+    try:
+        return writer.call(func, *args, **kwargs)
+    except sqlite3.Error as e:
+        print(f"Erreur lors de l'écriture ({func.__name__}) : {e}")
+        return on_error
+
+def queued_write(func=None, on_error=False):
+    """
+    Décorateur : la fonction d'écriture passe par run_write(). `on_error` est sa valeur
+    d'échec (False par défaut) : @queued_write ou @queued_write(on_error=None).
+    """
+    if func is None:
+        return lambda func: queued_write(func, on_error)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_write(func, *args, on_error=on_error, **kwargs)
+    return wrapper
+
+def get_archive_limit(conn):
+    """Retourne la date limite d'archivage ('AAAA-MM-JJ HH:MM:SS'), ou None si rien n'est archivé."""
+    try:
+        row = conn.execute("SELECT valeur FROM archive.archive_meta WHERE cle = 'limite'").fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def attach_archive(conn, read_only=False):
+    """Attache la base d'archives sous le nom 'archive'. Retourne False si elle n'existe pas."""
+    if not os.path.exists(ARCHIVE_DATABASE_NAME):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive",
+                 (_read_only_uri(ARCHIVE_DATABASE_NAME) if read_only else ARCHIVE_DATABASE_NAME,))
+    return True
+
+def copy_table_schema(conn, schema, tables):
+    """Recrée dans la base attachée `schema` les tables de 'main' données et leurs index, à l'identique."""
+    placeholders = ", ".join("?" for _ in tables)
+    rows = conn.execute(f"""
+        SELECT type, name, sql FROM main.sqlite_master
+        WHERE tbl_name IN ({placeholders}) AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type DESC -- Tables avant index
+    """, tuple(tables)).fetchall()
+    for row in rows:
+        sql = row['sql']
+        if row['type'] == 'table':
+            sql = f"CREATE TABLE IF NOT EXISTS {schema}.{row['name']}" + sql[sql.index('('):]
+        else:
+            sql = sql.replace(f"INDEX IF NOT EXISTS {row['name']}", f"INDEX IF NOT EXISTS {schema}.{row['name']}", 1)
+            sql = sql.replace(f"INDEX {row['name']}", f"INDEX IF NOT EXISTS {schema}.{row['name']}", 1)
+        conn.execute(sql)
+
+_snapshot_lock = threading.Lock()
+
+def refresh_reporting_snapshot(max_age=None):
+    """
+    Recopie la base principale dans REPORTING_SNAPSHOT_NAME (API de sauvegarde en ligne)
+    si la copie a plus de `max_age` secondes. La nouvelle copie remplace l'ancienne d'un
+    bloc : les rapports en cours continuent de lire l'ancienne. Retourne le fichier.
+    """
+    max_age = REPORTING_SNAPSHOT_MAX_AGE if max_age is None else max_age
+    with _snapshot_lock:
+        if os.path.exists(REPORTING_SNAPSHOT_NAME) and \
+                datetime.now().timestamp() - os.path.getmtime(REPORTING_SNAPSHOT_NAME) < max_age:
+            return REPORTING_SNAPSHOT_NAME
+        temp_path = REPORTING_SNAPSHOT_NAME + '.tmp'
+        source = get_db_connection()
+        target = sqlite3.connect(temp_path)
+        try:
+            source.backup(target, pages=-1)  # Une seule transaction de lecture : copie cohérente
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.replace(temp_path, REPORTING_SNAPSHOT_NAME)
+        return REPORTING_SNAPSHOT_NAME
+
+def get_reporting_connection(start_date=None, snapshot=True):
+    """
+    Connexion en lecture seule pour les rapports et exports, dans une transaction de lecture
+    unique : toutes les requêtes voient le même état des bases, et aucune n'attend ni ne
+    retarde les écritures des caisses. Avec HOTEL_POS_REPORTING_SNAPSHOT, la base principale
+    est lue sur sa copie périodique (sauf `snapshot=False`, pour les données du jour).
+
+    Si la période commence avant la limite d'archivage, ou si des bases POS par point de vente
+    existent, les tables concernées sont remplacées (vues TEMP, prioritaires sur 'main') par
+    l'union de toutes les bases : les requêtes existantes restent inchangées.
+    """
+    database = None
+    if snapshot and REPORTING_SNAPSHOT_MAX_AGE:
+        try:
+            database = refresh_reporting_snapshot()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Erreur lors de la copie de la base pour les rapports : {e}")
+    conn = get_read_only_connection(database)
+    sources = {table: [f"main.{table}"] for table in ARCHIVED_TABLES}
+    if attach_archive(conn, read_only=True):
+        limit = get_archive_limit(conn)
+        if limit is None or (start_date is not None and str(start_date) >= limit):
+            conn.execute("DETACH DATABASE archive")
+        else:
+            for table in ARCHIVED_TABLES:
+                sources[table].append(f"archive.{table}")
+    schemas = attach_pos_shards(conn, read_only=True)
+    for schema in schemas:
+        for table in POS_SHARDED_TABLES:
+            sources.setdefault(table, [f"main.{table}"]).append(f"{schema}.{table}")
+    for table, parts in sources.items():
+        if len(parts) > 1:
+            union = " UNION ALL ".join(f"SELECT * FROM {part}" for part in parts)
+            conn.execute(f"CREATE TEMP VIEW {table} AS {union}")
+
+    # Ouvre la transaction de lecture et fige tout de suite l'état de chaque base
+    conn.execute("BEGIN")
+    for schema in ['main'] + (['archive'] if 'archive.sejours' in sources['sejours'] else []) + schemas:
+        conn.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master").fetchone()
+    return conn
+
+# --- BASES POS PAR POINT DE VENTE ---
+_pos_shards = {}  # point de vente -> fichier (déjà créé)
+_pos_shards_lock = threading.Lock()
+
+def _pos_shard_file(outlet):
+    slug = unicodedata.normalize('NFKD', outlet).encode('ascii', 'ignore').decode('ascii')
+    slug = re.sub(r'[^a-z0-9]+', '_', slug.lower()).strip('_') or 'defaut'
+    return f"hotel_pos_pdv_{slug}.db"
+
+def get_pos_shard(outlet):
+    """
+    Fichier de la base POS du point de vente `outlet` (catégorie de produits), créé au besoin :
+    enregistrement dans 'points_de_vente', schéma identique à 'main' et compteurs
+    AUTOINCREMENT démarrant à numéro * POS_SHARD_ID_SPAN pour des identifiants uniques.
+    """
+    with _pos_shards_lock:
+        if outlet in _pos_shards:
+            return _pos_shards[outlet]
+
+        conn = get_db_connection()
+        try:
+            conn.execute("INSERT OR IGNORE INTO points_de_vente (nom, fichier) VALUES (?, ?)",
+                         (outlet, _pos_shard_file(outlet)))
+            conn.commit()
+            row = conn.execute("SELECT id, fichier FROM points_de_vente WHERE nom = ?", (outlet,)).fetchone()
+
+            conn.execute("ATTACH DATABASE ? AS pos", (row['fichier'],))
+            conn.execute("PRAGMA pos.auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA pos.journal_mode=WAL")
+            copy_table_schema(conn, 'pos', POS_SHARDED_TABLES)
+            db_setup.create_ledger_guards(conn, 'pos')
+            for table in POS_SHARDED_TABLES:
+                conn.execute("""
+                    INSERT INTO pos.sqlite_sequence (name, seq)
+                    SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM pos.sqlite_sequence WHERE name = ?)
+                """, (table, row['id'] * POS_SHARD_ID_SPAN, table))
+            conn.commit()
+        finally:
+            conn.close()
+
+        _pos_shards[outlet] = row['fichier']
+        return row['fichier']
+
+def attach_pos_shards(conn, read_only=False):
+    """Attache les bases POS existantes ('pos_1', 'pos_2'...). Retourne les noms attachés."""
+    try:
+        shards = conn.execute("SELECT id, fichier FROM main.points_de_vente ORDER BY id").fetchall()
+    except sqlite3.Error:
+        return []
+    schemas = []
+    for shard in shards:
+        if os.path.exists(shard['fichier']):
+            schema = f"pos_{shard['id']}"
+            conn.execute(f"ATTACH DATABASE ? AS {schema}",
+                         (_read_only_uri(shard['fichier']) if read_only else shard['fichier'],))
+            schemas.append(schema)
+    return schemas
+
+def list_database_files():
+    """Fichiers de données existants : base principale, archive et bases POS par point de vente."""
+    files = [DATABASE_NAME]
+    if os.path.exists(ARCHIVE_DATABASE_NAME):
+        files.append(ARCHIVE_DATABASE_NAME)
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT fichier FROM points_de_vente ORDER BY id").fetchall()
+        files.extend(row['fichier'] for row in rows if os.path.exists(row['fichier']))
+    except sqlite3.Error:
+        pass  # Base antérieure aux points de vente
+    finally:
+        conn.close()
+    return files
+
+def _get_order_connection(order_id):
+    """
+    Connexion pour lire une commande : sa base POS (la base principale y est attachée
+    pour utilisateurs, produits et séjours) ou la base principale.
+    """
+    shard_id = int(order_id) // POS_SHARD_ID_SPAN
+    if shard_id:
+        conn = get_db_connection()
+        row = conn.execute("SELECT fichier FROM points_de_vente WHERE id = ?", (shard_id,)).fetchone()
+        conn.close()
+        if row and os.path.exists(row['fichier']):
+            conn = get_db_connection(row['fichier'])
+            conn.execute("ATTACH DATABASE ? AS hotel", (DATABASE_NAME,))
+            return conn
+    return get_db_connection()
+
 # --- GESTION DES CHAMBRES (CRUD) ---
 def get_all_rooms():
     conn = get_db_connection()
@@ -18,6 +401,40 @@ def get_all_rooms():
     conn.close()
     return rooms
 
+def get_rooms_page(cursor=None, limit=pagination.PAGE_SIZE, room_type=None):
+    """(ADMIN) Page de chambres triées par numéro (pagination par clé), filtrable par type."""
+    return iter_rooms_page(cursor, limit, room_type).collect()
+
+def iter_rooms_page(cursor=None, limit=pagination.PAGE_SIZE, room_type=None):
+    """Comme get_rooms_page(), lue pendant le rendu du template (pagination.PageStream)."""
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_cursor(cursor, 1)
+    conditions, params = [], []
+    if room_type:
+        conditions.append("type_chambre = ?")
+        params.append(room_type)
+    if after:
+        conditions.append("numero > ?")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    rows = _stream_rows(f"""
+        SELECT id, numero, type_chambre, prix_nuit, statut FROM chambres
+        {where}
+        ORDER BY numero
+        LIMIT ?
+    """, params + [limit + 1])
+    return pagination.PageStream(rows, limit, lambda row: [row['numero']])
+
+def get_room_types():
+    """Liste des types de chambre existants (filtres des listes)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT type_chambre FROM chambres ORDER BY type_chambre")
+    types = [row['type_chambre'] for row in cursor.fetchall()]
+    conn.close()
+    return types
+
 def get_room(room_id):
     """(ADMIN) Récupère les détails d'une chambre par ID."""
     conn = get_db_connection()
@@ -27,53 +444,180 @@ def get_room(room_id):
     conn.close()
     return room
 
+@queued_write
 def add_room_type(numero, type_chambre, prix_nuit):
     """(ADMIN) Ajoute une nouvelle chambre."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO chambres (numero, type_chambre, prix_nuit) VALUES (?, ?, ?)", 
-                       (numero, type_chambre, prix_nuit))
-        conn.commit()
+        with unit_of_work() as conn:
+            conn.execute("INSERT INTO chambres (numero, type_chambre, prix_nuit) VALUES (?, ?, ?)", 
+                         (numero, type_chambre, prix_nuit))
         return True
     except sqlite3.IntegrityError:
         return False 
-    finally:
-        conn.close()
 
+@queued_write
 def delete_room(room_id):
     """(ADMIN) Supprime une chambre par ID."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        # On vérifie si la chambre est occupée
-        cursor.execute("SELECT COUNT(*) FROM sejours WHERE chambre_id = ? AND date_checkout_reelle IS NULL", (room_id,))
-        if cursor.fetchone()[0] > 0:
-            return False # Ne peut pas supprimer une chambre occupée
-            
-        cursor.execute("DELETE FROM chambres WHERE id = ?", (room_id,))
-        conn.commit()
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            # On vérifie si la chambre est occupée
+            cursor.execute("SELECT COUNT(*) FROM sejours WHERE chambre_id = ? AND date_checkout_reelle IS NULL", (room_id,))
+            if cursor.fetchone()[0] > 0:
+                return False # Ne peut pas supprimer une chambre occupée
+
+            cursor.execute("DELETE FROM chambres WHERE id = ?", (room_id,))
         return True
     except sqlite3.Error:
         return False
-    finally:
-        conn.close()
 
+@queued_write
 def update_room(room_id, numero, type_chambre, prix_nuit):
     """(ADMIN) Met à jour les détails d'une chambre."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE chambres
-            SET numero = ?, type_chambre = ?, prix_nuit = ?
-            WHERE id = ?
-        """, (numero, type_chambre, prix_nuit, room_id))
-        conn.commit()
+        with unit_of_work() as conn:
+            conn.execute("""
+                UPDATE chambres
+                SET numero = ?, type_chambre = ?, prix_nuit = ?
+                WHERE id = ?
+            """, (numero, type_chambre, prix_nuit, room_id))
         return True
     except sqlite3.Error as e:
         print(f"Erreur lors de la mise à jour de la chambre : {e}")
         return False
+
+# --- CALENDRIER TARIFAIRE ---
+# Jours de la semaine (strftime('%w') : 0 = dimanche) pour les tarifs de week-end
+WEEKEND_NIGHTS = (5, 6)  # Nuits du vendredi et du samedi
+
+# Génère les nuits [debut, fin[ (CTE récursive), filtrées sur les jours de la semaine demandés
+_RATE_NIGHTS_CTE = """
+    WITH RECURSIVE nuits(jour) AS (
+        SELECT date(:debut)
+        UNION ALL
+        SELECT date(jour, '+1 day') FROM nuits WHERE date(jour, '+1 day') < :fin
+    )
+    SELECT jour FROM nuits
+    WHERE jour < :fin AND (:jours IS NULL OR instr(:jours, strftime('%w', jour)) > 0)
+"""
+
+@queued_write(on_error=None)
+def set_rate(type_chambre, date_debut, date_fin, prix, weekdays=None, libelle=None):
+    """
+    (ADMIN) Fixe le prix des nuits [date_debut, date_fin[ d'un type de chambre, éventuellement
+    limité à certains jours de la semaine (`weekdays`, ex. WEEKEND_NIGHTS). Le dernier tarif
+    saisi l'emporte : appliquer la saison, puis les week-ends, puis les événements.
+    Retourne le nombre de nuits tarifées, ou None en cas d'erreur.
+    """
+    if date_fin <= date_debut or prix < 0:
+        return None
+    params = {'debut': date_debut, 'fin': date_fin, 'type_chambre': type_chambre, 'prix': prix,
+              'libelle': libelle, 'jours': ''.join(str(day) for day in weekdays) if weekdays else None}
+    try:
+        with unit_of_work() as conn:
+            cursor = conn.execute(f"""
+                INSERT INTO tarifs_calendrier (type_chambre, jour, prix, libelle)
+                SELECT :type_chambre, jour, :prix, :libelle FROM ({_RATE_NIGHTS_CTE})
+                WHERE true
+                ON CONFLICT(type_chambre, jour) DO UPDATE SET prix = excluded.prix, libelle = excluded.libelle
+            """, params)
+            return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la saisie du tarif : {e}")
+        return None
+
+@queued_write(on_error=None)
+def clear_rates(type_chambre, date_debut, date_fin, prix=None):
+    """
+    (ADMIN) Rétablit le prix de base (chambres.prix_nuit) sur les nuits [date_debut, date_fin[,
+    ou seulement sur celles tarifées à `prix` (une ligne de get_upcoming_rates).
+    """
+    try:
+        with unit_of_work() as conn:
+            cursor = conn.execute("""
+                DELETE FROM tarifs_calendrier
+                WHERE type_chambre = ? AND jour >= ? AND jour < ? AND (? IS NULL OR prix = ?)
+            """, (type_chambre, date_debut, date_fin, prix, prix))
+            return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la suppression des tarifs : {e}")
+        return None
+
+def get_upcoming_rates(limit=50):
+    """(ADMIN) Tarifs à venir, regroupés par type, libellé et prix : première et dernière nuit."""
+    conn = get_db_connection()
+    try:
+        return conn.execute("""
+            SELECT type_chambre, libelle, prix, MIN(jour) AS premiere_nuit, MAX(jour) AS derniere_nuit,
+                   COUNT(*) AS nuits
+            FROM tarifs_calendrier
+            WHERE jour >= ?
+            GROUP BY type_chambre, libelle, prix
+            ORDER BY premiere_nuit, type_chambre
+            LIMIT ?
+        """, (datetime.now().strftime('%Y-%m-%d'), limit)).fetchall()
+    finally:
+        conn.close()
+
+# Total de chaque demande en une requête : nuits * prix de base, corrigé par une somme sur la plage
+# (type, [debut, fin[) de la clé primaire du calendrier. Demandes passées en JSON : [[type, base, debut, fin]]
+_QUOTE_QUERY = """
+    WITH demandes AS (
+        SELECT d.key AS rang,
+               json_extract(d.value, '$[0]') AS type_chambre,
+               COALESCE(json_extract(d.value, '$[1]'),
+                        (SELECT MIN(prix_nuit) FROM chambres c WHERE c.type_chambre = json_extract(d.value, '$[0]'))) AS prix_base,
+               json_extract(d.value, '$[2]') AS debut,
+               json_extract(d.value, '$[3]') AS fin
+        FROM json_each(?) d
+    )
+    SELECT rang, type_chambre, debut, fin, prix_base,
+           CAST(julianday(fin) - julianday(debut) AS INTEGER) AS nuits,
+           CAST(julianday(fin) - julianday(debut) AS INTEGER) * prix_base + COALESCE((
+               SELECT SUM(t.prix - prix_base) FROM tarifs_calendrier t
+               WHERE t.type_chambre = demandes.type_chambre AND t.jour >= demandes.debut AND t.jour < demandes.fin
+           ), 0) AS total
+    FROM demandes
+    ORDER BY rang
+"""
+
+def _quote(cursor, requests):
+    """requests : [(type_chambre, prix de base ou None, debut, fin)] -> lignes dans le même ordre."""
+    cursor.execute(_QUOTE_QUERY, (json.dumps([list(request) for request in requests]),))
+    return cursor.fetchall()
+
+def quote_stays(requests):
+    """
+    Devis groupé pour l'écran de réservation : `requests` = [(type_chambre, date_debut, date_fin)].
+    Le prix de base d'un type est le plus bas prix_nuit de ses chambres. Retourne, dans le même
+    ordre, [{type_chambre, date_debut, date_fin, nuits, prix_base, total, prix_moyen}] ;
+    prix_base et total valent None pour un type sans chambre.
+    """
+    requests = [(type_chambre, None, date_debut, date_fin) for type_chambre, date_debut, date_fin in requests
+                if date_fin > date_debut]
+    if not requests:
+        return []
+    conn = get_db_connection()
+    try:
+        rows = _quote(conn.cursor(), requests)
+    finally:
+        conn.close()
+    return [{
+        'type_chambre': row['type_chambre'],
+        'date_debut': row['debut'],
+        'date_fin': row['fin'],
+        'nuits': row['nuits'],
+        'prix_base': row['prix_base'],
+        'total': row['total'],
+        'prix_moyen': round(row['total'] / row['nuits']) if row['total'] is not None and row['nuits'] else None,
+    } for row in rows]
+
+def get_stay_room_cost(type_chambre, prix_nuit, date_debut, nights):
+    """Coût hébergement de `nights` nuits à partir du jour `date_debut` : calendrier, sinon prix_nuit de la chambre."""
+    date_fin = (datetime.strptime(date_debut, '%Y-%m-%d') + timedelta(days=nights)).strftime('%Y-%m-%d')
+    conn = get_db_connection()
+    try:
+        return _quote(conn.cursor(), [(type_chambre, prix_nuit, date_debut, date_fin)])[0]['total']
     finally:
         conn.close()
 
@@ -86,6 +630,39 @@ def get_all_products():
     conn.close()
     return products
 
+def get_products_page(cursor=None, limit=pagination.PAGE_SIZE, categorie=None):
+    """(ADMIN) Page de produits triés par catégorie puis nom (pagination par clé)."""
+    return iter_products_page(cursor, limit, categorie).collect()
+
+def iter_products_page(cursor=None, limit=pagination.PAGE_SIZE, categorie=None):
+    """Comme get_products_page(), lue pendant le rendu du template (pagination.PageStream)."""
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_cursor(cursor, 3)
+    conditions, params = ["type_vente != 'Hébergement'"], []
+    if categorie:
+        conditions.append("categorie = ?")
+        params.append(categorie)
+    if after:
+        conditions.append("(categorie, nom, id) > (?, ?, ?)")
+        params.extend(after)
+
+    rows = _stream_rows(f"""
+        SELECT * FROM produits_services
+        WHERE {' AND '.join(conditions)}
+        ORDER BY categorie, nom, id
+        LIMIT ?
+    """, params + [limit + 1])
+    return pagination.PageStream(rows, limit, lambda row: [row['categorie'], row['nom'], row['id']])
+
+def get_product_categories():
+    """Liste des catégories de produits existantes (filtres des listes)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT categorie FROM produits_services WHERE type_vente != 'Hébergement' ORDER BY categorie")
+    categories = [row['categorie'] for row in cursor.fetchall()]
+    conn.close()
+    return categories
+
 def get_product(product_id):
     """(ADMIN) Récupère les détails d'un produit par ID."""
     conn = get_db_connection()
@@ -95,55 +672,46 @@ def get_product(product_id):
     conn.close()
     return product
 
+@queued_write
 def add_product(nom, prix_unitaire, type_vente, categorie):
     """(ADMIN) Ajoute un nouveau produit/service."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO produits_services (nom, prix_unitaire, type_vente, categorie) 
-            VALUES (?, ?, ?, ?)
-        """, (nom, prix_unitaire, type_vente, categorie))
-        conn.commit()
+        with unit_of_work() as conn:
+            conn.execute("""
+                INSERT INTO produits_services (nom, prix_unitaire, type_vente, categorie) 
+                VALUES (?, ?, ?, ?)
+            """, (nom, prix_unitaire, type_vente, categorie))
         return True
     except sqlite3.Error:
         return False
-    finally:
-        conn.close()
 
+@queued_write
 def delete_product(product_id):
     """(ADMIN) Supprime un produit par ID."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
         # Idéalement, on vérifierait si le produit est dans d'anciennes commandes
         # Mais pour l'instant, suppression simple
-        cursor.execute("DELETE FROM produits_services WHERE id = ?", (product_id,))
-        conn.commit()
+        with unit_of_work() as conn:
+            conn.execute("DELETE FROM produits_services WHERE id = ?", (product_id,))
         return True
     except sqlite3.IntegrityError:
         # Le produit est lié à une ligne_commande
         return False 
-    finally:
-        conn.close()
 
+@queued_write
 def update_product(product_id, nom, prix_unitaire, type_vente, categorie):
     """(ADMIN) Met à jour les détails d'un produit."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE produits_services
-            SET nom = ?, prix_unitaire = ?, type_vente = ?, categorie = ?
-            WHERE id = ?
-        """, (nom, prix_unitaire, type_vente, categorie, product_id))
-        conn.commit()
+        with unit_of_work() as conn:
+            conn.execute("""
+                UPDATE produits_services
+                SET nom = ?, prix_unitaire = ?, type_vente = ?, categorie = ?
+                WHERE id = ?
+            """, (nom, prix_unitaire, type_vente, categorie, product_id))
         return True
     except sqlite3.Error as e:
         print(f"Erreur lors de la mise à jour du produit : {e}")
         return False
-    finally:
-        conn.close()
 
 # --- GESTION DES SÉJOURS (CHECK-IN / CHECK-OUT) ---
 # (Toutes les fonctions de l'étape précédente restent ici - inchangées)
@@ -161,9 +729,10 @@ def get_available_rooms_for_period(start_date, end_date):
     Retourne les chambres qui ne sont ni occupées (séjour en cours)
     ni réservées pendant la période spécifiée.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    return list(iter_available_rooms_for_period(start_date, end_date))
 
+def iter_available_rooms_for_period(start_date, end_date):
+    """Comme get_available_rooms_for_period(), lues une à une pendant le rendu du template."""
     query = """
         SELECT * FROM chambres
         WHERE id NOT IN (
@@ -181,71 +750,262 @@ def get_available_rooms_for_period(start_date, end_date):
         )
         ORDER BY numero
     """
+    return _stream_rows(query, (end_date, start_date))
 
-    cursor.execute(query, (end_date, start_date))
-    rooms = cursor.fetchall()
-    conn.close()
-    return rooms
+# Résultats des opérations de réservation / check-in
+BOOKING_OK = 'ok'
+BOOKING_CONFLICT = 'conflit'
+BOOKING_ERROR = 'erreur'
 
-def create_new_stay(room_id, client_name, date_checkout_prevue):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    date_checkin = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+def _tomorrow():
+    """Date de demain : un séjour ouvert occupe la chambre au moins jusque-là, même après son départ prévu."""
+    return (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+def find_booking_conflict(cursor, chambre_id, date_debut, date_fin, client_nom=None):
+    """
+    Cherche (via index) une réservation confirmée ou un séjour actif qui chevauche
+    [date_debut, date_fin[ sur la chambre. Les réservations au nom de `client_nom`
+    sont ignorées (check-in d'un client attendu). Un séjour ouvert dont le départ prévu est
+    dépassé (client resté au-delà) occupe la chambre au moins jusqu'à demain : il bloque toute
+    période qui commence aujourd'hui ou avant. Retourne un libellé ou None.
+    """
+    cursor.execute("""
+        SELECT id, client_nom FROM reservations
+        WHERE chambre_id = ? AND statut = 'Confirmée'
+          AND date_debut < ? AND date_fin > ?
+          AND (? IS NULL OR lower(client_nom) != lower(?))
+        LIMIT 1
+    """, (chambre_id, date_fin, date_debut, client_nom, client_nom))
+    reservation = cursor.fetchone()
+    if reservation:
+        return f"réservation N°{reservation['id']} ({reservation['client_nom']})"
+
+    cursor.execute("""
+        SELECT id, client_nom FROM sejours
+        WHERE chambre_id = ? AND date_checkout_reelle IS NULL
+          AND date(date_checkin) < ? AND MAX(COALESCE(date_checkout_prevue, '9999-12-31'), ?) > ?
+        LIMIT 1
+    """, (chambre_id, date_fin, _tomorrow(), date_debut))
+    stay = cursor.fetchone()
+    if stay:
+        return f"séjour en cours N°{stay['id']} ({stay['client_nom']})"
+    return None
+
+def _set_room_status(cursor, room_id, new_status):
+    cursor.execute("UPDATE chambres SET statut = ? WHERE id = ?", (new_status, room_id))
+    record_movement('statut_chambre', chambre_id=room_id, valeur=new_status)
+
+def _run_booking(label, operation):
+    """
+    Exécute `operation(cursor)` dans une unité de travail (BEGIN IMMEDIATE si elle est la
+    plus externe) : le verrou d'écriture est pris avant la vérification des chevauchements,
+    donc deux postes ne peuvent pas réserver la même chambre. `operation` retourne
+    BOOKING_OK ou BOOKING_CONFLICT, et n'écrit rien en cas de conflit.
+    SQLite n'ayant pas de verrou par ligne, ce verrou couvre toute la base : `operation` doit
+    se limiter à la vérification (indexée) et à l'insertion, pour que les réservations d'autres
+    chambres n'attendent que brièvement (mesuré par `perf_checks.py booking-stress`).
+    """
     try:
+        with unit_of_work() as conn:
+            return operation(conn.cursor())
+    except sqlite3.Error as e:
+        print(f"Erreur lors de {label} : {e}")
+        return BOOKING_ERROR
+
+@queued_write(on_error=BOOKING_ERROR)
+def create_new_stay(room_id, client_name, date_checkout_prevue):
+    """Ouvre un séjour si la chambre est libre jusqu'au départ prévu. Retourne un statut BOOKING_*."""
+    now = datetime.now()
+    date_checkin = now.strftime('%Y-%m-%d %H:%M:%S')
+
+    def operation(cursor):
+        if find_booking_conflict(cursor, room_id, now.strftime('%Y-%m-%d'), date_checkout_prevue, client_name):
+            return BOOKING_CONFLICT
         cursor.execute("INSERT INTO sejours (chambre_id, client_nom, date_checkin, date_checkout_prevue, statut) VALUES (?, ?, ?, ?, 'Ouvert')", 
                        (room_id, client_name, date_checkin, date_checkout_prevue))
-        update_room_status(room_id, 'Occupée')
-        conn.commit()
-        return True
-    except sqlite3.Error as e: return False
-    finally: conn.close()
+        _set_room_status(cursor, room_id, 'Occupée')
+        return BOOKING_OK
+
+    return _run_booking("la création du séjour", operation)
 
 # --- GESTION DES RÉSERVATIONS ---
+@queued_write(on_error=BOOKING_ERROR)
 def create_reservation(chambre_id, client_nom, date_debut, date_fin):
-    """Crée une nouvelle réservation."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
+    """Crée une nouvelle réservation si la chambre est libre sur la période. Retourne un statut BOOKING_*."""
+    if date_fin <= date_debut:
+        return BOOKING_ERROR
+
+    def operation(cursor):
+        if find_booking_conflict(cursor, chambre_id, date_debut, date_fin):
+            return BOOKING_CONFLICT
         cursor.execute("""
             INSERT INTO reservations (chambre_id, client_nom, date_debut, date_fin)
             VALUES (?, ?, ?, ?)
         """, (chambre_id, client_nom, date_debut, date_fin))
         # Mettre à jour le statut de la chambre
-        update_room_status(chambre_id, 'Réservée')
-        conn.commit()
-        return True
-    except sqlite3.Error as e:
-        print(f"Erreur lors de la création de la réservation : {e}")
-        return False
-    finally:
-        conn.close()
+        _set_room_status(cursor, chambre_id, 'Réservée')
+        return BOOKING_OK
 
+    return _run_booking("la création de la réservation", operation)
+
+@queued_write
 def cancel_reservation(reservation_id):
     """Annule une réservation et libère la chambre."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        # Récupérer l'ID de la chambre pour la mettre à jour
-        cursor.execute("SELECT chambre_id FROM reservations WHERE id = ?", (reservation_id,))
-        result = cursor.fetchone()
-        if not result:
-            return False
-        room_id = result['chambre_id']
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            # Récupérer l'ID de la chambre pour la mettre à jour
+            cursor.execute("SELECT chambre_id FROM reservations WHERE id = ?", (reservation_id,))
+            result = cursor.fetchone()
+            if not result:
+                return False
+            room_id = result['chambre_id']
 
-        # Mettre à jour la réservation
-        cursor.execute("UPDATE reservations SET statut = 'Annulée' WHERE id = ?", (reservation_id,))
+            # Mettre à jour la réservation
+            cursor.execute("UPDATE reservations SET statut = 'Annulée' WHERE id = ?", (reservation_id,))
 
-        # Libérer la chambre
-        update_room_status(room_id, 'Libre')
-
-        conn.commit()
+            # Libérer la chambre
+            _set_room_status(cursor, room_id, 'Libre')
         return True
     except sqlite3.Error as e:
         print(f"Erreur lors de l'annulation de la réservation : {e}")
         return False
+
+# --- RÉSERVATIONS DE GROUPE ---
+# Décalages (en jours) des dates proposées quand la demande ne tient pas sur la période
+GROUP_DATE_SHIFTS = (-1, 1, -2, 2, -3, 3)
+
+def _room_number_key(numero):
+    """Clé de tri naturelle : '9' < '10' < '101', préfixe éventuel ('A12') puis nombre."""
+    match = re.match(r'^(\D*)(\d+)', numero)
+    if not match:
+        return (numero, -1)
+    return (match.group(1), int(match.group(2)))
+
+def _closest_block(rooms, count):
+    """
+    Parmi les chambres libres d'un type (triées par numéro), les `count` consécutives dont
+    l'écart entre premier et dernier numéro est le plus faible (même étage, côte à côte).
+    """
+    best, best_span = rooms[:count], None
+    for i in range(len(rooms) - count + 1):
+        first, last = _room_number_key(rooms[i]['numero']), _room_number_key(rooms[i + count - 1]['numero'])
+        span = (first[0] != last[0], last[1] - first[1])
+        if best_span is None or span < best_span:
+            best, best_span = rooms[i:i + count], span
+    return best
+
+def _group_availability(cursor, date_debut, date_fin):
+    """
+    Une seule lecture pour toute la fenêtre [date_debut - 3 j, date_fin + 3 j] : chambres
+    et périodes prises (réservations confirmées, séjours actifs). Retourne une fonction
+    free(debut, fin) -> {type_chambre: [chambres libres triées par numéro]}.
+    """
+    margin = timedelta(days=max(abs(shift) for shift in GROUP_DATE_SHIFTS))
+    window_start = (datetime.strptime(date_debut, '%Y-%m-%d') - margin).strftime('%Y-%m-%d')
+    window_end = (datetime.strptime(date_fin, '%Y-%m-%d') + margin).strftime('%Y-%m-%d')
+
+    cursor.execute("SELECT id, numero, type_chambre, prix_nuit FROM chambres")
+    rooms = sorted((dict(row) for row in cursor.fetchall()), key=lambda room: _room_number_key(room['numero']))
+    cursor.execute("""
+        SELECT chambre_id, date_debut AS debut, date_fin AS fin FROM reservations
+        WHERE statut = 'Confirmée' AND date_debut < ? AND date_fin > ?
+        UNION ALL
+        SELECT chambre_id, date(date_checkin), MAX(COALESCE(date_checkout_prevue, '9999-12-31'), ?) FROM sejours
+        WHERE date_checkout_reelle IS NULL
+          AND date(date_checkin) < ? AND MAX(COALESCE(date_checkout_prevue, '9999-12-31'), ?) > ?
+    """, (window_end, window_start, _tomorrow(), window_end, _tomorrow(), window_start))
+    taken = {}
+    for row in cursor.fetchall():
+        taken.setdefault(row['chambre_id'], []).append((row['debut'], row['fin']))
+
+    def free(start, end):
+        by_type = {}
+        for room in rooms:
+            if not any(debut < end and fin > start for debut, fin in taken.get(room['id'], ())):
+                by_type.setdefault(room['type_chambre'], []).append(room)
+        return by_type
+    return free
+
+def _allocate_group(free_by_type, room_mix):
+    """Répartition de la demande {type: nombre} : (chambres retenues par type, manquantes par type)."""
+    allocation, missing = {}, {}
+    for room_type, count in room_mix.items():
+        rooms = free_by_type.get(room_type, [])
+        allocation[room_type] = _closest_block(rooms, count) if len(rooms) >= count else list(rooms)
+        if len(rooms) < count:
+            missing[room_type] = count - len(rooms)
+    return allocation, missing
+
+# Résultat d'une réservation de groupe qui n'a pas pu être écrite
+GROUP_BOOKING_ERROR = {'statut': BOOKING_ERROR, 'allocation': {}, 'manquantes': {}, 'autres_types': [], 'autres_dates': []}
+
+def _plan_group_booking(cursor, room_mix, date_debut, date_fin):
+    room_mix = {room_type: count for room_type, count in room_mix.items() if count > 0}
+    free = _group_availability(cursor, date_debut, date_fin)
+    free_by_type = free(date_debut, date_fin)
+    allocation, missing = _allocate_group(free_by_type, room_mix)
+    plan = {'allocation': allocation, 'manquantes': missing, 'autres_types': [], 'autres_dates': []}
+    if not missing:
+        return plan
+
+    # Alternatives : types ayant des chambres libres en plus de la demande, puis autres dates
+    for room_type, rooms in sorted(free_by_type.items()):
+        spare = len(rooms) - room_mix.get(room_type, 0)
+        if spare > 0:
+            plan['autres_types'].append({'type_chambre': room_type, 'disponibles': spare,
+                                         'prix_nuit': min(room['prix_nuit'] for room in rooms)})
+    start, end = datetime.strptime(date_debut, '%Y-%m-%d'), datetime.strptime(date_fin, '%Y-%m-%d')
+    for shift in GROUP_DATE_SHIFTS:
+        shifted_start = (start + timedelta(days=shift)).strftime('%Y-%m-%d')
+        shifted_end = (end + timedelta(days=shift)).strftime('%Y-%m-%d')
+        if shifted_start < datetime.now().strftime('%Y-%m-%d'):
+            continue
+        if not _allocate_group(free(shifted_start, shifted_end), room_mix)[1]:
+            plan['autres_dates'].append({'date_debut': shifted_start, 'date_fin': shifted_end})
+    return plan
+
+def plan_group_booking(room_mix, date_debut, date_fin):
+    """
+    Propose une répartition pour une demande de groupe {type_chambre: nombre} sur
+    [date_debut, date_fin[, sans rien écrire : chambres retenues (numéros proches), nombre
+    manquant par type et, si la demande ne tient pas, types de remplacement et dates voisines.
+    """
+    conn = get_db_connection()
+    try:
+        return _plan_group_booking(conn.cursor(), room_mix, date_debut, date_fin)
     finally:
         conn.close()
 
+@queued_write(on_error=GROUP_BOOKING_ERROR)
+def create_group_booking(room_mix, client_nom, date_debut, date_fin, allow_partial=False):
+    """
+    Réserve en une seule transaction les chambres d'un groupe ({type_chambre: nombre}).
+    Le plan est recalculé sous verrou d'écriture : aucune chambre ne peut être prise entre-temps.
+    Si la demande ne tient pas entièrement, rien n'est écrit (sauf `allow_partial`).
+    Retourne le plan complété d'un 'statut' BOOKING_*.
+    """
+    if date_fin <= date_debut or not any(count > 0 for count in room_mix.values()):
+        return dict(GROUP_BOOKING_ERROR)
+
+    plan = {'allocation': {}, 'manquantes': {}, 'autres_types': [], 'autres_dates': []}
+
+    def operation(cursor):
+        plan.update(_plan_group_booking(cursor, room_mix, date_debut, date_fin))
+        rooms = [room for allocated in plan['allocation'].values() for room in allocated]
+        if (plan['manquantes'] and not allow_partial) or not rooms:
+            return BOOKING_CONFLICT
+        cursor.executemany("""
+            INSERT INTO reservations (chambre_id, client_nom, date_debut, date_fin)
+            VALUES (?, ?, ?, ?)
+        """, [(room['id'], client_nom, date_debut, date_fin) for room in rooms])
+        for room in rooms:
+            _set_room_status(cursor, room['id'], 'Réservée')
+        return BOOKING_OK
+
+    plan['statut'] = _run_booking("la réservation de groupe", operation)
+    return plan
+
 def get_all_reservations():
     """Récupère toutes les réservations à venir."""
     conn = get_db_connection()
@@ -262,17 +1022,62 @@ def get_all_reservations():
     conn.close()
     return reservations
 
+# Clés de tri autorisées pour la liste paginée des réservations
+RESERVATION_SORTS = {
+    'date': ("r.date_debut, r.id", lambda row: [row['date_debut'], row['id']]),
+    'chambre': ("c.numero, r.date_debut, r.id", lambda row: [row['numero'], row['date_debut'], row['id']]),
+}
+
+def get_reservations_page(cursor=None, limit=pagination.PAGE_SIZE, room_type=None,
+                          date_from=None, date_to=None, sort='date'):
+    """
+    Page de réservations à venir (pagination par clé), filtrée côté serveur par type de
+    chambre et par date d'arrivée, triée par date d'arrivée ou par numéro de chambre.
+    """
+    return iter_reservations_page(cursor, limit, room_type, date_from, date_to, sort).collect()
+
+def iter_reservations_page(cursor=None, limit=pagination.PAGE_SIZE, room_type=None,
+                           date_from=None, date_to=None, sort='date'):
+    """Comme get_reservations_page(), lue pendant le rendu du template (pagination.PageStream)."""
+    if sort not in RESERVATION_SORTS:
+        sort = 'date'
+    order_by, key = RESERVATION_SORTS[sort]
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_cursor(cursor, order_by.count(',') + 1)
+
+    conditions = ["r.statut = 'Confirmée'", "r.date_fin >= date('now')"]
+    params = []
+    if room_type:
+        conditions.append("c.type_chambre = ?")
+        params.append(room_type)
+    if date_from:
+        conditions.append("r.date_debut >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("r.date_debut <= ?")
+        params.append(date_to)
+    if after:
+        conditions.append(f"({order_by}) > ({', '.join('?' for _ in after)})")
+        params.extend(after)
+
+    rows = _stream_rows(f"""
+        SELECT r.id, r.chambre_id, c.numero, c.type_chambre, r.client_nom, r.date_debut, r.date_fin, r.statut
+        FROM reservations r
+        JOIN chambres c ON r.chambre_id = c.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_by}
+        LIMIT ?
+    """, params + [limit + 1])
+    return pagination.PageStream(rows, limit, key)
+
+@queued_write(on_error=None)
 def update_room_status(room_id, new_status):
     """Met à jour le statut d'une chambre."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE chambres SET statut = ? WHERE id = ?", (new_status, room_id))
-        conn.commit()
+        with unit_of_work() as conn:
+            _set_room_status(conn.cursor(), room_id, new_status)
     except sqlite3.Error as e:
         print(f"Erreur lors de la mise à jour du statut de la chambre : {e}")
-    finally:
-        conn.close()
 
 def get_stay_details(stay_id):
     conn = get_db_connection()
@@ -286,44 +1091,174 @@ def get_stay_details(stay_id):
 def get_stay_ordered_items(stay_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    query = "SELECT p.nom, lc.quantite, lc.prix_unitaire_vente, (lc.quantite * lc.prix_unitaire_vente) AS sous_total FROM lignes_commande lc JOIN produits_services p ON lc.produit_id = p.id JOIN commandes_ventes cv ON lc.commande_id = cv.id WHERE cv.stay_id = ? AND cv.statut_paiement = 'Transféré' ORDER BY cv.date_heure"
+    query = "SELECT cv.date_heure, p.nom, lc.quantite, lc.prix_unitaire_vente, (lc.quantite * lc.prix_unitaire_vente) AS sous_total FROM lignes_commande lc JOIN produits_services p ON lc.produit_id = p.id JOIN commandes_ventes cv ON lc.commande_id = cv.id WHERE cv.stay_id = ? AND cv.statut_paiement = 'Transféré' ORDER BY cv.date_heure, lc.id"
     cursor.execute(query, (stay_id,))
     items = cursor.fetchall()
     conn.close()
     return items
 
-def perform_checkout(stay_id, final_bill_amount):
+# --- FOLIO DES SÉJOURS (CONSOMMATIONS TRANSFÉRÉES) ---
+# Regroupements possibles du folio : (colonnes, GROUP BY, ORDER BY)
+FOLIO_GROUPINGS = {
+    'produit': ("p.nom, SUM(lc.quantite) AS quantite, lc.prix_unitaire_vente", "p.id, lc.prix_unitaire_vente", "p.nom"),
+    'jour': ("date(cv.date_heure) AS jour, COUNT(DISTINCT cv.id) AS commandes, SUM(lc.quantite) AS quantite",
+             "date(cv.date_heure)", "jour"),
+}
+
+def get_stay_folio_summary(stay_id, group_by='produit'):
+    """
+    Consommations transférées d'un séjour agrégées par produit (et prix) ou par jour :
+    quelques lignes au lieu d'une par article, même pour un long séjour.
+    """
+    columns, group, order = FOLIO_GROUPINGS.get(group_by, FOLIO_GROUPINGS['produit'])
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT {columns}, SUM(lc.quantite * lc.prix_unitaire_vente) AS sous_total
+        FROM commandes_ventes cv
+        JOIN lignes_commande lc ON lc.commande_id = cv.id
+        JOIN produits_services p ON lc.produit_id = p.id
+        WHERE cv.stay_id = ? AND cv.statut_paiement = 'Transféré'
+        GROUP BY {group}
+        ORDER BY {order}
+    """, (stay_id,))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def get_stay_folio_page(stay_id, cursor=None, limit=pagination.PAGE_SIZE):
+    """Page du détail ligne par ligne des consommations d'un séjour (pagination par clé)."""
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_cursor(cursor, 2)
+    conditions, params = ["cv.stay_id = ?", "cv.statut_paiement = 'Transféré'"], [stay_id]
+    if after:
+        conditions.append("(cv.date_heure, lc.id) > (?, ?)")
+        params.extend(after)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT lc.id, cv.date_heure, p.nom, lc.quantite, lc.prix_unitaire_vente,
+               (lc.quantite * lc.prix_unitaire_vente) AS sous_total
+        FROM commandes_ventes cv
+        JOIN lignes_commande lc ON lc.commande_id = cv.id
+        JOIN produits_services p ON lc.produit_id = p.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY cv.date_heure, lc.id
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return pagination.build_page(rows, limit, lambda row: [row['date_heure'], row['id']])
+
+@queued_write
+def perform_checkout(stay_id, final_bill_amount):
+    """Clôt le séjour au montant de la facture finale (nombre) et libère la chambre."""
+    try:
+        final_bill_amount = float(final_bill_amount)
+    except (TypeError, ValueError):
+        print(f"Montant de checkout invalide : {final_bill_amount!r}")
+        return False
     date_checkout_reelle = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     try:
-        # Récupérer l'ID de la chambre avant de clôturer le séjour
-        cursor.execute("SELECT chambre_id FROM sejours WHERE id = ?", (stay_id,))
-        result = cursor.fetchone()
-        if not result:
-            return False
-        room_id = result['chambre_id']
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            # Récupérer l'ID de la chambre avant de clôturer le séjour
+            cursor.execute("SELECT chambre_id FROM sejours WHERE id = ?", (stay_id,))
+            result = cursor.fetchone()
+            if not result:
+                return False
+            room_id = result['chambre_id']
 
-        cursor.execute("UPDATE sejours SET date_checkout_reelle = ?, solde_actuel = ?, statut = 'Clos' WHERE id = ?", 
-                       (date_checkout_reelle, final_bill_amount, stay_id))
-        cursor.execute("UPDATE commandes_ventes SET statut_paiement = 'Payé' WHERE stay_id = ?", (stay_id,))
-
-        # Mettre à jour le statut de la chambre
-        update_room_status(room_id, 'Libre') # Ou 'Nettoyage' si on veut complexifier
+            cursor.execute("UPDATE sejours SET date_checkout_reelle = ?, solde_actuel = ?, statut = 'Clos' WHERE id = ?", 
+                           (date_checkout_reelle, final_bill_amount, stay_id))
+            # Le solde est remplacé par la facture finale : le rejeu du journal fait de même
+            record_movement('reglement', sejour_id=stay_id, chambre_id=room_id, montant=final_bill_amount)
+            cursor.execute("UPDATE commandes_ventes SET statut_paiement = 'Payé' WHERE stay_id = ?", (stay_id,))
 
-        conn.commit()
+            # Mettre à jour le statut de la chambre
+            _set_room_status(cursor, room_id, 'Libre') # Ou 'Nettoyage' si on veut complexifier
         return True
     except sqlite3.Error as e:
         print(f"Erreur lors du checkout : {e}")
         return False
+
+# --- RECHERCHE DE CLIENTS (FTS5) ---
+_re_search_terms = re.compile(r"\w+", re.UNICODE)
+
+def build_guest_match(query):
+    """Transforme la saisie en expression MATCH FTS5 : chaque mot est un préfixe, tous requis."""
+    terms = _re_search_terms.findall(query or '')
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+def search_guests(query, limit=10):
+    """
+    Recherche à la frappe d'un client par nom (préfixes, sans accents) dans l'index
+    'recherche_clients', qui couvre aussi les séjours archivés (archive_manager les y laisse).
+    Retourne les séjours, réservations et commandes transférées correspondants.
+    """
+    results = {'sejours': [], 'reservations': [], 'commandes': []}
+    match = build_guest_match(query)
+    if not match:
+        return results
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        stays, orders = "sejours", "commandes_ventes"
+        if attach_archive(conn, read_only=True):
+            stays = "(SELECT * FROM main.sejours UNION ALL SELECT * FROM archive.sejours)"
+            orders = "(SELECT * FROM main.commandes_ventes UNION ALL SELECT * FROM archive.commandes_ventes)"
+        cursor.execute("""
+            SELECT rowid FROM recherche_clients
+            WHERE recherche_clients MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (match, limit * 2))
+        hits = [row['rowid'] for row in cursor.fetchall()]
+        stay_ids = [rowid // 2 for rowid in hits if rowid % 2 == 0][:limit]
+        reservation_ids = [rowid // 2 for rowid in hits if rowid % 2 == 1][:limit]
+
+        if stay_ids:
+            placeholders = ", ".join("?" for _ in stay_ids)
+            cursor.execute(f"""
+                SELECT s.id, c.numero, s.client_nom, s.date_checkin, s.date_checkout_prevue,
+                       s.date_checkout_reelle, s.statut, s.solde_actuel
+                FROM {stays} s
+                JOIN chambres c ON s.chambre_id = c.id
+                WHERE s.id IN ({placeholders})
+                ORDER BY s.date_checkin DESC
+            """, stay_ids)
+            results['sejours'] = [dict(row) for row in cursor.fetchall()]
+
+            cursor.execute(f"""
+                SELECT cv.id, cv.stay_id, cv.total_net, cv.date_heure
+                FROM {orders} cv
+                WHERE cv.stay_id IN ({placeholders}) AND cv.statut_paiement = 'Transféré'
+                ORDER BY cv.date_heure DESC
+                LIMIT ?
+            """, stay_ids + [limit])
+            results['commandes'] = [dict(row) for row in cursor.fetchall()]
+
+        if reservation_ids:
+            placeholders = ", ".join("?" for _ in reservation_ids)
+            cursor.execute(f"""
+                SELECT r.id, c.numero, r.client_nom, r.date_debut, r.date_fin, r.statut
+                FROM reservations r
+                JOIN chambres c ON r.chambre_id = c.id
+                WHERE r.id IN ({placeholders})
+                ORDER BY r.date_debut DESC
+            """, reservation_ids)
+            results['reservations'] = [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la recherche de clients : {e}")
     finally:
         conn.close()
+    return results
 
 # --- GESTION DU POS ET DES COMMANDES ---
 # (Inchangé)
 def create_pos_order(user_id, cart_items, payment_type, stay_id=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     total_net = sum(item['prix'] * item['qte'] for item in cart_items)
     if payment_type == 'Transfert Compte' and stay_id:
         statut_paiement = 'Transféré'
@@ -331,29 +1266,62 @@ def create_pos_order(user_id, cart_items, payment_type, stay_id=None):
         statut_paiement = 'Payé'
         stay_id = None 
     else: return False
+
+    # Vente directe : base du point de vente (catégorie du premier article) si le sharding est actif.
+    # Les transferts restent dans la base principale, dans la même transaction que le séjour.
+    database = None
+    shift_id = None
     try:
-        cursor.execute("INSERT INTO commandes_ventes (utilisateur_id, stay_id, total_net, statut_paiement, date_heure) VALUES (?, ?, ?, ?, ?)", 
-                       (user_id, stay_id, total_net, statut_paiement, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        commande_id = cursor.lastrowid
-        lignes_a_inserer = []
-        for item in cart_items:
-            lignes_a_inserer.append((commande_id, item['id'], item['qte'], item['prix']))
-        cursor.executemany("INSERT INTO lignes_commande (commande_id, produit_id, quantite, prix_unitaire_vente) VALUES (?, ?, ?, ?)", lignes_a_inserer)
-        cursor.execute("INSERT INTO paiements (commande_id, montant, mode_paiement, date_heure) VALUES (?, ?, ?, ?)", 
-                       (commande_id, total_net, payment_type, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        if statut_paiement == 'Transféré':
-            cursor.execute("UPDATE sejours SET solde_actuel = solde_actuel + ? WHERE id = ?", (total_net, stay_id))
-        conn.commit()
+        if POS_SHARDING and statut_paiement == 'Payé':
+            conn = get_db_connection()
+            row = conn.execute("SELECT categorie FROM produits_services WHERE id = ?", (cart_items[0]['id'],)).fetchone()
+            conn.close()
+            if row:
+                database = get_pos_shard(row['categorie'])
+                # Les totaux du service sont cumulés dans la base POS, avec la commande
+                shift_id = get_open_shift_id(user_id) or open_shift(user_id)
+                if shift_id is None:
+                    return False
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la création de la commande POS : {e}")
+        return False
+
+    # Les bases POS ont chacune leur verrou : seule la base principale passe par la file d'écriture
+    args = (database, user_id, cart_items, payment_type, stay_id, total_net, statut_paiement, shift_id)
+    return _save_pos_order(*args) if database else run_write(_save_pos_order, *args)
+
+def _save_pos_order(database, user_id, cart_items, payment_type, stay_id, total_net, statut_paiement, shift_id=None):
+    try:
+        with unit_of_work(database) as conn:
+            cursor = conn.cursor()
+            if shift_id is None:
+                # Base principale : service lu (ou ouvert) sous le verrou d'écriture de la commande
+                shift_id = _open_shift(cursor, user_id)
+            cursor.execute("INSERT INTO commandes_ventes (utilisateur_id, stay_id, total_net, statut_paiement, date_heure) VALUES (?, ?, ?, ?, ?)", 
+                           (user_id, stay_id, total_net, statut_paiement, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            commande_id = cursor.lastrowid
+            lignes_a_inserer = []
+            for item in cart_items:
+                lignes_a_inserer.append((commande_id, item['id'], item['qte'], item['prix']))
+            cursor.executemany("INSERT INTO lignes_commande (commande_id, produit_id, quantite, prix_unitaire_vente) VALUES (?, ?, ?, ?)", lignes_a_inserer)
+            cursor.execute("INSERT INTO paiements (commande_id, montant, mode_paiement, date_heure) VALUES (?, ?, ?, ?)", 
+                           (commande_id, total_net, payment_type, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            if statut_paiement == 'Transféré':
+                cursor.execute("UPDATE sejours SET solde_actuel = solde_actuel + ? WHERE id = ?", (total_net, stay_id))
+                record_movement('transfert', sejour_id=stay_id, commande_id=commande_id, montant=total_net,
+                                valeur=payment_type, utilisateur_id=user_id)
+            else:
+                record_movement('vente', commande_id=commande_id, montant=total_net, valeur=payment_type,
+                                utilisateur_id=user_id, database=database)
+            _add_to_shift_totals(cursor, shift_id, payment_type, total_net)
         return commande_id
     except sqlite3.Error as e:
-        conn.rollback()
         print(f"Erreur lors de la création de la commande POS : {e}")
         return False
-    finally: conn.close()
 
 def get_order_details(order_id):
     """Récupère les détails complets d'une commande pour l'impression du ticket."""
-    conn = get_db_connection()
+    conn = _get_order_connection(order_id)
     cursor = conn.cursor()
 
     # Dictionnaire pour stocker les résultats
@@ -402,6 +1370,118 @@ def get_order_details(order_id):
     conn.close()
     return details
 
+# --- SERVICES DE CAISSE (RAPPORT Z) ---
+CASH_PAYMENT_MODE = 'Espèces'
+ACCOUNT_PAYMENT_MODE = 'Transfert Compte'  # Porté au compte du séjour : rien d'encaissé
+
+def _open_shift(cursor, user_id, fond_initial=0):
+    """Service ouvert du caissier, ouvert à l'instant s'il n'en a pas. Retourne son id."""
+    cursor.execute("SELECT id FROM services_caisse WHERE utilisateur_id = ? AND date_cloture IS NULL", (user_id,))
+    row = cursor.fetchone()
+    if row:
+        return row['id']
+    cursor.execute("INSERT INTO services_caisse (utilisateur_id, date_ouverture, fond_initial) VALUES (?, ?, ?)",
+                   (user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), fond_initial))
+    return cursor.lastrowid
+
+def _add_to_shift_totals(cursor, shift_id, payment_type, amount):
+    cursor.execute("""
+        INSERT INTO services_caisse_totaux (service_id, mode_paiement, nb_commandes, montant) VALUES (?, ?, 1, ?)
+        ON CONFLICT(service_id, mode_paiement) DO UPDATE
+        SET nb_commandes = nb_commandes + 1, montant = montant + excluded.montant
+    """, (shift_id, payment_type, amount))
+
+@queued_write(on_error=None)
+def open_shift(user_id, fond_initial=0):
+    """
+    Ouvre le service de caisse du caissier avec son fond de caisse, ou retourne celui déjà
+    ouvert (une vente sans service en ouvre un). Retourne l'id du service, ou None.
+    """
+    try:
+        with unit_of_work() as conn:
+            return _open_shift(conn.cursor(), user_id, fond_initial)
+    except sqlite3.Error as e:
+        print(f"Erreur lors de l'ouverture du service de caisse : {e}")
+        return None
+
+@queued_write
+def close_shift(shift_id, especes_comptees=None):
+    """
+    Clôture un service ouvert. Les totaux par mode de paiement sont cumulés à chaque commande :
+    la clôture est une seule mise à jour. Retourne True si le service a été clôturé.
+    """
+    try:
+        with unit_of_work() as conn:
+            cursor = conn.execute("""
+                UPDATE services_caisse SET date_cloture = ?, especes_comptees = ?
+                WHERE id = ? AND date_cloture IS NULL
+            """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), especes_comptees, shift_id))
+            return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la clôture du service de caisse : {e}")
+        return False
+
+def get_open_shift_id(user_id):
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT id FROM services_caisse WHERE utilisateur_id = ? AND date_cloture IS NULL",
+                           (user_id,)).fetchone()
+        return row['id'] if row else None
+    finally:
+        conn.close()
+
+def get_shift_report(shift_id):
+    """
+    Rapport Z d'un service : totaux par mode de paiement (lus tels quels, base principale
+    et bases POS), total encaissé, espèces attendues en caisse et écart avec les espèces
+    comptées. Retourne None si le service n'existe pas.
+    """
+    conn = get_reporting_connection(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), snapshot=False)
+    try:
+        shift = conn.execute("""
+            SELECT s.id, s.utilisateur_id, u.nom_utilisateur, s.date_ouverture, s.date_cloture,
+                   s.fond_initial, s.especes_comptees
+            FROM services_caisse s
+            JOIN utilisateurs u ON u.id = s.utilisateur_id
+            WHERE s.id = ?
+        """, (shift_id,)).fetchone()
+        if shift is None:
+            return None
+        modes = [dict(row) for row in conn.execute("""
+            SELECT mode_paiement, SUM(nb_commandes) AS nb_commandes, SUM(montant) AS montant
+            FROM services_caisse_totaux
+            WHERE service_id = ?
+            GROUP BY mode_paiement
+            ORDER BY mode_paiement
+        """, (shift_id,))]
+    finally:
+        conn.close()
+
+    expected_cash = shift['fond_initial'] + sum(m['montant'] for m in modes if m['mode_paiement'] == CASH_PAYMENT_MODE)
+    return {
+        'service': dict(shift),
+        'modes': modes,
+        'nb_commandes': sum(m['nb_commandes'] for m in modes),
+        'total': sum(m['montant'] for m in modes),
+        'total_encaisse': sum(m['montant'] for m in modes if m['mode_paiement'] != ACCOUNT_PAYMENT_MODE),
+        'especes_attendues': expected_cash,
+        'ecart': None if shift['especes_comptees'] is None else shift['especes_comptees'] - expected_cash,
+    }
+
+def get_recent_shifts(limit=20):
+    """(ADMIN) Derniers services de caisse, du plus récent au plus ancien."""
+    conn = get_db_connection()
+    try:
+        return conn.execute("""
+            SELECT s.id, u.nom_utilisateur, s.date_ouverture, s.date_cloture
+            FROM services_caisse s
+            JOIN utilisateurs u ON u.id = s.utilisateur_id
+            ORDER BY s.date_ouverture DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+    finally:
+        conn.close()
+
 # --- MODULE REPORTING ---
 
 def get_sales_report(start_date, end_date):
@@ -412,7 +1492,8 @@ def get_sales_report(start_date, end_date):
     start_date_sql = f"{start_date} 00:00:00"
     end_date_sql = f"{end_date} 23:59:59"
 
-    conn = get_db_connection()
+    # La période peut chevaucher les données archivées
+    conn = get_reporting_connection(start_date_sql)
     cursor = conn.cursor()
 
     report = {
@@ -491,12 +1572,321 @@ def get_sales_report(start_date, end_date):
 
     return report
 
-def get_dashboard_stats():
-    """Récupère les statistiques clés pour le tableau de bord de la réception."""
-    conn = get_db_connection()
+# --- SÉRIES DE CHIFFRE D'AFFAIRES (GRAPHIQUES) ---
+SERIES_GRANULARITIES = ('heure', 'jour', 'semaine', 'mois')
+SERIES_BREAKDOWNS = ('mode', 'categorie')
+SERIES_TOTAL = 'Total'
+
+# Agrégats horaires par jour : {(ventilation, 'AAAA-MM-JJ'): {(heure, série): [revenu, commandes]}}.
+# Un jour clos ne change plus : il est calculé une fois ; seul le jour courant est relu.
+# Au-delà de SERIES_CACHE_DAYS jours (environ un an par ventilation), les moins récemment
+# consultés sont oubliés.
+SERIES_CACHE_DAYS = 800
+_series_cache = OrderedDict()
+_series_cache_lock = threading.Lock()
+
+# Revenu et nombre de tickets par heure et par série, total compris (une commande
+# avec des lignes de plusieurs catégories compte une fois dans le total).
+_SERIES_QUERIES = {
+    'mode': """
+        SELECT substr(date_heure, 1, 13) AS heure, mode_paiement AS serie,
+               SUM(montant) AS revenu, COUNT(DISTINCT commande_id) AS commandes
+        FROM paiements
+        WHERE date_heure BETWEEN ? AND ?
+        GROUP BY heure, serie
+        UNION ALL
+        SELECT substr(date_heure, 1, 13), ?, SUM(montant), COUNT(DISTINCT commande_id)
+        FROM paiements
+        WHERE date_heure BETWEEN ? AND ?
+        GROUP BY 1
+    """,
+    'categorie': """
+        SELECT substr(cv.date_heure, 1, 13) AS heure, p.categorie AS serie,
+               SUM(lc.quantite * lc.prix_unitaire_vente) AS revenu, COUNT(DISTINCT cv.id) AS commandes
+        FROM commandes_ventes cv
+        JOIN lignes_commande lc ON lc.commande_id = cv.id
+        JOIN produits_services p ON lc.produit_id = p.id
+        WHERE cv.date_heure BETWEEN ? AND ?
+        GROUP BY heure, serie
+        UNION ALL
+        SELECT substr(date_heure, 1, 13), ?, SUM(total_net), COUNT(*)
+        FROM commandes_ventes
+        WHERE date_heure BETWEEN ? AND ?
+        GROUP BY 1
+    """,
+}
+
+def _series_bucket(hour, granularity):
+    """Libellé du pas de temps contenant l'heure 'AAAA-MM-JJ HH'."""
+    if granularity == 'heure':
+        return f"{hour}:00"
+    if granularity == 'jour':
+        return hour[:10]
+    if granularity == 'mois':
+        return hour[:7]
+    day = datetime.strptime(hour[:10], '%Y-%m-%d')
+    return (day - timedelta(days=day.weekday())).strftime('%Y-%m-%d')  # Lundi de la semaine
+
+def _load_series_days(breakdown, first_day, last_day):
+    """Agrégats horaires des jours [first_day, last_day], en une seule requête."""
+    days = {}
+    day = datetime.strptime(first_day, '%Y-%m-%d')
+    while day.strftime('%Y-%m-%d') <= last_day:
+        days[day.strftime('%Y-%m-%d')] = {}
+        day += timedelta(days=1)
+
+    bounds = (f"{first_day} 00:00:00", f"{last_day} 23:59:59")
+    conn = get_reporting_connection(bounds[0])
+    try:
+        params = bounds + (SERIES_TOTAL,) + bounds
+        for row in conn.cursor().execute(_SERIES_QUERIES[breakdown], params).fetchall():
+            days[row['heure'][:10]][(row['heure'], row['serie'])] = [row['revenu'] or 0, row['commandes']]
+    finally:
+        conn.close()
+    return days
+
+def get_revenue_series(start_date, end_date, granularity='jour', breakdown='mode'):
+    """
+    Séries temporelles (graphiques) entre deux dates 'AAAA-MM-JJ' incluses : chiffre
+    d'affaires, nombre de commandes et ticket moyen par pas de temps (heure, jour,
+    semaine, mois), ventilés par mode de paiement ou catégorie de produit, plus le total.
+    Retourne {'labels': [...], 'series': [{'nom', 'revenu', 'commandes', 'ticket_moyen'}]}
+    ou None si les paramètres sont invalides.
+    """
+    if granularity not in SERIES_GRANULARITIES or breakdown not in SERIES_BREAKDOWNS:
+        return None
+    try:
+        first = datetime.strptime(start_date, '%Y-%m-%d')
+        last = datetime.strptime(end_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+    if last < first:
+        return None
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    wanted = []
+    day = first
+    while day <= last:
+        wanted.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+
+    # Jours clos absents du cache (lus en un bloc contigu) + jour courant, toujours relu.
+    # Les jours trouvés sont copiés : un autre appel peut les évincer avant la fin de celui-ci.
+    cached = {}
+    with _series_cache_lock:
+        for d in wanted:
+            if d < today and (breakdown, d) in _series_cache:
+                _series_cache.move_to_end((breakdown, d))
+                cached[d] = _series_cache[(breakdown, d)]
+    missing = [d for d in wanted if d not in cached]
+    loaded = {}
+    try:
+        if missing:
+            loaded = _load_series_days(breakdown, missing[0], missing[-1])
+    except sqlite3.Error as e:
+        print(f"Erreur lors du calcul des séries de chiffre d'affaires : {e}")
+        return None
+    with _series_cache_lock:
+        for d, hours in loaded.items():
+            if d < today:
+                _series_cache[(breakdown, d)] = hours
+                _series_cache.move_to_end((breakdown, d))
+        while len(_series_cache) > SERIES_CACHE_DAYS:
+            _series_cache.popitem(last=False)
+    per_day = [cached[d] if d in cached else loaded[d] for d in wanted]
+
+    # Tous les pas de la période, même vides, pour un axe continu
+    labels = []
+    hour = first
+    while hour < last + timedelta(days=1):
+        label = _series_bucket(hour.strftime('%Y-%m-%d %H'), granularity)
+        if not labels or labels[-1] != label:
+            labels.append(label)
+        hour += timedelta(hours=1)
+    positions = {label: i for i, label in enumerate(labels)}
+
+    totals = {}
+    for hours in per_day:
+        for (hour_key, serie), (revenue, orders) in hours.items():
+            values = totals.setdefault(serie, ([0] * len(labels), [0] * len(labels)))
+            i = positions[_series_bucket(hour_key, granularity)]
+            values[0][i] += revenue
+            values[1][i] += orders
+
+    series = []
+    for name in sorted(totals, key=lambda n: (n == SERIES_TOTAL, n)):
+        revenues, orders = totals[name]
+        series.append({
+            'nom': name,
+            'revenu': [round(r, 2) for r in revenues],
+            'commandes': orders,
+            'ticket_moyen': [round(r / o) if o else 0 for r, o in zip(revenues, orders)],
+        })
+    return {'labels': labels, 'series': series}
+
+# Calendrier par nuit et par type de chambre. Chaque séjour (ou réservation confirmée à venir)
+# produit un mouvement +1 à sa première nuit et -1 au lendemain de sa dernière ; une somme
+# cumulée (fenêtre) sur le calendrier donne les chambres occupées chaque nuit, en un seul
+# passage sur les séjours au lieu d'une jointure calendrier x séjours.
+OCCUPANCY_QUERY = """
+    WITH RECURSIVE
+    calendrier(jour) AS (
+        SELECT :debut
+        UNION ALL
+        SELECT date(jour, '+1 day') FROM calendrier WHERE jour < :fin
+    ),
+    inventaire AS (
+        SELECT type_chambre, COUNT(*) AS chambres FROM chambres GROUP BY type_chambre
+    ),
+    occupations AS (
+        -- Séjours clos : au moins une nuit facturée, comme au check-out
+        SELECT chambre_id, date(date_checkin) AS debut,
+               MAX(date(date_checkout_reelle), date(date_checkin, '+1 day')) AS fin
+        FROM sejours
+        WHERE statut = 'Clos' AND date_checkout_reelle >= :debut AND date_checkin < :apres_fin
+        UNION ALL
+        -- Séjours en cours : jusqu'au départ prévu, et au moins jusqu'à la nuit de ce soir
+        SELECT chambre_id, date(date_checkin),
+               MAX(COALESCE(date_checkout_prevue, :demain), date(date_checkin, '+1 day'), :demain)
+        FROM sejours
+        WHERE date_checkout_reelle IS NULL
+    ),
+    reservations_a_venir AS (
+        -- Réservations confirmées non encore transformées en séjour, à partir d'aujourd'hui
+        SELECT r.chambre_id, MAX(r.date_debut, :aujourdhui) AS debut, r.date_fin AS fin
+        FROM reservations r
+        WHERE r.statut = 'Confirmée' AND r.date_debut < :apres_fin AND r.date_fin > :aujourdhui
+          AND NOT EXISTS (
+              SELECT 1 FROM sejours s
+              WHERE s.chambre_id = r.chambre_id AND s.date_checkout_reelle IS NULL
+                AND lower(s.client_nom) = lower(r.client_nom)
+          )
+    ),
+    periodes AS (
+        SELECT chambre_id, debut, fin, 1 AS vendue FROM occupations
+        UNION ALL
+        SELECT chambre_id, debut, fin, 0 FROM reservations_a_venir
+    ),
+    mouvements AS (
+        SELECT c.type_chambre,
+               CASE sens.valeur WHEN 1 THEN MAX(p.debut, :debut) ELSE p.fin END AS jour,
+               sens.valeur * p.vendue AS vendues,
+               sens.valeur * p.vendue * c.prix_nuit AS revenu,
+               sens.valeur * (1 - p.vendue) AS reservees
+        FROM periodes p
+        JOIN chambres c ON c.id = p.chambre_id
+        CROSS JOIN (SELECT 1 AS valeur UNION ALL SELECT -1) sens
+        WHERE p.fin > :debut AND p.debut <= :fin
+          AND (sens.valeur = 1 OR p.fin <= :fin)
+    ),
+    variations AS (
+        SELECT type_chambre, jour, SUM(vendues) AS vendues, SUM(revenu) AS revenu,
+               SUM(reservees) AS reservees
+        FROM mouvements
+        GROUP BY type_chambre, jour
+    ),
+    nuits AS (
+        SELECT cal.jour, i.type_chambre, i.chambres, t.prix AS tarif,
+               SUM(COALESCE(v.vendues, 0)) OVER cumul AS vendues,
+               SUM(COALESCE(v.revenu, 0)) OVER cumul AS revenu,
+               SUM(COALESCE(v.reservees, 0)) OVER cumul AS reservees
+        FROM calendrier cal
+        CROSS JOIN inventaire i
+        LEFT JOIN variations v ON v.type_chambre = i.type_chambre AND v.jour = cal.jour
+        LEFT JOIN tarifs_calendrier t ON t.type_chambre = i.type_chambre AND t.jour = cal.jour
+        WINDOW cumul AS (PARTITION BY i.type_chambre ORDER BY cal.jour ROWS UNBOUNDED PRECEDING)
+    ),
+    -- Une nuit tarifée au calendrier est valorisée à ce tarif, sinon au prix_nuit de chaque chambre
+    valorisees AS (
+        SELECT jour, type_chambre, chambres, vendues, reservees, COALESCE(vendues * tarif, revenu) AS revenu
+        FROM nuits
+    )
+    SELECT jour, type_chambre, chambres, vendues, ROUND(revenu, 2) AS revenu,
+           vendues + reservees AS reservees,
+           ROUND(100.0 * vendues / chambres, 1) AS taux_occupation,
+           ROUND(revenu / NULLIF(vendues, 0), 0) AS adr,
+           ROUND(revenu / chambres, 0) AS revpar,
+           ROUND(100.0 * (vendues + reservees) / chambres, 1) AS taux_reservation
+    FROM valorisees
+    ORDER BY jour, type_chambre
+"""
+
+def _occupancy_totals(chambres, vendues, revenu, reservees):
+    """Indicateurs d'occupation (taux, ADR, RevPAR) pour des totaux de nuits donnés."""
+    return {
+        'chambres': chambres,
+        'vendues': vendues,
+        'revenu': revenu,
+        'reservees': reservees,
+        'taux_occupation': round(100.0 * vendues / chambres, 1) if chambres else 0.0,
+        'adr': round(revenu / vendues) if vendues else 0,
+        'revpar': round(revenu / chambres) if chambres else 0,
+        'taux_reservation': round(100.0 * reservees / chambres, 1) if chambres else 0.0,
+    }
+
+def get_occupancy_report(start_date, end_date):
+    """
+    Calendrier d'occupation nuit par nuit ('AAAA-MM-JJ' inclus) : taux d'occupation,
+    ADR (prix moyen par chambre vendue), RevPAR (revenu par chambre disponible) et
+    taux de réservation à venir (séjours + réservations confirmées), par type de chambre.
+    Le revenu hébergement est valorisé au tarif du calendrier, à défaut au prix_nuit actuel de chaque chambre.
+    """
+    today = datetime.now()
+    params = {
+        'debut': start_date,
+        'fin': end_date,
+        'apres_fin': (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'),
+        'aujourdhui': today.strftime('%Y-%m-%d'),
+        'demain': (today + timedelta(days=1)).strftime('%Y-%m-%d'),
+    }
+
+    report = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'nights': [],
+        'by_type': [],
+        'summary': _occupancy_totals(0, 0, 0, 0),
+    }
+    if end_date < start_date:
+        return report
+
+    conn = get_reporting_connection(start_date)
     cursor = conn.cursor()
+    try:
+        cursor.execute(OCCUPANCY_QUERY, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la génération du rapport d'occupation : {e}")
+        return report
+    finally:
+        conn.close()
+
+    # Totaux par nuit (tous types confondus), par type et sur la période
+    nights = {}
+    types = {}
+    for row in rows:
+        night = nights.setdefault(row['jour'], {'jour': row['jour'], 'types': [], 'totaux': [0, 0, 0, 0]})
+        night['types'].append(row)
+        for totals in (night['totaux'], types.setdefault(row['type_chambre'], [0, 0, 0, 0])):
+            totals[0] += row['chambres']
+            totals[1] += row['vendues']
+            totals[2] += row['revenu']
+            totals[3] += row['reservees']
 
+    for night in nights.values():
+        night.update(_occupancy_totals(*night.pop('totaux')))
+    report['nights'] = list(nights.values())
+    report['by_type'] = [dict(_occupancy_totals(*totals), type_chambre=type_chambre)
+                         for type_chambre, totals in types.items()]
+    report['summary'] = _occupancy_totals(*[sum(values) for values in zip(*types.values())] or [0, 0, 0, 0])
+    return report
+
+def get_dashboard_stats():
+    """Récupère les statistiques clés pour le tableau de bord de la réception."""
     today = datetime.now().strftime('%Y-m-%d')
+    # Connexion de reporting : ventes directes de toutes les bases POS
+    conn = get_reporting_connection(datetime.now().strftime('%Y-%m-%d 00:00:00'), snapshot=False)
+    cursor = conn.cursor()
     stats = {}
 
     try:
@@ -84,12 +84,104 @@ def prefill_reservations(cursor):
             print("Réservation de test pour 'Jean TAMA' ajoutée.")
 
 
+def create_indexes(cursor):
+    """Crée les index utilisés par les requêtes de data_manager et user_manager."""
+    indexes = [
+        # Séjours : séjours actifs (index partiel), départs prévus, rapports de check-out
+        "CREATE INDEX IF NOT EXISTS idx_sejours_actifs ON sejours(chambre_id) WHERE date_checkout_reelle IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_sejours_checkout_prevue ON sejours(date_checkout_prevue)",
+        "CREATE INDEX IF NOT EXISTS idx_sejours_statut_checkout ON sejours(statut, date_checkout_reelle)",
+        # Réservations : disponibilités, arrivées du jour
+        "CREATE INDEX IF NOT EXISTS idx_reservations_statut_debut ON reservations(statut, date_debut)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_debut ON reservations(date_debut)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_chambre ON reservations(chambre_id, statut, date_debut)",
+        # Listes paginées de l'administration
+        "CREATE INDEX IF NOT EXISTS idx_chambres_type ON chambres(type_chambre, numero)",
+        "CREATE INDEX IF NOT EXISTS idx_produits_categorie_nom ON produits_services(categorie, nom)",
+        "CREATE INDEX IF NOT EXISTS idx_utilisateurs_role_nom ON utilisateurs(role, nom_utilisateur)",
+        # Commandes : consommations d'un séjour, ventes directes par période
+        "CREATE INDEX IF NOT EXISTS idx_commandes_stay ON commandes_ventes(stay_id, statut_paiement)",
+        "CREATE INDEX IF NOT EXISTS idx_commandes_statut_date ON commandes_ventes(statut_paiement, date_heure)",
+        "CREATE INDEX IF NOT EXISTS idx_commandes_date ON commandes_ventes(date_heure)",
+        # Lignes et paiements : rattachement à la commande, ventilation par période
+        "CREATE INDEX IF NOT EXISTS idx_lignes_commande ON lignes_commande(commande_id)",
+        "CREATE INDEX IF NOT EXISTS idx_paiements_commande ON paiements(commande_id)",
+        "CREATE INDEX IF NOT EXISTS idx_paiements_date ON paiements(date_heure)",
+        # Services de caisse : un seul service ouvert par caissier, derniers services clos
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_services_caisse_ouvert ON services_caisse(utilisateur_id) WHERE date_cloture IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_services_caisse_ouverture ON services_caisse(date_ouverture)",
+    ]
+    for statement in indexes:
+        cursor.execute(statement)
+
+def create_guest_index(cursor):
+    """
+    Crée l'index plein texte des noms de clients (séjours et réservations), tenu à jour
+    par triggers. Les accents sont ignorés ('Ndé' = 'Nde') et les préfixes de 2-3
+    caractères sont pré-indexés pour la recherche à la frappe.
+    rowid = id * 2 pour un séjour, id * 2 + 1 pour une réservation.
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS recherche_clients USING fts5(
+            client_nom,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+    """)
+    for table, offset in (('sejours', 0), ('reservations', 1)):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_recherche_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO recherche_clients (rowid, client_nom) VALUES (new.id * 2 + {offset}, new.client_nom);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_recherche_ad AFTER DELETE ON {table} BEGIN
+                DELETE FROM recherche_clients WHERE rowid = old.id * 2 + {offset};
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_recherche_au AFTER UPDATE OF client_nom ON {table} BEGIN
+                DELETE FROM recherche_clients WHERE rowid = old.id * 2 + {offset};
+                INSERT INTO recherche_clients (rowid, client_nom) VALUES (new.id * 2 + {offset}, new.client_nom);
+            END
+        """)
+
+    # Construction initiale pour une base existante
+    cursor.execute("SELECT COUNT(*) FROM recherche_clients")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("""
+            INSERT INTO recherche_clients (rowid, client_nom)
+            SELECT id * 2, client_nom FROM sejours
+            UNION ALL
+            SELECT id * 2 + 1, client_nom FROM reservations
+        """)
+
+def create_ledger_guards(cursor, schema='main'):
+    """
+    Rend la table 'journal_mouvements' du schéma `schema` en ajout seul : toute modification
+    ou suppression d'une écriture est refusée (ABORT), y compris hors de l'application.
+    """
+    for operation in ('UPDATE', 'DELETE'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {schema}.trg_journal_mouvements_{operation.lower()}
+            BEFORE {operation} ON journal_mouvements BEGIN
+                SELECT RAISE(ABORT, 'journal_mouvements est en ajout seul');
+            END
+        """)
+
 def create_database():
     """Crée la base de données SQLite et toutes les tables nécessaires."""
     try:
         conn = sqlite3.connect(DATABASE_NAME)
         cursor = conn.cursor()
 
+        # Pages libérées récupérables sans VACUUM complet (voir maintenance_manager).
+        # Sans effet sur une base existante : utiliser `python maintenance_manager.py convertir`
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+        # Journal WAL : les lectures ne bloquent plus les écritures des postes (persistant)
+        cursor.execute("PRAGMA journal_mode=WAL")
+
         # 1. Table des Utilisateurs
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS utilisateurs (
@@ -194,6 +286,110 @@ def create_database():
             )
         """)
         
+        # 8. Table des Sessions (côté serveur, partagées entre processus)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                utilisateur_id INTEGER, -- NULL avant connexion
+                donnees TEXT NOT NULL,
+                expiration REAL NOT NULL -- horodatage Unix
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_utilisateur ON sessions(utilisateur_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiration ON sessions(expiration)")
+
+        # 9. Registre des bases POS par point de vente (voir data_manager.POS_SHARDING)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS points_de_vente (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nom TEXT UNIQUE NOT NULL,
+                fichier TEXT NOT NULL
+            )
+        """)
+
+        # 10. Journal de maintenance (durée et espace récupéré par étape)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date_heure TEXT NOT NULL,
+                base TEXT NOT NULL,
+                etape TEXT NOT NULL, -- statistiques, vide, checkpoint
+                duree REAL NOT NULL, -- secondes
+                octets_recuperes INTEGER DEFAULT 0 NOT NULL,
+                details TEXT
+            )
+        """)
+
+        # 11. Calendrier tarifaire : prix d'une nuit par type de chambre (week-end, saison, événement).
+        # Clé primaire (type, jour) sans rowid : le total d'un séjour est une somme sur une plage de clé
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tarifs_calendrier (
+                type_chambre TEXT NOT NULL,
+                jour TEXT NOT NULL, -- AAAA-MM-JJ (nuit du jour au lendemain)
+                prix REAL NOT NULL,
+                libelle TEXT, -- Week-end, Haute saison, Festival...
+                PRIMARY KEY (type_chambre, jour)
+            ) WITHOUT ROWID
+        """)
+
+        # 12. Journal des mouvements (ventes, transferts, règlements, statuts de chambre), en ajout seul.
+        # Rejoué par ledger_manager pour reconstruire soldes des séjours et statuts des chambres
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS journal_mouvements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date_heure TEXT NOT NULL,
+                mouvement TEXT NOT NULL, -- vente, transfert, reglement, statut_chambre, solde_initial
+                sejour_id INTEGER,
+                chambre_id INTEGER,
+                commande_id INTEGER,
+                montant REAL,
+                valeur TEXT, -- Mode de paiement ou nouveau statut de la chambre
+                utilisateur_id INTEGER
+            )
+        """)
+        create_ledger_guards(cursor)
+        # Reprise d'une base existante : l'état courant devient le point de départ du journal
+        cursor.execute("SELECT COUNT(*) FROM journal_mouvements")
+        if cursor.fetchone()[0] == 0:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute("""
+                INSERT INTO journal_mouvements (date_heure, mouvement, sejour_id, montant)
+                SELECT ?, 'solde_initial', id, solde_actuel FROM sejours WHERE solde_actuel != 0 ORDER BY id
+            """, (now,))
+            cursor.execute("""
+                INSERT INTO journal_mouvements (date_heure, mouvement, chambre_id, valeur)
+                SELECT ?, 'statut_chambre', id, statut FROM chambres WHERE statut != 'Libre' ORDER BY id
+            """, (now,))
+
+        # 13. Services de caisse (ouverture / clôture par caissier) et leurs totaux par mode de paiement,
+        # cumulés à chaque commande : la clôture (rapport Z) ne relit pas les paiements
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS services_caisse (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                utilisateur_id INTEGER NOT NULL,
+                date_ouverture TEXT NOT NULL,
+                date_cloture TEXT, -- NULL tant que le service est ouvert
+                fond_initial REAL DEFAULT 0 NOT NULL,
+                especes_comptees REAL, -- Saisies à la clôture
+                FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs(id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS services_caisse_totaux (
+                service_id INTEGER NOT NULL,
+                mode_paiement TEXT NOT NULL,
+                nb_commandes INTEGER DEFAULT 0 NOT NULL,
+                montant REAL DEFAULT 0 NOT NULL,
+                PRIMARY KEY (service_id, mode_paiement)
+            ) WITHOUT ROWID
+        """)
+
+        # 14. Index des grosses tables
+        create_indexes(cursor)
+
+        # 15. Recherche plein texte des clients
+        create_guest_index(cursor)
+
         # --- APPEL DES PRÉ-REMPLISSAGES ---
         prefill_rooms(cursor)
         prefill_products(cursor)
@@ -209,4 +405,10 @@ def create_database():
             conn.close()
 
 if __name__ == '__main__':
-    create_database()
\ No newline at end of file
+    create_database()
+
+    # Ressources statiques : bibliothèques tierces locales puis fichiers empreintés (.gz, .br)
+    import assets
+    if not assets.vendor(missing_only=True):
+        print("Les bibliothèques non téléchargées seront chargées depuis leur CDN ; relancer 'python assets.py vendor'.")
+    assets.build()
\ No newline at end of file
@@ -0,0 +1,286 @@
+# import_manager.py
+"""
+Import en masse de fichiers CSV (chambres, produits, réservations) : le fichier est lu
+ligne à ligne, chaque ligne est validée puis écrite par lots (executemany), tous dans une seule
+transaction. Les erreurs sont rapportées avec leur numéro de ligne.
+
+    python import_manager.py chambres chambres.csv [--tout-ou-rien] [--simulation]
+
+En-têtes attendus (séparateur ',' ou ';', encodage UTF-8) :
+    chambres      : numero, type_chambre, prix_nuit
+    produits      : nom, prix_unitaire, type_vente, categorie
+    reservations  : chambre, client_nom, date_debut, date_fin   (chambre = numéro)
+"""
+import argparse
+import csv
+import itertools
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+import data_manager
+import metrics_manager
+
+BATCH_SIZE = 5000
+# Au-delà, les erreurs sont comptées mais plus détaillées
+MAX_REPORTED_ERRORS = 200
+
+PRODUCT_SALE_TYPES = ('Consommation', 'Service Auxiliaire')
+
+# --- VALIDATION ---
+def _parse_amount(value, label):
+    try:
+        amount = float(value.replace(' ', '').replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"{label} invalide : '{value}'")
+    if amount < 0:
+        raise ValueError(f"{label} négatif : '{value}'")
+    return amount
+
+def _parse_date(value, label):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"{label} invalide (AAAA-MM-JJ attendu) : '{value}'")
+
+def _required(row, column):
+    value = (row.get(column) or '').strip()
+    if not value:
+        raise ValueError(f"{column} manquant")
+    return value
+
+class Importer:
+    """
+    Un type d'import : colonnes obligatoires, `parse(ligne, contexte)` qui retourne les
+    paramètres SQL ou lève ValueError, et `write(conn, lot)` qui écrit un lot [(numéro de
+    ligne, paramètres)] dans la transaction de l'import et retourne les lignes refusées
+    [(numéro de ligne, message)]. `prepare(conn)`, facultatif, construit le contexte de
+    validation à partir de la connexion de l'import.
+    """
+
+    def __init__(self, columns, parse, write, prepare=None):
+        self.columns = columns
+        self.parse = parse
+        self.write = write
+        self.prepare = prepare
+
+# Chambres : le numéro identifie la chambre, une chambre existante est mise à jour
+def _parse_room(row, context):
+    return (_required(row, 'numero'), _required(row, 'type_chambre'),
+            _parse_amount(_required(row, 'prix_nuit'), 'prix_nuit'))
+
+def _write_rooms(conn, batch):
+    conn.executemany("""
+        INSERT INTO chambres (numero, type_chambre, prix_nuit) VALUES (?, ?, ?)
+        ON CONFLICT(numero) DO UPDATE SET type_chambre = excluded.type_chambre, prix_nuit = excluded.prix_nuit
+    """, [params for _, params in batch])
+    return []
+
+# Produits : identifiés par (catégorie, nom) ; dans un lot, la dernière ligne l'emporte
+def _parse_product(row, context):
+    type_vente = _required(row, 'type_vente')
+    if type_vente not in PRODUCT_SALE_TYPES:
+        raise ValueError(f"type_vente inconnu : '{type_vente}' (attendu : {', '.join(PRODUCT_SALE_TYPES)})")
+    return (_required(row, 'nom'), _parse_amount(_required(row, 'prix_unitaire'), 'prix_unitaire'),
+            type_vente, _required(row, 'categorie'))
+
+def _write_products(conn, batch):
+    unique = {(categorie, nom): (nom, prix, type_vente, categorie) for _, (nom, prix, type_vente, categorie) in batch}
+    rows = list(unique.values())
+    conn.executemany("""
+        UPDATE produits_services SET prix_unitaire = ?, type_vente = ?
+        WHERE categorie = ? AND nom = ?
+    """, [(prix, type_vente, categorie, nom) for nom, prix, type_vente, categorie in rows])
+    conn.executemany("""
+        INSERT INTO produits_services (nom, prix_unitaire, type_vente, categorie)
+        SELECT ?, ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM produits_services WHERE categorie = ? AND nom = ?)
+    """, [row + (row[3], row[0]) for row in rows])
+    return []
+
+# Réservations : validées contre la base, puis revérifiées au moment de l'écriture du lot
+def _reservation_context(conn):
+    return {
+        'cursor': conn.cursor(),
+        'rooms': {row['numero']: row['id'] for row in conn.execute("SELECT id, numero FROM chambres")},
+        'accepted': {},  # chambre_id -> [(début, fin)] des lignes déjà acceptées du fichier
+    }
+
+def _parse_reservation(row, context):
+    numero = _required(row, 'chambre')
+    room_id = context['rooms'].get(numero)
+    if room_id is None:
+        raise ValueError(f"chambre inconnue : '{numero}'")
+    client_nom = _required(row, 'client_nom')
+    date_debut = _parse_date(_required(row, 'date_debut'), 'date_debut')
+    date_fin = _parse_date(_required(row, 'date_fin'), 'date_fin')
+    if date_fin <= date_debut:
+        raise ValueError("date_fin doit être postérieure à date_debut")
+
+    conflict = data_manager.find_booking_conflict(context['cursor'], room_id, date_debut, date_fin)
+    if conflict:
+        raise ValueError(f"chambre {numero} déjà prise : {conflict}")
+    periods = context['accepted'].setdefault(room_id, [])
+    if any(start < date_fin and end > date_debut for start, end in periods):
+        raise ValueError(f"chambre {numero} réservée deux fois dans le fichier sur cette période")
+    periods.append((date_debut, date_fin))
+    return (room_id, client_nom, date_debut, date_fin)
+
+def _write_reservations(conn, batch):
+    # Revérifié sur la connexion d'écriture (une simulation valide sur une connexion en lecture)
+    cursor = conn.cursor()
+    rejected, rows = [], []
+    for line, params in batch:
+        conflict = data_manager.find_booking_conflict(cursor, *params)
+        if conflict:
+            rejected.append((line, f"chambre déjà prise : {conflict}"))
+        else:
+            rows.append(params)
+    conn.executemany("""
+        INSERT INTO reservations (chambre_id, client_nom, date_debut, date_fin) VALUES (?, ?, ?, ?)
+    """, [(room_id, client_nom, date_debut, date_fin) for room_id, client_nom, date_debut, date_fin in rows])
+    free_rooms = [row['id'] for row in conn.execute(
+        "SELECT id FROM chambres WHERE statut = 'Libre' AND id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted({row[0] for row in rows})),))]
+    conn.executemany("UPDATE chambres SET statut = 'Réservée' WHERE id = ?", [(room_id,) for room_id in free_rooms])
+    for room_id in free_rooms:
+        data_manager.record_movement('statut_chambre', chambre_id=room_id, valeur='Réservée')
+    return rejected
+
+IMPORTERS = {
+    'chambres': Importer(('numero', 'type_chambre', 'prix_nuit'), _parse_room, _write_rooms),
+    'produits': Importer(('nom', 'prix_unitaire', 'type_vente', 'categorie'), _parse_product, _write_products),
+    'reservations': Importer(('chambre', 'client_nom', 'date_debut', 'date_fin'), _parse_reservation,
+                             _write_reservations, prepare=_reservation_context),
+}
+
+# --- IMPORT ---
+def _read_rows(lines):
+    """DictReader sur un flux texte, séparateur (',' ou ';') déduit de la ligne d'en-tête."""
+    lines = iter(lines)
+    header = next(lines, '')
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    reader = csv.DictReader(itertools.chain([header], lines), delimiter=delimiter)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    return reader
+
+class _Cancelled(Exception):
+    """Interrompt l'import en mode tout ou rien : l'unité de travail est annulée."""
+
+def _validated_batches(importer, reader, context, error, all_or_nothing, batch_size):
+    """Lots [(ligne, paramètres)] des lignes valides, au fil de la lecture."""
+    batch = []
+    for row in reader:
+        try:
+            batch.append((reader.line_num, importer.parse(row, context)))
+        except ValueError as e:
+            error(reader.line_num, str(e))
+            if all_or_nothing:
+                raise _Cancelled()
+            continue
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@data_manager.queued_write
+def _write_file(importer, reader, result, error, all_or_nothing, batch_size):
+    """
+    Valide et écrit tout le fichier dans une seule unité de travail, un executemany par lot :
+    les lots sont écrits au fil de la lecture, sans garder le fichier en mémoire. En tout ou
+    rien, la première ligne invalide ou refusée à l'écriture annule toute la transaction.
+    Retourne False en cas d'erreur (rien n'est écrit).
+    """
+    imported = 0
+    try:
+        with data_manager.unit_of_work() as conn:
+            context = importer.prepare(conn) if importer.prepare else None
+            for batch in _validated_batches(importer, reader, context, error, all_or_nothing, batch_size):
+                rejected = importer.write(conn, batch)
+                for line, message in rejected:
+                    error(line, message)
+                if rejected and all_or_nothing:
+                    raise _Cancelled()
+                imported += len(batch) - len(rejected)
+    except _Cancelled:
+        result['annule'] = True
+        return True
+    except (sqlite3.Error, csv.Error, UnicodeDecodeError) as e:
+        print(f"Erreur lors de l'écriture de l'import : {e}")
+        return False
+    result['importees'] = imported
+    return True
+
+def import_csv(kind, lines, all_or_nothing=False, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Importe un flux texte CSV (`lines` : fichier ouvert ou itérable de lignes) de type `kind`.
+    Tout l'import est une seule transaction, écrite lot par lot (`batch_size` lignes) par la
+    file d'écriture : les autres écritures attendent la fin de l'import. Les lignes invalides
+    sont ignorées et rapportées ; avec `all_or_nothing`, la première ligne invalide ou refusée
+    annule tout. `dry_run` valide sur une connexion en lecture, sans rien écrire. En cas
+    d'erreur, rien n'est écrit et None est retourné.
+    Retourne {'importees', 'nb_erreurs', 'erreurs': [(ligne, message)], 'annule'} ou None.
+    """
+    importer = IMPORTERS.get(kind)
+    if importer is None:
+        return None
+    result = {'importees': 0, 'nb_erreurs': 0, 'erreurs': [], 'annule': False}
+
+    def error(line, message):
+        result['nb_erreurs'] += 1
+        if len(result['erreurs']) < MAX_REPORTED_ERRORS:
+            result['erreurs'].append((line, message))
+
+    start = time.perf_counter()
+    try:
+        reader = _read_rows(lines)
+        missing = [column for column in importer.columns if column not in (reader.fieldnames or [])]
+    except (csv.Error, UnicodeDecodeError) as e:
+        print(f"Erreur lors de l'import {kind} : {e}")
+        return None
+    if missing:
+        error(1, f"colonne(s) manquante(s) : {', '.join(missing)}")
+        result['annule'] = True
+        return result
+
+    if dry_run:
+        result['annule'] = True
+        conn = data_manager.get_read_only_connection()
+        try:
+            context = importer.prepare(conn) if importer.prepare else None
+            for batch in _validated_batches(importer, reader, context, error, all_or_nothing, batch_size):
+                result['importees'] += len(batch)
+        except _Cancelled:
+            pass
+        except (sqlite3.Error, csv.Error, UnicodeDecodeError) as e:
+            print(f"Erreur lors de l'import {kind} : {e}")
+            return None
+        finally:
+            conn.close()
+        return result
+
+    if not _write_file(importer, reader, result, error, all_or_nothing, batch_size):
+        return None
+    metrics_manager.observe('hotelpos_import_duration_seconds', time.perf_counter() - start, {'type': kind})
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import CSV en masse (chambres, produits, réservations).")
+    parser.add_argument('type', choices=sorted(IMPORTERS))
+    parser.add_argument('fichier')
+    parser.add_argument('--tout-ou-rien', action='store_true', help="Annule tout l'import à la première erreur.")
+    parser.add_argument('--simulation', action='store_true', help="Valide le fichier sans rien écrire.")
+    args = parser.parse_args()
+
+    with open(args.fichier, encoding='utf-8-sig', newline='') as f:
+        result = import_csv(args.type, f, args.tout_ou_rien, args.simulation)
+    if result is None:
+        raise SystemExit(1)
+    for line, message in result['erreurs']:
+        print(f"Ligne {line} : {message}")
+    state = "annulé" if result['annule'] else "validé"
+    print(f"{result['importees']} ligne(s) valide(s), {result['nb_erreurs']} erreur(s) ; import {state}.")
+    raise SystemExit(1 if result['nb_erreurs'] else 0)
@@ -0,0 +1,167 @@
+# ledger_manager.py
+"""
+Journal des mouvements ('journal_mouvements', en ajout seul : les triggers de db_setup refusent
+toute modification ou suppression). Rejoué dans l'ordre, il suffit à reconstruire le solde
+de chaque séjour et le statut de chaque chambre :
+
+    transfert       solde du séjour += montant
+    reglement       solde du séjour = montant (facture finale du check-out)
+    solde_initial   solde du séjour = montant (reprise d'une base antérieure au journal)
+    statut_chambre  statut de la chambre = valeur
+    vente           vente directe encaissée, sans effet sur les soldes (base du point de vente)
+
+    python ledger_manager.py verifier       # compare l'état rejoué aux tables, sans rien modifier
+    python ledger_manager.py reconstruire   # réécrit les soldes et statuts qui divergent du journal
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import data_manager
+import metrics_manager
+
+# Écart toléré entre un solde rejoué et le solde en base (montants décimaux)
+BALANCE_TOLERANCE = 0.005
+# Statut d'une chambre sans mouvement (valeur par défaut de la colonne)
+DEFAULT_ROOM_STATUS = 'Libre'
+# Mouvements lus par lot pendant le rejeu
+FETCH_SIZE = 10000
+
+# --- REJEU ---
+def replay(conn):
+    """
+    Rejoue le journal de la base principale de `conn`, dans l'ordre d'écriture. Retourne
+    ({sejour_id: solde}, {chambre_id: statut}, nombre de mouvements rejoués).
+    """
+    balances, statuses = {}, {}
+    count = 0
+    cursor = conn.execute("""
+        SELECT mouvement, sejour_id, chambre_id, montant, valeur FROM main.journal_mouvements
+        WHERE mouvement != 'vente'
+        ORDER BY id
+    """)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        count += len(rows)
+        for mouvement, sejour_id, chambre_id, montant, valeur in rows:
+            if mouvement == 'transfert':
+                balances[sejour_id] = balances.get(sejour_id, 0.0) + montant
+            elif mouvement == 'statut_chambre':
+                statuses[chambre_id] = valeur
+            elif mouvement in ('reglement', 'solde_initial'):
+                balances[sejour_id] = montant
+    return balances, statuses, count
+
+def _differences(conn, balances, statuses, archived_stays=None):
+    """
+    Compare l'état rejoué aux tables : [(table, id, valeur attendue, valeur en base)].
+    `archived_stays` donne les (id, solde) des séjours archivés, signalés sous 'archive.sejours'.
+    Un séjour absent des tables est signalé avec None ; une chambre supprimée est ignorée,
+    comme les séjours archivés avant la mise en place du journal.
+    """
+    differences = []
+    seen = set()
+    for stay_id, solde in conn.execute("SELECT id, solde_actuel FROM main.sejours"):
+        seen.add(stay_id)
+        expected = balances.get(stay_id, 0.0)
+        if abs((solde or 0.0) - expected) > BALANCE_TOLERANCE:
+            differences.append(('sejours', stay_id, expected, solde))
+    for stay_id, solde in archived_stays or ():
+        if stay_id in balances:
+            seen.add(stay_id)
+            if abs((solde or 0.0) - balances[stay_id]) > BALANCE_TOLERANCE:
+                differences.append(('archive.sejours', stay_id, balances[stay_id], solde))
+    differences.extend(('sejours', stay_id, balances[stay_id], None) for stay_id in sorted(balances.keys() - seen))
+
+    for room_id, statut in conn.execute("SELECT id, statut FROM main.chambres"):
+        expected = statuses.get(room_id, DEFAULT_ROOM_STATUS)
+        if statut != expected:
+            differences.append(('chambres', room_id, expected, statut))
+    return differences
+
+def verify():
+    """
+    Rejoue le journal et le compare aux tables (base principale et archive), dans une seule
+    transaction de lecture. Retourne {mouvements, sejours, chambres, ecarts, duree}, ou None.
+    """
+    start = time.perf_counter()
+    conn = data_manager.get_read_only_connection()
+    try:
+        archived = data_manager.attach_archive(conn, read_only=True)
+        conn.execute("BEGIN")  # Journal et tables lus dans le même état
+        balances, statuses, count = replay(conn)
+        archived_stays = conn.execute("SELECT id, solde_actuel FROM archive.sejours") if archived else None
+        differences = _differences(conn, balances, statuses, archived_stays)
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la vérification du journal : {e}")
+        return None
+    finally:
+        conn.close()
+
+    duration = time.perf_counter() - start
+    metrics_manager.observe('hotelpos_ledger_replay_seconds', duration)
+    return {'mouvements': count, 'sejours': len(balances), 'chambres': len(statuses),
+            'ecarts': differences, 'duree': duration}
+
+@data_manager.queued_write(on_error=None)
+def rebuild():
+    """
+    Réécrit depuis le journal les soldes et statuts qui en divergent, dans la base principale
+    comme dans l'archive (sous verrou d'écriture : aucun mouvement ne peut s'intercaler).
+    L'archive ne peut pas être attachée dans la transaction en cours : elle a sa propre unité
+    de travail, ouverte après celle de la base principale (même ordre que archive_manager).
+    Retourne la liste des corrections, ou None en cas d'erreur.
+    """
+    try:
+        with data_manager.unit_of_work() as conn:
+            balances, statuses, _ = replay(conn)
+            if os.path.exists(data_manager.ARCHIVE_DATABASE_NAME):
+                with data_manager.unit_of_work(data_manager.ARCHIVE_DATABASE_NAME) as archive_conn:
+                    archived_stays = archive_conn.execute("SELECT id, solde_actuel FROM sejours").fetchall()
+                    corrections = _apply_corrections(conn, balances, statuses, archived_stays)
+                    archive_conn.executemany("UPDATE sejours SET solde_actuel = ? WHERE id = ?",
+                                             [(expected, row_id) for table, row_id, expected, _ in corrections
+                                              if table == 'archive.sejours'])
+            else:
+                corrections = _apply_corrections(conn, balances, statuses)
+        return corrections
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la reconstruction depuis le journal : {e}")
+        return None
+
+def _apply_corrections(conn, balances, statuses, archived_stays=None):
+    """Corrige les séjours et chambres de la base principale. Retourne toutes les corrections à faire."""
+    corrections = [entry for entry in _differences(conn, balances, statuses, archived_stays) if entry[3] is not None]
+    conn.executemany("UPDATE sejours SET solde_actuel = ? WHERE id = ?",
+                     [(expected, row_id) for table, row_id, expected, _ in corrections if table == 'sejours'])
+    conn.executemany("UPDATE chambres SET statut = ? WHERE id = ?",
+                     [(expected, row_id) for table, row_id, expected, _ in corrections if table == 'chambres'])
+    return corrections
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rejeu du journal des mouvements HotelPOS.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('verifier', help="Compare soldes et statuts au journal rejoué.")
+    subparsers.add_parser('reconstruire', help="Réécrit les soldes et statuts depuis le journal.")
+    args = parser.parse_args()
+
+    if args.command == 'verifier':
+        result = verify()
+        if result is None:
+            raise SystemExit(1)
+        print(f"{result['mouvements']} mouvement(s) rejoué(s) en {result['duree']:.2f} s : "
+              f"{result['sejours']} séjour(s), {result['chambres']} chambre(s).")
+        for table, row_id, expected, actual in result['ecarts'][:50]:
+            print(f"  {table} N°{row_id} : journal {expected!r}, base {actual!r}")
+        print(f"{len(result['ecarts'])} écart(s).")
+        raise SystemExit(1 if result['ecarts'] else 0)
+    else:
+        corrections = rebuild()
+        if corrections is None:
+            raise SystemExit(1)
+        for table, row_id, expected, actual in corrections:
+            print(f"  {table} N°{row_id} : {actual!r} -> {expected!r}")
+        print(f"{len(corrections)} correction(s).")
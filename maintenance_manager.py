@@ -0,0 +1,232 @@
+# maintenance_manager.py
+"""
+Maintenance des bases SQLite, à exécuter en heures creuses :
+
+    1. statistiques : ANALYZE (échantillonné) puis PRAGMA optimize, pour des plans à jour
+    2. vide : PRAGMA incremental_vacuum par petits lots, rend au système les pages libres
+    3. checkpoint : PRAGMA wal_checkpoint(TRUNCATE), ramène le fichier WAL à zéro
+
+Chaque étape est enregistrée dans la table 'maintenance_journal' (durée, octets récupérés).
+
+    python maintenance_manager.py executer [--etapes statistiques,vide,checkpoint]
+    python maintenance_manager.py journal
+    python maintenance_manager.py convertir   # passage unique d'une base existante en auto_vacuum incrémental
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import data_manager
+import metrics_manager
+
+STEPS = ('statistiques', 'vide', 'checkpoint')
+
+# Lignes examinées par index pour ANALYZE : statistiques approchées, durée bornée
+ANALYSIS_LIMIT = 1000
+
+# Pages rendues par transaction, puis pause (secondes) pour laisser passer les écritures
+VACUUM_PAGES_PER_STEP = 500
+VACUUM_PAUSE = 0.01
+
+# Fenêtre d'heures creuses (heure de début incluse, heure de fin exclue) et fréquence de vérification
+MAINTENANCE_WINDOW = (3, 5)
+SCHEDULER_INTERVAL = 600
+
+# --- ÉTAPES ---
+def _refresh_statistics(conn, database):
+    conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    return 0, None
+
+def _incremental_vacuum(conn, database):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return 0, f"auto_vacuum non incrémental ({free} page(s) libre(s)) : lancer 'convertir'"
+
+    freed = 0
+    while True:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if before == 0:
+            break
+        # Chaque appel est une courte transaction d'écriture. executescript() exécute le PRAGMA
+        # jusqu'au bout : execute() ne ferait qu'un pas, soit une seule page libérée
+        conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})")
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        freed += before - after
+        if after >= before:
+            break
+        time.sleep(VACUUM_PAUSE)
+    return freed * page_size, f"{freed} page(s) libérée(s)"
+
+def _checkpoint(conn, database):
+    wal_path = database + '-wal'
+    before = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    after = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    details = f"{checkpointed}/{log_pages} page(s) reportée(s)" + (" (lecteurs actifs)" if busy else "")
+    return max(before - after, 0), details
+
+_ACTIONS = {
+    'statistiques': _refresh_statistics,
+    'vide': _incremental_vacuum,
+    'checkpoint': _checkpoint,
+}
+
+def _record(conn, database, step, duration, reclaimed, details):
+    conn.execute("""
+        INSERT INTO maintenance_journal (date_heure, base, etape, duree, octets_recuperes, details)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), database, step, duration, reclaimed, details))
+    conn.commit()
+
+def run_maintenance(steps=STEPS, databases=None):
+    """
+    Exécute les étapes demandées sur chaque base (par défaut toutes : principale, archive,
+    points de vente). Retourne la liste des résultats [{base, etape, duree, octets_recuperes,
+    details}], ou None en cas d'erreur.
+    """
+    databases = databases or data_manager.list_database_files()
+    results = []
+    journal = data_manager.get_db_connection()
+    try:
+        for database in databases:
+            conn = data_manager.get_db_connection(database)
+            conn.isolation_level = None  # Pas de transaction implicite autour des PRAGMA
+            try:
+                for step in steps:
+                    start = time.perf_counter()
+                    reclaimed, details = _ACTIONS[step](conn, database)
+                    duration = time.perf_counter() - start
+                    metrics_manager.observe('hotelpos_maintenance_step_seconds', duration, {'etape': step})
+                    _record(journal, database, step, duration, reclaimed, details)
+                    results.append({'base': database, 'etape': step, 'duree': duration,
+                                    'octets_recuperes': reclaimed, 'details': details})
+            finally:
+                conn.close()
+        return results
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la maintenance : {e}")
+        return None
+    finally:
+        journal.close()
+
+def get_maintenance_log(limit=50):
+    conn = data_manager.get_db_connection()
+    try:
+        return conn.execute("SELECT * FROM maintenance_journal ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+
+def convert_to_incremental(database=None):
+    """
+    Passe une base existante en auto_vacuum incrémental. Nécessite un VACUUM complet,
+    qui bloque les écritures le temps de réécrire le fichier : à faire application arrêtée.
+    """
+    conn = data_manager.get_db_connection(database)
+    conn.isolation_level = None
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la conversion : {e}")
+        return False
+    finally:
+        conn.close()
+
+# --- PLANIFICATION ---
+CLAIM_STEP = 'planification'
+
+def claim_today():
+    """
+    Réserve la maintenance du jour pour ce processus : vérification et inscription au journal
+    dans une même transaction BEGIN IMMEDIATE, donc atomiques entre processus. Faux si une
+    maintenance (planifiée ou manuelle) a déjà eu lieu ou est en cours aujourd'hui.
+    """
+    conn = data_manager.get_db_connection()
+    conn.isolation_level = None  # Transaction gérée explicitement
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT 1 FROM maintenance_journal WHERE date_heure >= ? LIMIT 1",
+                           (datetime.now().strftime('%Y-%m-%d 00:00:00'),)).fetchone()
+        if row is None:
+            conn.execute("""
+                INSERT INTO maintenance_journal (date_heure, base, etape, duree, octets_recuperes, details)
+                VALUES (?, ?, ?, 0, 0, ?)
+            """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), data_manager.DATABASE_NAME, CLAIM_STEP,
+                  f"processus {os.getpid()}"))
+        conn.execute("COMMIT")
+        return row is None
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.close()
+
+def _scheduler_loop(stop_event):
+    while not stop_event.wait(SCHEDULER_INTERVAL):
+        start_hour, end_hour = MAINTENANCE_WINDOW
+        if not start_hour <= datetime.now().hour < end_hour:
+            continue
+        try:
+            if not claim_today():
+                continue
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la lecture du journal de maintenance : {e}")
+            continue
+        run_maintenance()
+
+_scheduler_stop = None
+
+def start_scheduler():
+    """
+    Démarre la maintenance automatique (une fois par jour, dans MAINTENANCE_WINDOW). Plusieurs
+    processus peuvent la démarrer : claim_today() garantit une seule exécution par jour.
+    """
+    global _scheduler_stop
+    if _scheduler_stop is not None:
+        return
+    _scheduler_stop = threading.Event()
+    threading.Thread(target=_scheduler_loop, args=(_scheduler_stop,), name='hotelpos-maintenance',
+                     daemon=True).start()
+
+def stop_scheduler():
+    global _scheduler_stop
+    if _scheduler_stop is not None:
+        _scheduler_stop.set()
+        _scheduler_stop = None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintenance des bases HotelPOS.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('executer', help="Exécute la maintenance maintenant.")
+    run_parser.add_argument('--etapes', default=','.join(STEPS),
+                            help=f"Étapes séparées par des virgules parmi : {', '.join(STEPS)}.")
+    subparsers.add_parser('journal', help="Affiche les dernières étapes exécutées.")
+    convert_parser = subparsers.add_parser('convertir', help="Active l'auto_vacuum incrémental (VACUUM complet).")
+    convert_parser.add_argument('--base', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'executer':
+        steps = [step.strip() for step in args.etapes.split(',') if step.strip()]
+        unknown = [step for step in steps if step not in STEPS]
+        if unknown:
+            parser.error(f"Étape(s) inconnue(s) : {', '.join(unknown)}")
+        result = run_maintenance(steps)
+        if result is None:
+            raise SystemExit(1)
+        for entry in result:
+            print(f"{entry['base']} / {entry['etape']} : {entry['duree']:.2f} s, "
+                  f"{entry['octets_recuperes'] / 1024:.0f} Ko récupérés. {entry['details'] or ''}")
+    elif args.command == 'journal':
+        for row in get_maintenance_log():
+            print(f"{row['date_heure']}  {row['base']}  {row['etape']}  {row['duree']:.2f} s  "
+                  f"{row['octets_recuperes'] / 1024:.0f} Ko  {row['details'] or ''}")
+    else:
+        if not convert_to_incremental(args.base):
+            raise SystemExit(1)
+        print("auto_vacuum incrémental activé.")
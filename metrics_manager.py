@@ -0,0 +1,225 @@
+# metrics_manager.py
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+# Seuil (en millisecondes) au-delà duquel une requête SQL est journalisée comme lente
+SLOW_QUERY_THRESHOLD_MS = 200
+
+# Bornes des histogrammes (en secondes), proches des valeurs par défaut de Prometheus
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+_lock = threading.Lock()
+_histograms = {}
+_gauges = {}
+_counters = {}
+_query_listeners = []
+
+# --- HISTOGRAMMES ---
+class Histogram:
+    """
+    Histogramme cumulatif au format Prometheus pour un jeu d'étiquettes donné. Chaque
+    histogramme a son propre verrou : des requêtes de natures différentes ne s'attendent pas.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+def observe(name, value, labels=None, buckets=DURATION_BUCKETS):
+    """Enregistre une observation dans l'histogramme `name` pour les étiquettes données."""
+    key = (name, tuple(sorted((labels or {}).items())))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _lock:  # Seule la création d'un histogramme passe par le verrou global
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram(buckets)
+    histogram.observe(value)
+
+def reset():
+    """Vide toutes les métriques collectées (utile après un redémarrage à chaud)."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+# --- COMPTEURS ---
+def increment(name, labels=None, amount=1):
+    """Incrémente le compteur `name` pour les étiquettes données."""
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+# --- JAUGES ---
+def register_gauge(name, callback):
+    """Déclare une jauge dont la valeur courante est lue par `callback()` à chaque export."""
+    with _lock:
+        _gauges[name] = callback
+
+# --- INSTRUMENTATION SQL ---
+_re_comments = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_re_strings = re.compile(r"'(?:[^']|'')*'")
+_re_numbers = re.compile(r"\b\d+(?:\.\d+)?\b")
+_re_spaces = re.compile(r"\s+")
+
+def normalize_sql(sql):
+    """Réduit une requête à sa forme canonique : sans commentaires, littéraux remplacés par '?'."""
+    sql = _re_comments.sub(" ", sql)
+    sql = _re_strings.sub("?", sql)
+    sql = _re_numbers.sub("?", sql)
+    return _re_spaces.sub(" ", sql).strip()
+
+def add_query_listener(callback):
+    """Enregistre une fonction appelée avec (sql, params) pour chaque requête exécutée."""
+    _query_listeners.append(callback)
+
+def remove_query_listener(callback):
+    if callback in _query_listeners:
+        _query_listeners.remove(callback)
+
+# Instructions de contrôle de transaction : leur durée est surtout l'attente du verrou
+# d'écriture (BEGIN IMMEDIATE) ou la synchronisation disque (COMMIT), mesurées à part
+TRANSACTION_STATEMENTS = {'BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE'}
+
+_re_main_table = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:\w+\.)?(\w+)", re.I)
+MAX_CACHED_QUERIES = 2000
+
+@lru_cache(maxsize=MAX_CACHED_QUERIES)  # Verrou interne : appelé depuis tous les threads
+def query_labels(sql):
+    """
+    Étiquettes d'une requête pour les histogrammes : nature de l'instruction et première table
+    citée. Leur nombre est borné par le schéma, quel que soit le texte des requêtes. Le dict
+    retourné est partagé par le cache : ne pas le modifier.
+    """
+    words = sql.lstrip().split(None, 1)
+    statement = words[0].upper() if words else ''
+    match = _re_main_table.search(sql)
+    return {'statement': statement, 'table': match.group(1).lower() if match else ''}
+
+def record_query(sql, duration, rows):
+    """
+    Enregistre la durée et le nombre de lignes d'une requête (étiquetées par query_labels()),
+    et journalise le texte complet des requêtes lentes. Le contrôle de transaction a sa
+    propre métrique et n'est pas journalisé comme requête lente.
+    """
+    labels = query_labels(sql)
+    if labels['statement'] in TRANSACTION_STATEMENTS:
+        observe('hotelpos_sql_transaction_seconds', duration, {'statement': labels['statement']})
+        return
+    observe('hotelpos_sql_query_duration_seconds', duration, labels)
+    if rows is not None and rows >= 0:
+        observe('hotelpos_sql_query_rows', rows, labels, buckets=ROW_BUCKETS)
+    if duration * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        print(f"Requête SQL lente ({duration * 1000:.1f} ms, {rows} ligne(s)) : {normalize_sql(sql)}")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Curseur qui mesure la durée et le volume de chaque requête exécutée."""
+
+    _last_sql = None
+
+    def execute(self, sql, parameters=()):
+        for listener in _query_listeners:
+            listener(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._last_sql = sql
+            record_query(sql, time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        for listener in _query_listeners:
+            for parameters in seq_of_parameters:
+                listener(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._last_sql = sql
+            record_query(sql, time.perf_counter() - start, self.rowcount)
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._last_sql is not None:
+            observe('hotelpos_sql_query_rows', len(rows), query_labels(self._last_sql), buckets=ROW_BUCKETS)
+        return rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connexion SQLite dont tous les curseurs (y compris conn.execute) sont instrumentés."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() ne passe pas par cursor() : on le redirige explicitement
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# --- REQUÊTES HTTP ---
+def record_request(endpoint, method, status, duration):
+    observe('hotelpos_http_request_duration_seconds', duration,
+            {'endpoint': endpoint or 'inconnu', 'method': method, 'status': str(status)})
+
+# --- EXPORT PROMETHEUS ---
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    escaped = []
+    for key, value in items:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def render_prometheus():
+    """Retourne toutes les métriques au format texte d'exposition Prometheus (0.0.4)."""
+    with _lock:
+        histograms = list(_histograms.items())
+    snapshot = []
+    for (name, labels), h in histograms:
+        with h.lock:
+            snapshot.append((name, labels, list(h.buckets), list(h.counts), h.total, h.count))
+    snapshot.sort(key=lambda entry: (entry[0], entry[1]))
+
+    lines = []
+    current_name = None
+    for name, labels, buckets, counts, total, count in snapshot:
+        if name != current_name:
+            lines.append(f"# TYPE {name} histogram")
+            current_name = name
+        for bound, bucket_count in zip(buckets, counts):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+    current_name = None
+    for (name, labels), value in counters:
+        if name != current_name:
+            lines.append(f"# TYPE {name} counter")
+            current_name = name
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name, callback in gauges:
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {callback()}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+# pagination.py
+"""Outils de pagination par clé (keyset) partagés par data_manager et user_manager."""
+import base64
+import json
+
+# Nombre de lignes par page par défaut, et plafond accepté depuis l'URL
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    """Encode la clé de tri de la dernière ligne affichée en jeton opaque pour l'URL."""
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size):
+    """Décode un jeton produit par encode_cursor(). Retourne None si absent ou invalide."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+def clamp_limit(limit):
+    """Borne la taille de page demandée entre 1 et MAX_PAGE_SIZE."""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def build_page(rows, limit, key):
+    """
+    Construit le résultat d'une page à partir de `limit + 1` lignes lues :
+    la ligne excédentaire indique seulement qu'une page suivante existe.
+    """
+    has_next = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = encode_cursor(key(items[-1])) if has_next and items else None
+    return {'items': items, 'next_cursor': next_cursor}
+
+class PageStream:
+    """
+    Page lue pendant le rendu (templates en flux) : itérer dessus exécute la requête à la
+    première ligne demandée et produit au plus `limit` lignes, sans les garder en mémoire.
+    `rows` est un générateur de `limit + 1` lignes ; next_cursor n'est connu qu'une fois
+    la page parcourue (le lien « Suivant » se place donc après la liste). Un seul parcours.
+    """
+
+    def __init__(self, rows, limit, key):
+        self.rows = rows
+        self.limit = limit
+        self.key = key
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        try:
+            for count, row in enumerate(self.rows):
+                if count == self.limit:
+                    self.next_cursor = encode_cursor(self.key(last)) if last is not None else None
+                    break
+                last = row
+                yield row
+        finally:
+            self.rows.close()  # Libère la connexion même si le rendu s'interrompt
+
+    def collect(self):
+        """Lit toute la page : même résultat que build_page()."""
+        items = list(self)
+        return {'items': items, 'next_cursor': self.next_cursor}
@@ -0,0 +1,719 @@
+# perf_checks.py
+"""
+Contrôles de performance exécutables en ligne de commande (intégration continue).
+
+    python perf_checks.py plans           # vérifie les plans de requête de data_manager / user_manager
+    python perf_checks.py booking-stress  # réservations concurrentes : aucune double réservation
+    python perf_checks.py write-throughput  # débit des caisses simultanées, avec et sans file d'écriture
+    python perf_checks.py ledger-replay   # rejeu et vérification d'un an de journal des mouvements
+    python perf_checks.py overstay-checkin  # pas de check-in sur une chambre dont l'occupant est resté au-delà
+    python perf_checks.py profile-routes  # un profil se télécharge au format replié sous /admin/profils/<nom>.txt
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+import archive_manager
+import data_manager
+import db_setup
+import ledger_manager
+import maintenance_manager
+import metrics_manager
+import pagination
+import user_manager
+
+# Tables volumineuses : un SCAN complet sur l'une d'elles fait échouer le contrôle
+LARGE_TABLES = {'lignes_commande', 'commandes_ventes', 'sejours', 'reservations'}
+
+# Requêtes (forme normalisée) pour lesquelles un parcours complet est volontaire
+ALLOWED_FULL_SCANS = set()
+
+# Fonctions publiques exercées indirectement ou sans requête propre (connexion, hachage, helpers...)
+NON_QUERY_FUNCTIONS = {'get_db_connection', 'connect_db', 'hash_password',
+                       'get_archive_limit', 'attach_archive', 'get_reporting_connection',
+                       'build_guest_match', 'find_booking_conflict', 'unit_of_work',
+                       'start_write_queue', 'stop_write_queue', 'run_write', 'queued_write',
+                       'list_database_files', 'record_movement'}
+
+# --- JEU DE DONNÉES RÉALISTE ---
+def build_sample_database(path, stays=20000, reservations=20000, orders=100000, seed=42):
+    """Crée une base complète (schéma + index de db_setup) remplie avec plusieurs années d'activité."""
+    rng = random.Random(seed)
+    previous_name = db_setup.DATABASE_NAME
+    db_setup.DATABASE_NAME = path
+    try:
+        db_setup.create_database()
+    finally:
+        db_setup.DATABASE_NAME = previous_name
+
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+
+    cursor.executemany(
+        "INSERT OR IGNORE INTO chambres (numero, type_chambre, prix_nuit) VALUES (?, ?, ?)",
+        [(str(1000 + i), rng.choice(['Confort', 'Élégance', 'Premium', 'Deluxes', 'Suites']),
+          rng.choice([20000, 30000, 40000, 50000, 70000])) for i in range(176)]
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO utilisateurs (nom_utilisateur, mot_de_passe_hash, role) VALUES (?, ?, ?)",
+        [(f"caissier{i}", user_manager.hash_password('test'), 'Caissier') for i in range(20)]
+    )
+    room_ids = [row[0] for row in cursor.execute("SELECT id FROM chambres")]
+    product_ids = [row[0] for row in cursor.execute("SELECT id FROM produits_services")]
+    user_ids = [row[0] for row in cursor.execute("SELECT id FROM utilisateurs")]
+
+    origin = datetime.now() - timedelta(days=3 * 365)
+    fmt = '%Y-%m-%d %H:%M:%S'
+
+    stay_rows = []
+    for _ in range(stays):
+        checkin = origin + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+        checkout = checkin + timedelta(days=rng.randint(1, 14))
+        closed = checkout < datetime.now()
+        stay_rows.append((rng.choice(room_ids), f"Client {rng.randrange(100000)}", checkin.strftime(fmt),
+                          checkout.strftime('%Y-%m-%d'), checkout.strftime(fmt) if closed else None,
+                          rng.randrange(0, 500000), 'Clos' if closed else 'Ouvert'))
+    cursor.executemany("""
+        INSERT INTO sejours (chambre_id, client_nom, date_checkin, date_checkout_prevue,
+                             date_checkout_reelle, solde_actuel, statut)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, stay_rows)
+
+    reservation_rows = []
+    for _ in range(reservations):
+        start = origin + timedelta(days=rng.randrange(3 * 365 + 180))
+        reservation_rows.append((rng.choice(room_ids), f"Client {rng.randrange(100000)}",
+                                 start.strftime('%Y-%m-%d'),
+                                 (start + timedelta(days=rng.randint(1, 10))).strftime('%Y-%m-%d'),
+                                 rng.choice(['Confirmée', 'Confirmée', 'Annulée'])))
+    cursor.executemany("""
+        INSERT INTO reservations (chambre_id, client_nom, date_debut, date_fin, statut)
+        VALUES (?, ?, ?, ?, ?)
+    """, reservation_rows)
+
+    max_stay_id = cursor.execute("SELECT MAX(id) FROM sejours").fetchone()[0]
+    order_rows, line_rows, payment_rows = [], [], []
+    for order_id in range(1, orders + 1):
+        moment = (origin + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))).strftime(fmt)
+        transferred = rng.random() < 0.3
+        lines = [(order_id, rng.choice(product_ids), rng.randint(1, 4), rng.choice([1000, 1500, 5000, 7000]))
+                 for _ in range(rng.randint(1, 5))]
+        total = sum(qty * price for _, _, qty, price in lines)
+        order_rows.append((order_id, rng.choice(user_ids), rng.randint(1, max_stay_id) if transferred else None,
+                           total, 'Transféré' if transferred else 'Payé', moment))
+        line_rows.extend(lines)
+        payment_rows.append((order_id, total, 'Transfert Compte' if transferred else rng.choice(['Espèces', 'Carte', 'Mobile']), moment))
+    cursor.executemany("""
+        INSERT INTO commandes_ventes (id, utilisateur_id, stay_id, total_net, statut_paiement, date_heure)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, order_rows)
+    cursor.executemany("""
+        INSERT INTO lignes_commande (commande_id, produit_id, quantite, prix_unitaire_vente)
+        VALUES (?, ?, ?, ?)
+    """, line_rows)
+    cursor.executemany("""
+        INSERT INTO paiements (commande_id, montant, mode_paiement, date_heure) VALUES (?, ?, ?, ?)
+    """, payment_rows)
+    conn.commit()
+    conn.close()
+
+# --- SCÉNARIOS : UN APPEL PAR FONCTION PUBLIQUE ---
+def _scenarios():
+    """Retourne la liste (module, fonction, arguments) qui exerce chaque requête SQL des modules."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    month_start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    next_month = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
+    cart = [{'id': 1, 'nom': 'Poulet DG', 'prix': 5000, 'qte': 2}]
+    return [
+        (data_manager, 'get_all_rooms', ()),
+        (data_manager, 'get_rooms_page', ()),
+        (data_manager, 'get_rooms_page', ('WyIxMDUwIl0', 50, 'Suites')),
+        (data_manager, 'iter_rooms_page', ()),
+        (data_manager, 'get_room_types', ()),
+        (data_manager, 'get_room', (1,)),
+        (data_manager, 'add_room_type', ('9001', 'Confort', 20000)),
+        (data_manager, 'update_room', (1, '101', 'Élégance', 30000)),
+        (data_manager, 'delete_room', (2,)),
+        (data_manager, 'set_rate', ('Suites', today, next_month, 90000, None, 'Haute saison')),
+        (data_manager, 'set_rate', ('Suites', today, next_month, 110000, data_manager.WEEKEND_NIGHTS)),
+        (data_manager, 'get_upcoming_rates', ()),
+        (data_manager, 'quote_stays', ([('Suites', today, next_month), ('Confort', today, tomorrow)],)),
+        (data_manager, 'get_stay_room_cost', ('Suites', 80000, today, 7)),
+        (data_manager, 'clear_rates', ('Suites', today, tomorrow)),
+        (data_manager, 'get_all_products', ()),
+        (data_manager, 'get_products_page', ()),
+        (data_manager, 'get_products_page', (None, 50, 'Bar')),
+        (data_manager, 'iter_products_page', ()),
+        (data_manager, 'get_product_categories', ()),
+        (data_manager, 'get_product', (1,)),
+        (data_manager, 'add_product', ('Café', 500, 'Consommation', 'Bar')),
+        (data_manager, 'update_product', (1, 'Poulet DG', 5000, 'Consommation', 'Restauration')),
+        (data_manager, 'delete_product', (9999,)),
+        (data_manager, 'get_active_stays', ()),
+        (data_manager, 'get_available_rooms_for_period', (today, tomorrow)),
+        (data_manager, 'iter_available_rooms_for_period', (today, tomorrow)),
+        (data_manager, 'create_new_stay', (3, 'Client Contrôle', tomorrow)),
+        (data_manager, 'create_reservation', (4, 'Client Contrôle', today, tomorrow)),
+        (data_manager, 'cancel_reservation', (1,)),
+        (data_manager, 'plan_group_booking', ({'Suites': 3, 'Confort': 50}, today, tomorrow)),
+        (data_manager, 'create_group_booking', ({'Premium': 2}, 'Groupe Contrôle', today, tomorrow)),
+        (data_manager, 'get_all_reservations', ()),
+        (data_manager, 'get_reservations_page', ()),
+        (data_manager, 'get_reservations_page', (None, 50, 'Suites', today, None, 'chambre')),
+        (data_manager, 'iter_reservations_page', ()),
+        (data_manager, 'update_room_status', (4, 'Libre')),
+        (data_manager, 'search_guests', ('Client 12',)),
+        (data_manager, 'get_stay_details', (1,)),
+        (data_manager, 'get_stay_ordered_items', (1,)),
+        (data_manager, 'get_stay_folio_summary', (1, 'produit')),
+        (data_manager, 'get_stay_folio_summary', (1, 'jour')),
+        (data_manager, 'get_stay_folio_page', (1,)),
+        (data_manager, 'get_stay_folio_page', (1, 'WyIyMDI1LTAxLTAxIDAwOjAwOjAwIiwxMF0', 50)),
+        (data_manager, 'create_pos_order', (1, cart, 'Transfert Compte', 1)),
+        (data_manager, 'create_pos_order', (1, cart, 'Espèces')),
+        (data_manager, 'get_open_shift_id', (1,)),
+        (data_manager, 'get_shift_report', (1,)),
+        (data_manager, 'close_shift', (1, 50000)),
+        (data_manager, 'open_shift', (1, 10000)),
+        (data_manager, 'get_recent_shifts', ()),
+        (data_manager, 'perform_checkout', (1, 100000)),
+        (data_manager, 'get_order_details', (1,)),
+        (data_manager, 'get_sales_report', (month_start, today)),
+        (data_manager, 'get_occupancy_report', (month_start, tomorrow)),
+        (data_manager, 'get_revenue_series', (month_start, today, 'jour', 'mode')),
+        (data_manager, 'get_revenue_series', (month_start, today, 'semaine', 'categorie')),
+        (data_manager, 'get_dashboard_stats', ()),
+        (user_manager, 'add_user', ('controle', 'secret', 'Caissier')),
+        (user_manager, 'authenticate_user', ('controle', 'secret')),
+        (user_manager, 'check_for_admin_and_setup', ()),
+        (user_manager, 'get_all_users', ()),
+        (user_manager, 'get_users_page', (None, 50, 'Caissier')),
+        (user_manager, 'update_admin_password', ('admin123',)),
+        (user_manager, 'delete_user', (9999,)),
+    ]
+
+# --- ANALYSE DES PLANS ---
+_re_table_alias = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I)
+_re_full_scan = re.compile(r"^SCAN (?:\w+\.)?(\w+)$")
+_SQL_KEYWORDS = {'where', 'on', 'join', 'left', 'inner', 'cross', 'group', 'order', 'limit',
+                 'set', 'values', 'select', 'union', 'natural', 'using'}
+
+def _alias_map(sql):
+    aliases = {}
+    for table, alias in _re_table_alias.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+def explain(conn, sql, params):
+    """Retourne les lignes 'detail' de EXPLAIN QUERY PLAN pour une requête."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def find_full_scans(sql, plan):
+    """Retourne les grosses tables parcourues intégralement (SCAN sans index) dans un plan."""
+    aliases = _alias_map(sql)
+    scanned = []
+    for detail in plan:
+        match = _re_full_scan.match(detail.strip())
+        if match:
+            table = aliases.get(match.group(1).lower(), match.group(1).lower())
+            if table in LARGE_TABLES:
+                scanned.append(table)
+    return scanned
+
+def check_query_plans(path, verbose=False):
+    """Exécute tous les scénarios sur `path` et retourne la liste des régressions détectées."""
+    captured = {}
+
+    def capture(sql, params):
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if keyword in ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT'):
+            captured.setdefault(metrics_manager.normalize_sql(sql), (sql, params))
+
+    modules = (data_manager, user_manager)
+    previous_names = [module.DATABASE_NAME for module in modules]
+    for module in modules:
+        module.DATABASE_NAME = path
+    metrics_manager.add_query_listener(capture)
+    called = set()
+    try:
+        for module, name, args in _scenarios():
+            result = getattr(module, name)(*args)
+            if isinstance(result, (types.GeneratorType, pagination.PageStream)):
+                for _ in result:  # Itérateurs lus à la demande : la requête s'exécute au parcours
+                    pass
+            called.add((module.__name__, name))
+    finally:
+        metrics_manager.remove_query_listener(capture)
+        for module, previous in zip(modules, previous_names):
+            module.DATABASE_NAME = previous
+
+    for module in modules:
+        for name, value in vars(module).items():
+            if (callable(value) and not name.startswith('_') and getattr(value, '__module__', None) == module.__name__
+                    and not isinstance(value, type) and name not in NON_QUERY_FUNCTIONS
+                    and (module.__name__, name) not in called):
+                print(f"Avertissement : {module.__name__}.{name}() n'est couvert par aucun scénario.")
+
+    failures = []
+    conn = sqlite3.connect(path)
+    try:
+        for normalized, (sql, params) in sorted(captured.items()):
+            plan = explain(conn, sql, params)
+            scans = find_full_scans(sql, plan)
+            if verbose:
+                print(f"\n{normalized}\n  " + "\n  ".join(plan))
+            if scans and normalized not in ALLOWED_FULL_SCANS:
+                failures.append((normalized, scans, plan))
+    finally:
+        conn.close()
+    return failures
+
+def run_plans(args):
+    workdir = tempfile.mkdtemp(prefix='hotelpos_plans_')
+    path = os.path.join(workdir, 'plans.db')
+    try:
+        build_sample_database(path, stays=args.stays, reservations=args.stays, orders=args.orders)
+        if args.analyze:
+            # Plans tels qu'après la maintenance nocturne (statistiques sqlite_stat1 à jour)
+            maintenance_manager.run_maintenance(['statistiques'], databases=[path])
+        failures = check_query_plans(path, verbose=args.verbose)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\nÉCHEC : {len(failures)} requête(s) parcourent intégralement une grosse table.")
+        for normalized, scans, plan in failures:
+            print(f"\n- Table(s) : {', '.join(scans)}\n  {normalized}\n  Plan : " + " | ".join(plan))
+        return 1
+    print("\nOK : toutes les requêtes sur les grosses tables utilisent un index.")
+    return 0
+
+# --- RÉSERVATIONS CONCURRENTES ---
+def run_booking_stress(args):
+    """
+    Lance `threads` postes qui tentent tous de réserver la même chambre aux mêmes dates,
+    chacun réservant aussi sa propre chambre : une seule réservation disputée doit réussir,
+    et toutes les réservations indépendantes doivent aboutir.
+
+    SQLite n'a qu'un écrivain à la fois : le verrou d'écriture de _run_booking couvre toute la
+    base, pas une chambre. La section verrouillée se limite à la vérification des chevauchements
+    et à l'insertion ; on vérifie donc que l'attente d'une réservation indépendante (95e centile)
+    reste sous `max_wait_ms`.
+    """
+    workdir = tempfile.mkdtemp(prefix='hotelpos_stress_')
+    path = os.path.join(workdir, 'stress.db')
+    previous_name = data_manager.DATABASE_NAME
+    try:
+        build_sample_database(path, stays=0, reservations=0, orders=0)
+        data_manager.DATABASE_NAME = path
+        conn = sqlite3.connect(path)
+        room_ids = [row[0] for row in conn.execute("SELECT id FROM chambres ORDER BY id")]
+        conn.close()
+        contested_room, own_rooms = room_ids[0], room_ids[1:args.threads + 1]
+
+        start = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
+        end = (datetime.now() + timedelta(days=32)).strftime('%Y-%m-%d')
+        results = {'contested': [], 'own': [], 'own_waits': []}
+        lock = threading.Lock()
+        barrier = threading.Barrier(args.threads)
+
+        def worker(index):
+            barrier.wait()
+            for attempt in range(args.attempts):
+                contested = data_manager.create_reservation(contested_room, f"Poste {index}", start, end)
+                own_started = time.perf_counter()
+                own = data_manager.create_reservation(own_rooms[index], f"Poste {index}",
+                                                      (datetime.now() + timedelta(days=40 + 3 * attempt)).strftime('%Y-%m-%d'),
+                                                      (datetime.now() + timedelta(days=41 + 3 * attempt)).strftime('%Y-%m-%d'))
+                own_wait = time.perf_counter() - own_started
+                with lock:
+                    results['contested'].append(contested)
+                    results['own'].append(own)
+                    results['own_waits'].append(own_wait)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        conn = sqlite3.connect(path)
+        booked = conn.execute("""
+            SELECT COUNT(*) FROM reservations
+            WHERE chambre_id = ? AND statut = 'Confirmée' AND date_debut < ? AND date_fin > ?
+        """, (contested_room, end, start)).fetchone()[0]
+        conn.close()
+    finally:
+        data_manager.DATABASE_NAME = previous_name
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total = len(results['contested']) + len(results['own'])
+    print(f"{total} opérations en {elapsed:.2f} s ({total / elapsed:.0f} op/s), {args.threads} postes.")
+    print(f"Chambre disputée : {results['contested'].count(data_manager.BOOKING_OK)} réussie(s), "
+          f"{results['contested'].count(data_manager.BOOKING_CONFLICT)} conflit(s), {booked} réservation(s) en base.")
+    print(f"Chambres indépendantes : {results['own'].count(data_manager.BOOKING_OK)} / {len(results['own'])} réussies.")
+    waits = sorted(results['own_waits'])
+    p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000
+    print(f"Attente d'une réservation indépendante : médiane {waits[len(waits) // 2] * 1000:.1f} ms, "
+          f"95e centile {p95:.1f} ms, max {waits[-1] * 1000:.1f} ms.")
+
+    errors = [r for r in results['contested'] + results['own'] if r == data_manager.BOOKING_ERROR]
+    if booked != 1 or errors or results['own'].count(data_manager.BOOKING_OK) != len(results['own']):
+        print("ÉCHEC : double réservation, erreur ou réservation indépendante refusée.")
+        return 1
+    if p95 > args.max_wait_ms:
+        print(f"ÉCHEC : les réservations indépendantes attendent plus de {args.max_wait_ms} ms (95e centile).")
+        return 1
+    print("OK : aucune double réservation.")
+    return 0
+
+def run_overstay_checkin(args):
+    """
+    Un client reste au-delà de son départ prévu (séjour ouvert, départ prévu hier) : un
+    check-in ou une réservation qui commence aujourd'hui sur sa chambre doit être refusé,
+    une réservation qui commence plus tard reste possible.
+    """
+    workdir = tempfile.mkdtemp(prefix='hotelpos_overstay_')
+    path = os.path.join(workdir, 'overstay.db')
+    previous_name = data_manager.DATABASE_NAME
+    today = datetime.now()
+    yesterday, tomorrow = [(today + timedelta(days=d)).strftime('%Y-%m-%d') for d in (-1, 1)]
+    later = [(today + timedelta(days=d)).strftime('%Y-%m-%d') for d in (10, 12)]
+    try:
+        build_sample_database(path, stays=0, reservations=0, orders=0)
+        data_manager.DATABASE_NAME = path
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM reservations")  # Réservation de démonstration de db_setup
+        room_id = conn.execute("SELECT MIN(id) FROM chambres").fetchone()[0]
+        conn.execute("""
+            INSERT INTO sejours (chambre_id, client_nom, date_checkin, date_checkout_prevue, statut)
+            VALUES (?, 'Client Prolongé', ?, ?, 'Ouvert')
+        """, (room_id, (today - timedelta(days=3)).strftime('%Y-%m-%d 14:00:00'), yesterday))
+        conn.execute("UPDATE chambres SET statut = 'Occupée' WHERE id = ?", (room_id,))
+        conn.commit()
+        conn.close()
+
+        results = {
+            'check-in': data_manager.create_new_stay(room_id, 'Second Client', tomorrow),
+            'réservation du jour': data_manager.create_reservation(room_id, 'Second Client',
+                                                                   today.strftime('%Y-%m-%d'), tomorrow),
+            'réservation ultérieure': data_manager.create_reservation(room_id, 'Client Futur', *later),
+        }
+        conn = sqlite3.connect(path)
+        open_stays = conn.execute("SELECT COUNT(*) FROM sejours WHERE chambre_id = ? AND date_checkout_reelle IS NULL",
+                                  (room_id,)).fetchone()[0]
+        conn.close()
+    finally:
+        data_manager.DATABASE_NAME = previous_name
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for label, result in results.items():
+        print(f"{label} : {result}")
+    expected = {'check-in': data_manager.BOOKING_CONFLICT, 'réservation du jour': data_manager.BOOKING_CONFLICT,
+                'réservation ultérieure': data_manager.BOOKING_OK}
+    if results != expected or open_stays != 1:
+        print(f"ÉCHEC : {open_stays} séjour(s) ouvert(s) sur la chambre, résultats inattendus.")
+        return 1
+    print("OK : la chambre d'un client resté au-delà de son départ prévu n'est pas réattribuée.")
+    return 0
+
+# --- PROFILAGE ---
+def run_profile_routes(args):
+    """
+    Profile une page en administrateur puis suit X-Profile-Url : `<nom>.txt` doit atteindre le
+    téléchargement des piles repliées (text/plain), pas la page du profil avec nom='<nom>.txt'.
+    """
+    workdir = tempfile.mkdtemp(prefix='hotelpos_profils_')
+    path = os.path.join(workdir, 'profils.db')
+    previous_cwd = os.getcwd()
+    previous_names = (data_manager.DATABASE_NAME, user_manager.DATABASE_NAME)
+    try:
+        build_sample_database(path, stays=0, reservations=0, orders=0)
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT OR IGNORE INTO utilisateurs (nom_utilisateur, mot_de_passe_hash, role) VALUES (?, ?, 'Admin')",
+                     ('profileur', user_manager.hash_password('profileur')))
+        conn.commit()
+        conn.close()
+        data_manager.DATABASE_NAME = user_manager.DATABASE_NAME = path
+        os.chdir(workdir)  # Profils (PROFILE_DIR) et clé secrète écrits dans le répertoire temporaire
+        try:
+            import app as hotel_app
+        except (ImportError, OSError) as e:  # WeasyPrint sans ses bibliothèques système
+            print(f"ÉCHEC : import de l'application impossible ({e}).")
+            return 1
+
+        client = hotel_app.app.test_client()
+        client.post('/', data={'username': 'profileur', 'password': 'profileur'})
+        page = client.get('/admin?_profile=1')
+        page.get_data()
+        page.close()  # Page en flux : le profil est enregistré à la fermeture de la réponse
+        profile_url = page.headers.get('X-Profile-Url')
+        if page.status_code != 200 or not profile_url:
+            print(f"ÉCHEC : /admin?_profile=1 a répondu {page.status_code} sans X-Profile-Url.")
+            return 1
+        endpoint, _ = hotel_app.app.url_map.bind('localhost').match(profile_url + '.txt')
+        download = client.get(profile_url + '.txt')
+        body = download.get_data(as_text=True)
+    finally:
+        os.chdir(previous_cwd)
+        data_manager.DATABASE_NAME, user_manager.DATABASE_NAME = previous_names
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    lines = body.splitlines()
+    print(f"{profile_url}.txt -> {endpoint}, {download.status_code} {download.content_type}, {len(lines)} pile(s).")
+    if (endpoint != 'admin_profile_download' or download.status_code != 200
+            or not download.content_type.startswith('text/plain')
+            or not lines or not all(re.match(r"^\S.* \d+$", line) for line in lines)):
+        print("ÉCHEC : le téléchargement des piles repliées n'est pas servi par admin_profile_download.")
+        return 1
+    print("OK : les piles repliées d'un profil se téléchargent sous /admin/profils/<nom>.txt.")
+    return 0
+
+# --- DÉBIT D'ÉCRITURE DES CAISSES ---
+def _run_tills(tills, orders):
+    """Lance `tills` caisses qui enregistrent chacune `orders` ventes. Retourne (durée, échecs)."""
+    cart = [{'id': 1, 'nom': 'Poulet DG', 'prix': 5000, 'qte': 1}]
+    failures = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(tills)
+
+    def till():
+        barrier.wait()
+        for _ in range(orders):
+            if not data_manager.create_pos_order(1, cart, 'Espèces'):
+                with lock:
+                    failures.append(1)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=till) for _ in range(tills)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, len(failures)
+
+def run_write_throughput(args):
+    """Compare le débit de ventes simultanées : transactions individuelles puis file d'écriture."""
+    workdir = tempfile.mkdtemp(prefix='hotelpos_writes_')
+    path = os.path.join(workdir, 'writes.db')
+    previous_name = data_manager.DATABASE_NAME
+    total = args.tills * args.orders
+    failed = 0
+    try:
+        build_sample_database(path, stays=0, reservations=0, orders=0)
+        data_manager.DATABASE_NAME = path
+        for label, queued in (("Transactions individuelles", False), ("File d'écriture", True)):
+            if queued:
+                data_manager.start_write_queue()
+            try:
+                elapsed, failures = _run_tills(args.tills, args.orders)
+            finally:
+                data_manager.stop_write_queue()
+            failed += failures
+            print(f"{label} : {total} ventes en {elapsed:.2f} s ({total / elapsed:.0f} ventes/s), "
+                  f"{failures} échec(s), {args.tills} caisses.")
+    finally:
+        data_manager.DATABASE_NAME = previous_name
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failed:
+        print("ÉCHEC : des ventes n'ont pas été enregistrées.")
+        return 1
+    print("OK : toutes les ventes ont été enregistrées.")
+    return 0
+
+# --- REJEU DU JOURNAL DES MOUVEMENTS ---
+def build_sample_ledger(path, stays, orders, seed=42):
+    """
+    Ajoute à la base `stays` séjours d'un an et `orders` transferts, écrits comme le ferait
+    l'application : tables mises à jour et mouvements correspondants dans le journal.
+    Retourne le nombre de mouvements écrits.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    rooms = {row[0]: row[1] for row in conn.execute("SELECT id, prix_nuit FROM chambres")}
+    origin = datetime.now() - timedelta(days=365)
+    fmt = '%Y-%m-%d %H:%M:%S'
+    first_stay = (conn.execute("SELECT MAX(id) FROM sejours").fetchone()[0] or 0) + 1
+
+    stays_rows, movements, statuses = [], [], {}
+    transfers_per_stay = max(orders // max(stays, 1), 1)
+    for offset in range(stays):
+        stay_id = first_stay + offset
+        room_id = rng.choice(list(rooms))
+        checkin = origin + timedelta(minutes=offset * 365 * 24 * 60 // max(stays, 1))
+        closed = offset < stays - len(rooms) // 2  # Les derniers séjours sont encore ouverts
+        moment = checkin.strftime(fmt)
+        movements.append((moment, 'statut_chambre', None, room_id, None, None, 'Occupée'))
+        balance = 0.0
+        for _ in range(rng.randint(0, 2 * transfers_per_stay)):
+            amount = rng.choice([1000, 1500, 2500.5, 5000, 7000])
+            balance += amount
+            movements.append((moment, 'transfert', stay_id, None, None, amount, 'Transfert Compte'))
+        if closed:
+            balance += rooms[room_id] * rng.randint(1, 7)
+            movements.append((moment, 'reglement', stay_id, room_id, None, balance, None))
+            movements.append((moment, 'statut_chambre', None, room_id, None, None, 'Libre'))
+        statuses[room_id] = 'Libre' if closed else 'Occupée'
+        stays_rows.append((stay_id, room_id, f"Client {offset}", moment, (checkin + timedelta(days=7)).strftime('%Y-%m-%d'),
+                           moment if closed else None, balance, 'Clos' if closed else 'Ouvert'))
+
+    conn.executemany("""
+        INSERT INTO sejours (id, chambre_id, client_nom, date_checkin, date_checkout_prevue,
+                             date_checkout_reelle, solde_actuel, statut)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, stays_rows)
+    conn.executemany("""
+        INSERT INTO journal_mouvements (date_heure, mouvement, sejour_id, chambre_id, commande_id, montant, valeur)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, movements)
+    conn.executemany("UPDATE chambres SET statut = ? WHERE id = ?", [(statut, room_id) for room_id, statut in statuses.items()])
+    conn.commit()
+    conn.close()
+    return len(movements)
+
+def run_ledger_replay(args):
+    """
+    Rejoue un an de journal et le compare aux tables : aucun écart attendu, puis exactement
+    un écart après modification directe d'un solde, en moins de `max_seconds`.
+    """
+    workdir = tempfile.mkdtemp(prefix='hotelpos_ledger_')
+    path = os.path.join(workdir, 'ledger.db')
+    previous_name = data_manager.DATABASE_NAME
+    try:
+        build_sample_database(path, stays=0, reservations=0, orders=0)
+        written = build_sample_ledger(path, args.stays, args.orders)
+        data_manager.DATABASE_NAME = path
+        clean = ledger_manager.verify()
+
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE sejours SET solde_actuel = solde_actuel + 1 WHERE id = (SELECT MAX(id) FROM sejours)")
+        conn.commit()
+        try:
+            conn.execute("DELETE FROM journal_mouvements WHERE id = 1")
+            append_only = False
+        except sqlite3.DatabaseError:
+            append_only = True
+        conn.close()
+        tampered = ledger_manager.verify()
+    finally:
+        data_manager.DATABASE_NAME = previous_name
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if clean is None or tampered is None:
+        print("ÉCHEC : erreur pendant le rejeu.")
+        return 1
+    print(f"{clean['mouvements']} / {written} mouvement(s) rejoué(s) et vérifié(s) en {clean['duree']:.2f} s "
+          f"({clean['sejours']} séjours, {clean['chambres']} chambres).")
+    if clean['ecarts'] or len(tampered['ecarts']) != 1 or not append_only:
+        print(f"ÉCHEC : {len(clean['ecarts'])} écart(s) sur le journal intact, {len(tampered['ecarts'])} "
+              f"après modification (1 attendu), journal {'en ajout seul' if append_only else 'modifiable'}.")
+        return 1
+    if clean['duree'] > args.max_seconds:
+        print(f"ÉCHEC : rejeu plus long que {args.max_seconds} s.")
+        return 1
+    print("OK : état reconstruit à l'identique, modification détectée, journal en ajout seul.")
+    return 0
+
+# --- ARCHIVAGE ET RECHERCHE DE CLIENTS ---
+def run_archive_search(args):
+    """
+    Archive trois ans d'historique puis recherche un client dont le séjour est parti en
+    archive : il doit rester trouvé, avec ses consommations, sans doublon dans l'index.
+    """
+    workdir = tempfile.mkdtemp(prefix='hotelpos_archive_')
+    path = os.path.join(workdir, 'archive_check.db')
+    previous_names = (data_manager.DATABASE_NAME, data_manager.ARCHIVE_DATABASE_NAME)
+    try:
+        build_sample_database(path, stays=args.stays, reservations=args.stays, orders=args.orders)
+        conn = sqlite3.connect(path)
+        witness = conn.execute("""
+            SELECT id FROM sejours WHERE statut = 'Clos' AND date_checkout_reelle < ? ORDER BY id LIMIT 1
+        """, ((datetime.now() - timedelta(days=2 * 365)).strftime('%Y-%m-%d'),)).fetchone()[0]
+        conn.execute("UPDATE sejours SET client_nom = 'Témoin Archivé' WHERE id = ?", (witness,))
+        conn.commit()
+        conn.close()
+
+        data_manager.DATABASE_NAME = path
+        data_manager.ARCHIVE_DATABASE_NAME = os.path.join(workdir, 'archive_check_archive.db')
+        moved = archive_manager.archive_closed_stays(365)
+        found = data_manager.search_guests('temoin arch')
+
+        conn = sqlite3.connect(path)
+        indexed = conn.execute("SELECT COUNT(*) FROM recherche_clients WHERE rowid = ?", (witness * 2,)).fetchone()[0]
+        in_main = conn.execute("SELECT COUNT(*) FROM sejours WHERE id = ?", (witness,)).fetchone()[0]
+        conn.close()
+    finally:
+        data_manager.DATABASE_NAME, data_manager.ARCHIVE_DATABASE_NAME = previous_names
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if moved is None:
+        print("ÉCHEC : erreur pendant l'archivage.")
+        return 1
+    print(f"{moved.get('sejours', 0)} séjour(s) et {moved.get('commandes_ventes', 0)} commande(s) archivés.")
+    if in_main or indexed != 1 or [stay['id'] for stay in found['sejours']] != [witness]:
+        print(f"ÉCHEC : séjour archivé N°{witness} {'encore en base principale, ' if in_main else ''}"
+              f"indexé {indexed} fois, trouvé : {[stay['id'] for stay in found['sejours']]}.")
+        return 1
+    print(f"OK : le client du séjour archivé N°{witness} est trouvé ({len(found['commandes'])} consommation(s)).")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Contrôles de performance HotelPOS.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plans = commands.add_parser('plans', help="Vérifie les plans de requête (EXPLAIN QUERY PLAN).")
+    plans.add_argument('--stays', type=int, default=20000, help="Nombre de séjours et de réservations générés.")
+    plans.add_argument('--orders', type=int, default=100000, help="Nombre de commandes POS générées.")
+    plans.add_argument('--verbose', action='store_true', help="Affiche le plan de chaque requête.")
+    plans.add_argument('--analyze', action='store_true', help="Calcule les statistiques (ANALYZE) avant la vérification.")
+    plans.set_defaults(func=run_plans)
+
+    stress = commands.add_parser('booking-stress', help="Réservations concurrentes sur une même chambre.")
+    stress.add_argument('--threads', type=int, default=16, help="Nombre de postes simultanés.")
+    stress.add_argument('--attempts', type=int, default=20, help="Tentatives par poste.")
+    stress.add_argument('--max-wait-ms', type=float, default=100,
+                        help="Attente maximale (95e centile) d'une réservation sur une chambre non disputée.")
+    stress.set_defaults(func=run_booking_stress)
+
+    overstay = commands.add_parser('overstay-checkin', help="Check-in sur une chambre dont l'occupant est resté au-delà.")
+    overstay.set_defaults(func=run_overstay_checkin)
+
+    profiles = commands.add_parser('profile-routes', help="Téléchargement d'un profil au format replié.")
+    profiles.set_defaults(func=run_profile_routes)
+
+    writes = commands.add_parser('write-throughput', help="Débit des caisses simultanées.")
+    writes.add_argument('--tills', type=int, default=16, help="Nombre de caisses simultanées.")
+    writes.add_argument('--orders', type=int, default=50, help="Ventes par caisse.")
+    writes.set_defaults(func=run_write_throughput)
+
+    ledger = commands.add_parser('ledger-replay', help="Rejeu d'un an de journal des mouvements.")
+    ledger.add_argument('--stays', type=int, default=20000, help="Nombre de séjours sur l'année.")
+    ledger.add_argument('--orders', type=int, default=300000, help="Nombre de transferts sur compte.")
+    ledger.add_argument('--max-seconds', type=float, default=10.0, help="Durée maximale du rejeu.")
+    ledger.set_defaults(func=run_ledger_replay)
+
+    archive = commands.add_parser('archive-search', help="Recherche d'un client dont le séjour est archivé.")
+    archive.add_argument('--stays', type=int, default=5000, help="Nombre de séjours et de réservations générés.")
+    archive.add_argument('--orders', type=int, default=20000, help="Nombre de commandes POS générées.")
+    archive.set_defaults(func=run_archive_search)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# profiler.py
+"""
+Profilage à la demande d'une requête, réservé aux administrateurs :
+
+    /pos?_profile=1          ou l'en-tête   X-Profile: 1
+
+    profiler.init_app(app)
+
+La pile du thread qui traite la requête est échantillonnée par un thread dédié ; chaque
+échantillon est pondéré par le temps réellement écoulé. Pendant qu'elle attend la file
+d'écriture, la pile du thread rédacteur lui est rattachée. Le profil (piles agrégées et temps
+par catégorie : Flask, Jinja, SQL, WeasyPrint...) est enregistré dans PROFILE_DIR et consultable
+en flame graph sous /admin/profils ; l'en-tête X-Profile-Url de la réponse y mène.
+Une requête non profilée ne fait qu'un test sur ses paramètres : aucun échantillonnage.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import request, session, url_for
+
+import data_manager
+
+PROFILE_DIR = 'profils'
+PROFILE_RETENTION = 50
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+
+# Intervalle d'échantillonnage (secondes) et profondeur maximale d'une pile. Le thread
+# d'échantillonnage attend le GIL : en pur Python il ne passe qu'à chaque sys.getswitchinterval()
+SAMPLE_INTERVAL = 0.001
+MAX_DEPTH = 200
+
+# Les piles commencent à l'entrée dans Flask : le serveur WSGI et le thread sont ignorés
+STACK_ROOT = 'flask.app:Flask.wsgi_app'
+
+# Une requête bloquée dans la file d'écriture attend le thread rédacteur : sa pile (à partir
+# de WRITER_ROOT) est greffée sous WRITER_WAIT pour que le SQL exécuté pour elle soit compté
+WRITER_WAIT = 'write_queue:WriteQueue.call'
+WRITER_ROOT = 'write_queue:WriteQueue._run'
+
+# Catégorie d'un échantillon : le cadre le plus profond qui correspond l'emporte
+CATEGORIES = (
+    ('SQL', re.compile(r"^(sqlite3\b|metrics_manager:Instrumented\w+\.(execute|executemany|fetch\w*|cursor))")),
+    ('data_manager', re.compile(r"^(data_manager|pagination|write_queue)\b")),
+    ('WeasyPrint', re.compile(r"^(weasyprint|pydyf|tinycss2|cssselect2|fontTools)\b")),
+    ('Jinja', re.compile(r"^(jinja2\b|markupsafe\b|templates/)")),
+    ('Flask', re.compile(r"^(flask|werkzeug)\b")),
+)
+OTHER_CATEGORY = 'Application'
+
+_re_profile_name = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$")
+
+# --- ÉCHANTILLONNAGE ---
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__')
+    if not module or code.co_filename.endswith('.html'):
+        # Code de template compilé par Jinja : identifié par son fichier
+        module = 'templates/' + os.path.basename(code.co_filename)
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def _stack_key(frame, root=STACK_ROOT):
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    if root in labels:
+        labels = labels[labels.index(root):]
+    return ';'.join(labels)
+
+class Sampler:
+    """Échantillonne la pile d'un thread jusqu'à stop() : {pile 'a;b;c': secondes}."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hotelpos-profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            frame = frames.get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                key = _stack_key(frame)
+                if WRITER_WAIT in key:
+                    # Le rédacteur peut traiter le lot d'un autre poste : ce temps reste de l'attente d'écriture
+                    writer = frames.get(data_manager.writer_thread_id())
+                    if writer is not None:
+                        key = key[:key.index(WRITER_WAIT) + len(WRITER_WAIT)] + ';' + _stack_key(writer, WRITER_ROOT)
+                self.stacks[key] = self.stacks.get(key, 0.0) + (now - last)
+                self.samples += 1
+            last = now
+
+def categorize(stack):
+    for label in reversed(stack.split(';')):
+        for category, pattern in CATEGORIES:
+            if pattern.match(label):
+                return category
+    return OTHER_CATEGORY
+
+# --- ENREGISTREMENT ---
+def new_profile_name():
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+def save_profile(sampler, method, path, status, name=None, directory=PROFILE_DIR):
+    """Enregistre le profil d'une requête et supprime les plus anciens. Retourne son nom."""
+    name = name or new_profile_name()
+    categories = {}
+    for stack, seconds in sampler.stacks.items():
+        category = categorize(stack)
+        categories[category] = categories.get(category, 0.0) + seconds
+    profile = {
+        'nom': name,
+        'date_heure': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'methode': method,
+        'chemin': path,
+        'statut': status,
+        'duree': sampler.duration,
+        'echantillons': sampler.samples,
+        'categories': dict(sorted(categories.items(), key=lambda item: -item[1])),
+        'piles': sampler.stacks,
+    }
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(profile, f)
+    for old in list_profiles(directory)[PROFILE_RETENTION:]:
+        os.remove(os.path.join(directory, old['nom'] + '.json'))
+    return name
+
+def list_profiles(directory=PROFILE_DIR):
+    """Profils enregistrés, du plus récent au plus ancien (sans leurs piles)."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if filename.endswith('.json'):
+            profile = load_profile(filename[:-5], directory)
+            if profile:
+                profile.pop('piles')
+                profiles.append(profile)
+    return profiles
+
+def load_profile(name, directory=PROFILE_DIR):
+    if not _re_profile_name.match(name or ''):
+        return None
+    try:
+        with open(os.path.join(directory, name + '.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def collapsed_stacks(profile):
+    """Piles au format 'replié' (flamegraph.pl, speedscope) : 'a;b;c <microsecondes>' par ligne."""
+    return ''.join(f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in sorted(profile['piles'].items()))
+
+def flame_graph(profile, min_width=0.002):
+    """
+    Rectangles du flame graph (racine en haut) : [{profondeur, x, largeur, nom, secondes,
+    categorie}], x et largeur en fraction de la durée échantillonnée. Les cadres plus
+    étroits que `min_width` sont omis.
+    """
+    root = {'children': {}, 'seconds': 0.0}
+    for stack, seconds in profile['piles'].items():
+        node = root
+        node['seconds'] += seconds
+        path = []
+        for label in stack.split(';'):
+            path.append(label)
+            node = node['children'].setdefault(label, {'children': {}, 'seconds': 0.0, 'stack': ';'.join(path)})
+            node['seconds'] += seconds
+    total = root['seconds'] or 1.0
+
+    rects = []
+    def walk(node, depth, x):
+        for label, child in sorted(node['children'].items()):
+            width = child['seconds'] / total
+            if width >= min_width:
+                rects.append({'profondeur': depth, 'x': x, 'largeur': width, 'nom': label,
+                              'secondes': child['seconds'], 'categorie': categorize(child['stack'])})
+                walk(child, depth + 1, x)
+            x += width
+    walk(root, 0, 0.0)
+    return rects
+
+# --- INTÉGRATION FLASK ---
+def _requested():
+    return PROFILE_PARAM in request.args or PROFILE_HEADER in request.headers
+
+def init_app(app):
+    @app.before_request
+    def start_profiler():
+        if not _requested():
+            return
+        user = session.get('user')
+        if not user or user.get('role') != 'Admin':
+            return
+        request.environ['hotelpos.profiler'] = Sampler(threading.get_ident()).start()
+
+    @app.after_request
+    def stop_profiler(response):
+        sampler = request.environ.pop('hotelpos.profiler', None)
+        if sampler is None:
+            return response
+        name = new_profile_name()
+        method, path, status = request.method, request.full_path.rstrip('?'), response.status_code
+
+        def finish():
+            sampler.stop()
+            try:
+                save_profile(sampler, method, path, status, name)
+            except OSError as e:
+                print(f"Erreur lors de l'enregistrement du profil : {e}")
+
+        if response.is_streamed:
+            # Template en flux : le rendu a lieu pendant l'envoi du corps, après after_request
+            response.call_on_close(finish)
+        else:
+            finish()
+        response.headers['X-Profile-Url'] = url_for('admin_profile', nom=name)
+        return response
@@ -0,0 +1,282 @@
+# session_store.py
+"""
+Sessions côté serveur : le cookie ne contient plus qu'un identifiant aléatoire,
+les données vivent dans la table 'sessions' (partagée par tous les processus)
+derrière un cache LRU en mémoire.
+
+    app.session_interface = session_store.ServerSideSessionInterface()
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import data_manager
+
+# Durée de vie d'une session inactive (secondes)
+SESSION_LIFETIME = 12 * 3600
+
+# Cache mémoire : nombre de sessions gardées et durée (secondes) avant relecture en base.
+# Une révocation faite par un autre processus est donc visible au plus tard après ce délai.
+CACHE_SIZE = 1024
+CACHE_TTL = 10
+
+# Prolonge l'expiration en base au plus une fois par intervalle (évite une écriture par requête)
+REFRESH_INTERVAL = 300
+
+SECRET_KEY_FILE = 'secret_key'
+
+def load_secret_key(path=SECRET_KEY_FILE):
+    """
+    Clé de signature stable entre redémarrages et processus : variable d'environnement
+    HOTEL_POS_SECRET_KEY, sinon fichier local créé au premier lancement.
+    """
+    key = os.environ.get('HOTEL_POS_SECRET_KEY')
+    if key:
+        return key
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            f.write(secrets.token_hex(32))
+        os.chmod(path, 0o600)
+    with open(path) as f:
+        return f.read().strip()
+
+# --- STOCKAGE ---
+class SQLiteSessionStore:
+    """
+    Sessions dans la table 'sessions' de la base principale (voir db_setup). Tout stockage
+    offrant les mêmes méthodes (load, save, delete, delete_user, purge_expired) peut le remplacer.
+    """
+
+    def _connect(self):
+        return data_manager.get_db_connection()
+
+    def load(self, sid):
+        """Retourne (données sérialisées, expiration, utilisateur_id) ou None si absente ou expirée."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT donnees, expiration, utilisateur_id FROM sessions WHERE id = ? AND expiration > ?",
+                               (sid, time.time())).fetchone()
+            return (row['donnees'], row['expiration'], row['utilisateur_id']) if row else None
+        finally:
+            conn.close()
+
+    # Écritures par la file d'écriture (unité de travail partagée) ; une erreur n'interrompt pas
+    # la requête : le cache continue de servir la session
+    @data_manager.queued_write(on_error=None)
+    def save(self, sid, user_id, data, expires):
+        try:
+            with data_manager.unit_of_work() as conn:
+                conn.execute("INSERT OR REPLACE INTO sessions (id, utilisateur_id, donnees, expiration) VALUES (?, ?, ?, ?)",
+                             (sid, user_id, data, expires))
+        except sqlite3.Error as e:
+            print(f"Erreur lors de l'enregistrement de la session : {e}")
+
+    @data_manager.queued_write(on_error=None)
+    def delete(self, sid):
+        try:
+            with data_manager.unit_of_work() as conn:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la suppression de la session : {e}")
+
+    @data_manager.queued_write(on_error=0)
+    def delete_user(self, user_id):
+        """Supprime toutes les sessions d'un utilisateur. Retourne le nombre supprimé."""
+        try:
+            with data_manager.unit_of_work() as conn:
+                return conn.execute("DELETE FROM sessions WHERE utilisateur_id = ?", (user_id,)).rowcount
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la révocation des sessions : {e}")
+            return 0
+
+    @data_manager.queued_write(on_error=None)
+    def purge_expired(self):
+        try:
+            with data_manager.unit_of_work() as conn:
+                conn.execute("DELETE FROM sessions WHERE expiration <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la purge des sessions expirées : {e}")
+
+class CachedSessionStore:
+    """Cache LRU (avec durée de validité) devant un autre stockage ; écritures propagées."""
+
+    def __init__(self, backend, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.backend = backend
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # sid -> (données, expiration, utilisateur_id, lu_le)
+        self._lock = threading.Lock()
+
+    def _remember(self, sid, data, expires, user_id):
+        with self._lock:
+            self._entries[sid] = (data, expires, user_id, time.monotonic())
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def load(self, sid):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                data, expires, user_id, read_at = entry
+                if now - read_at < self.ttl and expires > time.time():
+                    self._entries.move_to_end(sid)
+                    return data, expires, user_id
+                del self._entries[sid]
+
+        result = self.backend.load(sid)
+        if result is not None:
+            self._remember(sid, *result)
+        return result
+
+    def save(self, sid, user_id, data, expires):
+        self.backend.save(sid, user_id, data, expires)
+        self._remember(sid, data, expires, user_id)
+
+    def delete(self, sid):
+        self.backend.delete(sid)
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def delete_user(self, user_id):
+        count = self.backend.delete_user(user_id)
+        with self._lock:
+            for sid in [sid for sid, entry in self._entries.items() if entry[2] == user_id]:
+                del self._entries[sid]
+        return count
+
+    def purge_expired(self):
+        self.backend.purge_expired()
+
+_store = CachedSessionStore(SQLiteSessionStore())
+
+def get_store():
+    return _store
+
+def revoke_user_sessions(user_id):
+    """Déconnecte immédiatement un utilisateur sur tous ses postes (ex. : compte supprimé)."""
+    with _roles_lock:
+        _roles.pop(user_id, None)
+    try:
+        return _store.delete_user(user_id)
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la révocation des sessions : {e}")
+        return 0
+
+# --- RÔLES ---
+_roles = OrderedDict()  # utilisateur_id -> (rôle, lu_le) ; rôle None si le compte n'existe plus
+_roles_lock = threading.Lock()
+
+def current_role(user_id, default=None):
+    """
+    Rôle actuel d'un utilisateur dans 'utilisateurs', relu au plus toutes les CACHE_TTL secondes :
+    un changement de rôle s'applique sans reconnexion. None si le compte n'existe plus ;
+    `default` (le rôle de la session) si la base est inaccessible.
+    """
+    now = time.monotonic()
+    with _roles_lock:
+        entry = _roles.get(user_id)
+        if entry is not None and now - entry[1] < CACHE_TTL:
+            _roles.move_to_end(user_id)
+            return entry[0]
+
+    conn = data_manager.get_db_connection()
+    try:
+        row = conn.execute("SELECT role FROM utilisateurs WHERE id = ?", (user_id,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la lecture du rôle : {e}")
+        return default
+    finally:
+        conn.close()
+
+    role = row['role'] if row else None
+    with _roles_lock:
+        _roles[user_id] = (role, now)
+        _roles.move_to_end(user_id)
+        while len(_roles) > CACHE_SIZE:
+            _roles.popitem(last=False)
+    return role
+
+# --- INTÉGRATION FLASK ---
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session Flask dont seules les données modifiées sont réécrites en base."""
+
+    def __init__(self, initial=None, sid=None, expires=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Nouvel identifiant (à la connexion) : un identifiant connu avant login devient inutile."""
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store=None):
+        self.store = store or _store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                result = self.store.load(sid)
+            except sqlite3.Error as e:
+                print(f"Erreur lors de la lecture de la session : {e}")
+                result = None
+            if result is not None:
+                data, expires, _ = result
+                return ServerSideSession(self.serializer.loads(data), sid=sid, expires=expires)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+            session.previous_sid = None
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        refresh = session.expires is None or session.expires - now < SESSION_LIFETIME - REFRESH_INTERVAL
+        if not (session.modified or refresh):
+            return
+
+        expires = now + SESSION_LIFETIME
+        user = session.get('user') or {}
+        self.store.save(session.sid, user.get('id'), self.serializer.dumps(dict(session)), expires)
+        if session.new:
+            self.store.purge_expired()
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
@@ -1,6 +1,9 @@
 # user_manager.py
 import sqlite3
 import hashlib
+import metrics_manager
+import pagination
+import session_store
 
 DATABASE_NAME = 'hotel_pos.db'
 
@@ -10,7 +13,7 @@ def hash_password(password):
 
 def connect_db():
     """Établit la connexion à la base de données."""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = sqlite3.connect(DATABASE_NAME, factory=metrics_manager.InstrumentedConnection)
     # Important: Activer row_factory pour obtenir les résultats comme des dictionnaires
     conn.row_factory = sqlite3.Row 
     return conn
@@ -104,6 +107,35 @@ def get_all_users():
     finally:
         conn.close()
 
+def get_users_page(cursor=None, limit=pagination.PAGE_SIZE, role=None):
+    """Page d'utilisateurs (hors 'admin') triés par rôle puis nom (pagination par clé)."""
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_cursor(cursor, 2)
+    conditions, params = ["nom_utilisateur != 'admin'"], []
+    if role:
+        conditions.append("role = ?")
+        params.append(role)
+    if after:
+        conditions.append("(role, nom_utilisateur) > (?, ?)")
+        params.extend(after)
+
+    conn = connect_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT id, nom_utilisateur, role FROM utilisateurs
+            WHERE {' AND '.join(conditions)}
+            ORDER BY role, nom_utilisateur
+            LIMIT ?
+        """, params + [limit + 1])
+        users = [dict(user) for user in cursor.fetchall()]
+        return pagination.build_page(users, limit, lambda user: [user['role'], user['nom_utilisateur']])
+    except sqlite3.Error as e:
+        print(f"Erreur lors de la récupération des utilisateurs : {e}")
+        return {'items': [], 'next_cursor': None}
+    finally:
+        conn.close()
+
 def delete_user(user_id):
     """Supprime un utilisateur par son ID."""
     # S'assurer qu'on ne supprime pas l'admin principal
@@ -118,7 +150,11 @@ def delete_user(user_id):
             
         cursor.execute("DELETE FROM utilisateurs WHERE id = ?", (user_id,))
         conn.commit()
-        return cursor.rowcount > 0 # Vrai si la suppression a réussi
+        if cursor.rowcount == 0:
+            return False
+        # Déconnecte l'utilisateur supprimé sur tous ses postes
+        session_store.revoke_user_sessions(user_id)
+        return True
     except sqlite3.Error as e:
         print(f"Erreur lors de la suppression de l'utilisateur : {e}")
         return False
@@ -0,0 +1,113 @@
+# write_queue.py
+"""
+File d'écriture à un seul rédacteur : les écritures soumises par tous les threads
+(caisses, réception) sont exécutées par un thread dédié et regroupées en transactions
+communes (group commit), un SAVEPOINT par écriture. Une seule synchronisation disque
+par lot au lieu d'une par écriture, et plus de SQLITE_BUSY entre postes.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics_manager
+
+# Capacité de la file : au-delà, les postes attendent qu'une place se libère
+QUEUE_SIZE = 1000
+# Durée (secondes) pendant laquelle le rédacteur accumule les écritures d'un lot
+BATCH_WINDOW = 0.002
+MAX_BATCH = 64
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_STOP = object()
+
+class WriteQueue:
+    """
+    `transaction` est une fabrique de gestionnaire de contexte transactionnel
+    réentrant (data_manager.unit_of_work) : l'appel externe ouvre le lot,
+    chaque appel imbriqué isole une écriture.
+    """
+
+    def __init__(self, transaction, size=QUEUE_SIZE, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.transaction = transaction
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=size)
+        self._thread = threading.Thread(target=self._run, name='hotelpos-writer', daemon=True)
+        self._thread.start()
+        metrics_manager.register_gauge('hotelpos_write_queue_depth', self._queue.qsize)
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    @property
+    def thread_id(self):
+        """Identifiant du thread rédacteur (sys._current_frames), pour le profileur."""
+        return self._thread.ident
+
+    def submit(self, func, *args, **kwargs):
+        """Met une écriture en file. Retourne un Future (résultat ou exception de `func`)."""
+        future = Future()
+        self._queue.put((future, func, args, kwargs, time.perf_counter()))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Soumet une écriture et attend son résultat, une fois le lot validé."""
+        return self.submit(func, *args, **kwargs).result()
+
+    def stop(self):
+        """Termine les écritures en attente puis arrête le rédacteur."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                self._queue.put(_STOP)  # Traité après ce lot
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            for _, _, _, _, queued_at in batch:
+                metrics_manager.observe('hotelpos_write_queue_wait_seconds', started - queued_at)
+            metrics_manager.observe('hotelpos_write_batch_size', len(batch), buckets=BATCH_BUCKETS)
+
+            outcomes = []
+            try:
+                with self.transaction():
+                    for future, func, args, kwargs, _ in batch:
+                        try:
+                            with self.transaction():
+                                outcomes.append((future, func(*args, **kwargs), None))
+                        except Exception as e:  # Écriture annulée seule (ROLLBACK TO), le lot continue
+                            outcomes.append((future, None, e))
+            except Exception as e:
+                # Échec du COMMIT (ou du BEGIN) : aucune écriture du lot n'est conservée
+                print(f"Erreur lors de la validation d'un lot d'écritures : {e}")
+                for future, _, _, _, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            metrics_manager.observe('hotelpos_write_batch_duration_seconds', time.perf_counter() - started)
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)